@@ -1,4 +1,6 @@
 import json
+import os
+import time
 from pathlib import Path
 from types import SimpleNamespace
 
@@ -21,16 +23,38 @@ from reiz.utilities import logger
 #         "host": str,
 #         "port": int,
 #         "workers": int,
-#         "timeout": int
+#         "timeout": int,
+#         "query_cache_size": int
 #     },
 #     "ir": {
 #        "backend": {"edgeql"}
+#     },
+#     "indexing": {
+#         "profile": str,
+#         "profiles": {
+#             str: {
+#                 "dropped_fields": [str],
+#                 "skip_tests": bool,
+#                 "skip_generated": bool,
+#                 "max_depth": int
+#             }
+#         }
 #     }
 # }
 
 
 CONFIG_LOCATION = Path("~/.local/reiz.json").expanduser()
 
+# The database generation that is being served, and the ones that are
+# retired by bulk loads (scripts/bulk_load.py) alongside with the time
+# they were retired at. It takes precedence over config.database.database.
+#
+# {
+#     "database": str,
+#     "retired": {str: float}
+# }
+STATE_LOCATION = CONFIG_LOCATION.with_name("reiz.state.json")
+
 
 def sync_config(location=CONFIG_LOCATION):
     if not location.exists():
@@ -43,7 +67,58 @@ def sync_config(location=CONFIG_LOCATION):
             stream, object_hook=lambda data: SimpleNamespace(**data)
         )
 
-    return validator.validate(raw_config)
+    config = validator.validate(raw_config)
+    if database := read_state().get("database"):
+        config.database.database = database
+    return config
+
+
+def read_state(location=STATE_LOCATION):
+    if not location.exists():
+        return {}
+
+    with open(location) as stream:
+        return json.load(stream)
+
+
+def write_state(state, location=STATE_LOCATION):
+    temporary_location = location.with_name(location.name + ".tmp")
+    with open(temporary_location, "w") as stream:
+        json.dump(state, stream, indent=4)
+    os.replace(temporary_location, location)
+
+
+def get_state_version(location=STATE_LOCATION):
+    try:
+        return location.stat().st_mtime_ns
+    except FileNotFoundError:
+        return None
+
+
+def read_database_name(location=STATE_LOCATION):
+    return read_state(location).get("database", config.database.database)
+
+
+def switch_database(database, previous_database, location=STATE_LOCATION):
+    """Atomically point the processes that are watching the state file
+    (e.g. the web tier) at the given database, and retire the previous
+    one. The config file itself is never modified."""
+
+    state = read_state(location)
+    retired = state.setdefault("retired", {})
+    retired.pop(database, None)
+    if previous_database != database:
+        retired[previous_database] = time.time()
+
+    state["database"] = database
+    write_state(state, location)
+    config.database.database = database
+
+
+def forget_database(database, location=STATE_LOCATION):
+    state = read_state(location)
+    state.get("retired", {}).pop(database, None)
+    write_state(state, location)
 
 
 @object.__new__
@@ -104,6 +179,7 @@ def proccess_segment(segment):
 @validator.segment("web", requirements=["timeout", "host", "port"])
 def process_segment(segment):
     validator.set_if_not_already(segment, "workers", 1)
+    validator.set_if_not_already(segment, "query_cache_size", 1024)
 
 
 @validator.segment("ir")
@@ -111,4 +187,13 @@ def process_segment(segment):
     validator.set_if_not_already(segment, "backend", "edgeql")
 
 
+@validator.segment("indexing")
+def process_segment(segment):
+    validator.set_if_not_already(segment, "profile", "full")
+    validator.set_if_not_already(segment, "profiles", SimpleNamespace())
+    segment.profiles = {
+        name: vars(options) for name, options in vars(segment.profiles).items()
+    }
+
+
 config = sync_config()
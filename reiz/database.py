@@ -1,16 +1,29 @@
+import subprocess
 from collections import deque
-from contextlib import ExitStack, closing, contextmanager
+from contextlib import ExitStack, closing, contextmanager, suppress
+from pathlib import Path
 
 import edgedb
 import edgedb.blocking_con
 import edgedb.errors
 
 from reiz.config import config
+from reiz.schema.esdl import defer_constraints
+from reiz.utilities import logger
+
+SERVER_MANAGER = [Path("~/.edgedb/bin/edgedb").expanduser(), "server"]
 
 DatabaseConnection = edgedb.blocking_con.BlockingIOConnection
 InternalDatabaseError = edgedb.errors.InternalServerError
 
 
+def is_transient_error(error):
+    # Serialization failures, deadlocks and connection errors
+    return isinstance(error, edgedb.errors.EdgeDBError) and error.has_tag(
+        edgedb.errors.SHOULD_RETRY
+    )
+
+
 def _apply_defaults(kwargs):
     if config.database.options:
         kwargs.update(config.database.options)
@@ -68,3 +81,48 @@ class ConnectionPool:
 
     def __str__(self):
         return f"{self.__class__.__name__}(free_connections={len(self._free_conns)}, total_connections={self._total_conns})"
+
+
+def drop_all_connection(cluster):
+    logger.info("Stopping the server...")
+    subprocess.run(SERVER_MANAGER + ["stop", cluster])
+    logger.info("Re-starting the server...")
+    subprocess.check_call(SERVER_MANAGER + ["start", cluster])
+
+
+def drop_and_load_db(
+    schema, reboot_server=True, database=None, deferred_constraints=False
+):
+    """Re-create the database from the given schema. If the constraints
+    are deferred, they are not created but returned as a list of DDL
+    statements that should be executed after the bulk insertion."""
+
+    database = database or config.database.database
+    if reboot_server:
+        drop_all_connection(config.database.cluster)
+        logger.info("Successfully rebooted...")
+
+    with get_new_connection(database="edgedb") as connection:
+        with suppress(edgedb.errors.InvalidReferenceError):
+            connection.execute(f"DROP DATABASE {database}")
+        logger.info("Creating the database %s...", database)
+        connection.execute(f"CREATE DATABASE {database}")
+        logger.info("Database created...")
+
+    deferred_statements = []
+    with get_new_connection(database=database) as connection:
+        with open(schema) as stream:
+            content = stream.read()
+
+        if deferred_constraints:
+            content, deferred_statements = defer_constraints(content)
+
+        logger.info("Executing schema on %s...", connection.dbname)
+        connection.execute(content)
+        logger.info("Starting migration...")
+        connection.execute("POPULATE MIGRATION")
+        logger.info("Committing the schema...")
+        connection.execute("COMMIT MIGRATION")
+
+    logger.info("Successfully resetted!")
+    return deferred_statements
@@ -5,11 +5,20 @@ import tokenize
 from reiz.config import config
 from reiz.database import get_new_connection
 from reiz.ir import IR
-from reiz.reizql import compile_to_ir, parse_query
+from reiz.reizql import CompiledQueryCache, compile_to_ir, parse_query
 
 DEFAULT_LIMIT = 10
 DATA_PATH = config.data.path
 STATISTICS_NODES = ("Module", "AST", "stmt", "expr")
+QUERY_CACHE = CompiledQueryCache(config.web.query_cache_size)
+
+LOCATION_SELECTION = [
+    IR.selection("filename"),
+    IR.selection(
+        "project",
+        [IR.selection("git_source"), IR.selection("git_revision")],
+    ),
+]
 
 POSITION_SELECTION = [
     IR.selection("lineno"),
@@ -19,11 +28,8 @@ POSITION_SELECTION = [
     IR.selection(
         "_module",
         [
-            IR.selection("filename"),
-            IR.selection(
-                "project",
-                [IR.selection("git_source"), IR.selection("git_revision")],
-            ),
+            *LOCATION_SELECTION,
+            IR.selection("aliases", LOCATION_SELECTION),
         ],
     ),
 ]
@@ -68,10 +74,8 @@ def fetch(filename, **loc_data):
     return ast.get_source_segment(source, loc_node, padded=True)
 
 
-def compile_query(reiz_ql, limit, offset):
-    tree = parse_query(reiz_ql)
-
-    selection = compile_to_ir(tree)
+def compile_tree(tree, limit=None, offset=0, parameters=None):
+    selection = compile_to_ir(tree, parameters)
     if limit is not None:
         selection.limit = limit
     if offset > 0:
@@ -81,14 +85,50 @@ def compile_query(reiz_ql, limit, offset):
     return selection
 
 
+def compile_query(reiz_ql, limit, offset):
+    return compile_tree(parse_query(reiz_ql), limit, offset)
+
+
+def construct_query(reiz_ql, limit, offset):
+    """Return the query text and its arguments, where all the literals
+    (and the pagination) are passed as parameters, so that the queries
+    with the same structure share the same plan on the server."""
+
+    # The pagination is applied on the cached query, in the same
+    # way as the select statements would construct it.
+    query, arguments = QUERY_CACHE.get(reiz_ql, _construct_tree)
+    arguments = arguments.copy()
+    if offset > 0:
+        query += "\nOFFSET <int64>$offset"
+        arguments["offset"] = offset
+    if limit is not None:
+        query += "\nLIMIT <int64>$limit"
+        arguments["limit"] = limit
+    return query, arguments
+
+
+def _construct_tree(tree):
+    parameters = {}
+    query = IR.construct(compile_tree(tree, parameters=parameters))
+    return query, parameters
+
+
+def get_location(module, result):
+    github_link = (
+        infer_github_url(module) + f"#L{result.lineno}-L{result.end_lineno}"
+    )
+    return {
+        "repo": module.project.git_source,
+        "username": get_username(module.project.git_source),
+        "filename": module.filename,
+        "github_link": github_link,
+    }
+
+
 def process_queryset(query_set):
     results = []
     for result in query_set:
         module = result._module
-        github_link = (
-            infer_github_url(module)
-            + f"#L{result.lineno}-L{result.end_lineno}"
-        )
         loc_data = {
             "filename": module.filename,
             "lineno": result.lineno,
@@ -102,14 +142,22 @@ def process_queryset(query_set):
         except Exception:
             source = None
 
-        result = {
-            "repo": module.project.git_source,
-            "username": get_username(module.project.git_source),
-            "source": source,
-            "github_link": github_link,
-            **loc_data,
-        }
-        results.append(result)
+        # Modules with the same content are only inserted once, and the
+        # rest of the files are recorded as their aliases. They are listed
+        # under the same result (without reading their sources again), so
+        # that each match is still counted once against the limit.
+        aliases = [
+            get_location(alias, result)
+            for alias in getattr(module, "aliases", ())
+        ]
+        results.append(
+            {
+                **get_location(module, result),
+                "source": source,
+                "aliases": aliases,
+                **loc_data,
+            }
+        )
 
     return results
 
@@ -121,8 +169,8 @@ def run_query_on_connection(
     limit=DEFAULT_LIMIT,
     offset=0,
 ):
-    query = IR.construct(compile_query(reiz_ql, limit, offset))
-    query_set = connection.query(query)
+    query, arguments = construct_query(reiz_ql, limit, offset)
+    query_set = connection.query(query, **arguments)
     return process_queryset(query_set)
 
 
@@ -135,9 +183,9 @@ async def run_query_on_async_connection(
     loop=None,
     timeout=config.web.timeout,
 ):
-    query = IR.construct(compile_query(reiz_ql, limit, offset))
+    query, arguments = construct_query(reiz_ql, limit, offset)
     query_set = await asyncio.wait_for(
-        connection.query(query), timeout=timeout, loop=loop
+        connection.query(query, **arguments), timeout=timeout, loop=loop
     )
     return process_queryset(query_set)
 
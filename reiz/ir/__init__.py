@@ -11,6 +11,32 @@ IR.add_prepared_query(
     IR.select("Module", selections=[IR.selection("filename")]),
 )
 
+IR.add_prepared_query(
+    "module.filenames_by_project",
+    IR.select(
+        "Module",
+        filters=IR.filter(
+            IR.attribute(IR.attribute(None, "project"), "name"),
+            IR.cast("str", IR.variable("project")),
+            "=",
+        ),
+        selections=[IR.selection("filename")],
+    ),
+)
+
+IR.add_prepared_query(
+    "module_alias.filenames_by_project",
+    IR.select(
+        "module_alias",
+        filters=IR.filter(
+            IR.attribute(IR.attribute(None, "project"), "name"),
+            IR.cast("str", IR.variable("project")),
+            "=",
+        ),
+        selections=[IR.selection("filename")],
+    ),
+)
+
 IR.add_prepared_query(
     "project.names", IR.select("project", selections=[IR.selection("name")])
 )
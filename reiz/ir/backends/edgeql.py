@@ -1,5 +1,6 @@
 from __future__ import annotations
 
+from copy import deepcopy
 from dataclasses import dataclass, field, replace
 from typing import List, Optional, Union
 
@@ -110,6 +111,9 @@ class Comparator(str, Operator):
     # Bitwise
     BITWISE_OR = "|"
 
+    # Arithmetic
+    SUBTRACT = "-"
+
 
 _COUNTER_OPERATORS = {
     Comparator.GT: Comparator.LTE,
@@ -125,6 +129,25 @@ _COUNTER_OPERATORS = {
 _COUNTER_OPERATORS.update(
     [(counter, original) for original, counter in _COUNTER_OPERATORS.items()]
 )
+_LOGICAL_OPERATORS = frozenset((Comparator.AND, Comparator.OR))
+
+# Comparisons which can only hold when their left side is not empty
+_VALUE_OPERATORS = frozenset(
+    (
+        Comparator.GT,
+        Comparator.LT,
+        Comparator.GTE,
+        Comparator.LTE,
+        Comparator.EQUALS,
+        Comparator.NOT_EQUALS,
+        Comparator.CONTAINS,
+        Comparator.NOT_CONTAINS,
+        Comparator.LIKE,
+        Comparator.ILIKE,
+        Comparator.NOT_LIKE,
+        Comparator.NOT_ILIKE,
+    )
+)
 
 
 @dataclass
@@ -161,10 +184,12 @@ class CompareOperation(ComplexExpression):
     operator: Comparator
 
     def unpack(self):
+        # Only the chains of the same logical operator are flattened
         for side in (self.left, self.right):
             if (
-                isinstance(side, CompareOperation)
-                and side.operator is Comparator.AND
+                self.operator in _LOGICAL_OPERATORS
+                and isinstance(side, CompareOperation)
+                and side.operator is self.operator
             ):
                 yield from side.unpack()
             else:
@@ -177,7 +202,7 @@ class CompareOperation(ComplexExpression):
         )
 
     def _construct_complex(self, state):
-        self.construct_unpacked(state, Comparator.AND + " ")
+        self.construct_unpacked(state, self.operator + " ")
 
     def _construct_simple(self, state):
         with state.between("()", condition=(self.operator is Comparator.OR)):
@@ -458,7 +483,202 @@ class For(Statement):
         state.view(self.body)
 
 
+def _unpack_chain(node, operator):
+    if isinstance(node, CompareOperation) and node.operator is operator:
+        return _unpack_chain(node.left, operator) + _unpack_chain(
+            node.right, operator
+        )
+    else:
+        return [node]
+
+
+def _build_chain(operands, operator):
+    chain, *operands = operands
+    for operand in operands:
+        chain = CompareOperation(chain, operand, operator)
+    return chain
+
+
+def _freeze(node):
+    # IR nodes are mutable (and unhashable) dataclasses
+    return repr(node)
+
+
+def _is_type_union(node):
+    return isinstance(node, NamespaceAttribute) or (
+        isinstance(node, CompareOperation)
+        and node.operator is Comparator.BITWISE_OR
+        and _is_type_union(node.left)
+        and _is_type_union(node.right)
+    )
+
+
+def _is_scalar_value(node):
+    # Literals, and the query parameters (<str>$p0)
+    return isinstance(node, Literal) or (
+        isinstance(node, Cast) and isinstance(node.item, Variable)
+    )
+
+
+def _is_enum_member(node):
+    # <ast::operator>'Add'
+    return (
+        isinstance(node, Cast)
+        and isinstance(node.model, NamespaceAttribute)
+        and isinstance(node.item, Literal)
+    )
+
+
+def _is_tautology(node):
+    # count(...) >= 0 (and len(...) >= 0), from the sequences that only
+    # have an expansion (e.g. [*...]).
+    return (
+        isinstance(node, CompareOperation)
+        and node.operator is Comparator.GTE
+        and isinstance(node.left, Call)
+        and node.left.func in ("count", "len")
+        and node.right in (0, Literal(0))
+    )
+
+
+def _iter_typed_paths(node):
+    # .a[IS ast::X].b[IS ast::Y].c => (.a, ast::X), (.a[IS ast::X].b, ast::Y)
+    while isinstance(node, (Attribute, Subscript)):
+        if (
+            isinstance(node, Subscript)
+            and isinstance(node.value, UnaryOperation)
+            and node.value.operator is UnaryOperator.IDENTICAL
+        ):
+            yield node.item, node.value.operand
+            node = node.item
+        elif isinstance(node, Subscript):
+            node = node.item
+        else:
+            node = node.base
+
+
+def _iter_nodes(node):
+    yield node
+    if not isinstance(node, EQL) or isinstance(node, Operator):
+        return None
+
+    for value in vars(node).values():
+        if isinstance(value, list):
+            for item in value:
+                yield from _iter_nodes(item)
+        else:
+            yield from _iter_nodes(value)
+
+
+def _is_typed_path(node):
+    # .a[IS ast::X]
+    return (
+        isinstance(node, Subscript)
+        and isinstance(node.value, UnaryOperation)
+        and node.value.operator is UnaryOperator.IDENTICAL
+    )
+
+
+def _iter_path_prefixes(node):
+    # .a[IS ast::X].b[IS ast::Y].c => .a[IS ast::X].b[IS ast::Y], .a[IS ast::X]
+    while isinstance(node, (Attribute, Subscript)):
+        if _is_typed_path(node):
+            yield node
+        if isinstance(node, Subscript):
+            node = node.item
+        else:
+            node = node.base
+
+
+def _is_comparison(node):
+    return (
+        isinstance(node, CompareOperation)
+        and node.operator not in _LOGICAL_OPERATORS
+    )
+
+
+def _iter_operands(node):
+    # The outermost operands of the (nested) comparisons. Logical operators,
+    # calls (e.g. all(), any()) and sub-queries are not entered, since the
+    # paths in them might not be evaluated in the same scope.
+    if _is_comparison(node):
+        yield from _iter_operands(node.left)
+        yield from _iter_operands(node.right)
+    else:
+        yield node
+
+
+def _find_common_path(expressions):
+    uses = {}
+    prefixes = {}
+    for expression in expressions:
+        for operand in _iter_operands(expression):
+            for prefix in _iter_path_prefixes(operand):
+                key = _freeze(prefix)
+                uses[key] = uses.get(key, 0) + 1
+                prefixes[key] = prefix
+
+    candidates = [prefixes[key] for key, count in uses.items() if count >= 2]
+    if not candidates:
+        return None
+
+    # The longest one first, the shorter ones are bound afterwards if
+    # they are still used by more than one path (or alias).
+    return max(
+        candidates, key=lambda prefix: len(tuple(_iter_path_prefixes(prefix)))
+    )
+
+
+def _sort_aliases(aliases):
+    # Aliases are defined after the ones that they refer to
+    ordered = []
+
+    def visit(alias):
+        if alias in ordered:
+            return None
+        for node in _iter_nodes(aliases[alias]):
+            if isinstance(node, Name) and node in aliases and node != alias:
+                visit(node)
+        ordered.append(alias)
+
+    for alias in aliases:
+        visit(alias)
+    return ordered
+
+
+def _replace_path(node, path, alias):
+    if node == path:
+        return alias
+    elif not isinstance(node, EQL) or isinstance(node, Operator):
+        return node
+
+    for name, value in vars(node).items():
+        if isinstance(value, list):
+            value = [_replace_path(item, path, alias) for item in value]
+        else:
+            value = _replace_path(value, path, alias)
+        setattr(node, name, value)
+    return node
+
+
+def _replace_operands(node, path, alias):
+    if _is_comparison(node):
+        node.left = _replace_operands(node.left, path, alias)
+        node.right = _replace_operands(node.right, path, alias)
+        return node
+    elif isinstance(node, (Attribute, Subscript)):
+        return _replace_path(node, path, alias)
+    else:
+        return node
+
+
 class EQLOptimizer(IROptimizer):
+    def rewrite(self, node):
+        node = super().rewrite(node)
+        if isinstance(node, Select):
+            node = self.hoist_common_paths(node)
+        return node
+
     @IROptimizer.optimization
     def optimize_negative_operators(self, node):
         # Optimize operators
@@ -503,8 +723,8 @@ class EQLOptimizer(IROptimizer):
         self.ensure(isinstance(node.right, CompareOperation))
         self.ensure(node.left.operator is Comparator.IDENTICAL)
         self.ensure(node.right.operator is Comparator.IDENTICAL)
-        self.ensure(isinstance(node.left.right, NamespaceAttribute))
-        self.ensure(isinstance(node.right.right, NamespaceAttribute))
+        self.ensure(_is_type_union(node.left.right))
+        self.ensure(_is_type_union(node.right.right))
         self.ensure(node.left.left == node.right.left)
 
         rhs = CompareOperation(
@@ -512,12 +732,241 @@ class EQLOptimizer(IROptimizer):
         )
         return CompareOperation(node.left.left, rhs, Comparator.IDENTICAL)
 
+    @IROptimizer.optimization
+    def flatten_logical_chains(self, node):
+        # Flatten the nested ANDs/ORs into a single (left-deep) chain, and
+        # remove the duplicate operands from it.
+        # ReizQL        => Call(Name() & Name())
+        # Unoptimized   => FILTER .func IS ast::Name AND .func IS ast::Name
+        #
+        # Optimized     => FILTER .func IS ast::Name
+        self.ensure(node.operator in _LOGICAL_OPERATORS)
+
+        operands = _unpack_chain(node, node.operator)
+        unique_operands = []
+        for operand in operands:
+            if operand not in unique_operands:
+                unique_operands.append(operand)
+
+        replacement = _build_chain(unique_operands, node.operator)
+        self.ensure(replacement != node)
+        return replacement
+
+    @IROptimizer.optimization
+    def fold_tautologies(self, node):
+        # Remove the length checks that always hold from the AND chains
+        # ReizQL        => Module(body=[*...], type_ignores=[])
+        # Unoptimized   => FILTER count(.body) >= 0 AND count(.type_ignores) = 0
+        #
+        # Optimized     => FILTER count(.type_ignores) = 0
+        self.ensure(node.operator is Comparator.AND)
+
+        operands = _unpack_chain(node, node.operator)
+        remaining = [
+            operand for operand in operands if not _is_tautology(operand)
+        ]
+        self.ensure(remaining and len(remaining) < len(operands))
+        return _build_chain(remaining, node.operator)
+
+    @IROptimizer.optimization
+    def drop_redundant_type_checks(self, node):
+        # Remove the type checks that are implied by a comparison on the
+        # same (typed) path.
+        # ReizQL        => Call(Name() & Name('a'))
+        # Unoptimized   => FILTER .func IS ast::Name
+        #                  AND .func[IS ast::Name].id = 'a'
+        #
+        # Optimized     => FILTER .func[IS ast::Name].id = 'a'
+        self.ensure(node.operator is Comparator.AND)
+
+        operands = _unpack_chain(node, node.operator)
+        typed_paths = [
+            typed_path
+            for operand in operands
+            if isinstance(operand, CompareOperation)
+            and operand.operator in _VALUE_OPERATORS
+            for typed_path in _iter_typed_paths(operand.left)
+        ]
+        remaining = [
+            operand
+            for operand in operands
+            if not (
+                isinstance(operand, CompareOperation)
+                and operand.operator is Comparator.IDENTICAL
+                and isinstance(operand.right, NamespaceAttribute)
+                and (operand.left, operand.right) in typed_paths
+            )
+        ]
+        self.ensure(len(remaining) < len(operands))
+        return _build_chain(remaining, node.operator)
+
+    @IROptimizer.optimization
+    def optimize_equality_chains(self, node):
+        # Collapse the equality checks on the same path into a single
+        # set membership test.
+        # ReizQL        => Name('a' | 'b' | 'c')
+        # Unoptimized   => FILTER .id = 'a' OR .id = 'b' OR .id = 'c'
+        #
+        # Optimized     => FILTER .id IN {'a', 'b', 'c'}
+        return self._collapse_memberships(node, _is_scalar_value)
+
+    @IROptimizer.optimization
+    def optimize_enum_or(self, node):
+        # Same as the optimize_equality_chains, for the enum members
+        # ReizQL        => BinOp(op=Add() | Sub())
+        # Unoptimized   => FILTER .op = <ast::operator>'Add'
+        #                  OR .op = <ast::operator>'Sub'
+        #
+        # Optimized     => FILTER .op IN {<ast::operator>'Add',
+        #                                 <ast::operator>'Sub'}
+        return self._collapse_memberships(node, _is_enum_member)
+
+    def _collapse_memberships(self, node, is_member):
+        if node.operator is Comparator.OR:
+            operator, collapsed_operator = (
+                Comparator.EQUALS,
+                Comparator.CONTAINS,
+            )
+        elif node.operator is Comparator.AND:
+            operator, collapsed_operator = (
+                Comparator.NOT_EQUALS,
+                Comparator.NOT_CONTAINS,
+            )
+        else:
+            self.ensure(False)
+
+        groups = {}
+        operands = _unpack_chain(node, node.operator)
+        for position, operand in enumerate(operands):
+            if (
+                isinstance(operand, CompareOperation)
+                and operand.operator is operator
+                and is_member(operand.right)
+            ):
+                groups.setdefault(_freeze(operand.left), []).append(position)
+            elif (
+                isinstance(operand, CompareOperation)
+                and operand.operator is collapsed_operator
+                and isinstance(operand.right, Set)
+                and all(map(is_member, operand.right.items))
+            ):
+                groups.setdefault(_freeze(operand.left), []).append(position)
+
+        groups = [
+            positions for positions in groups.values() if len(positions) > 1
+        ]
+        self.ensure(groups)
+
+        replacements = {}
+        for positions in groups:
+            members = []
+            for position in positions:
+                operand = operands[position]
+                if isinstance(operand.right, Set):
+                    members.extend(operand.right.items)
+                else:
+                    members.append(operand.right)
+            replacements[positions[0]] = CompareOperation(
+                operands[positions[0]].left, Set(members), collapsed_operator
+            )
+            replacements.update(dict.fromkeys(positions[1:]))
+
+        remaining = []
+        for position, operand in enumerate(operands):
+            operand = replacements.get(position, operand)
+            if operand is not None:
+                remaining.append(operand)
+        return _build_chain(remaining, node.operator)
+
+    @IROptimizer.optimization
+    def fold_tautological_filters(self, node):
+        # Select statements that only have a tautology as their filter
+        # ReizQL        => Module(body=[*...])
+        # Unoptimized   => SELECT ast::Module FILTER count(.body) >= 0
+        #
+        # Optimized     => SELECT ast::Module
+        self.ensure(_is_tautology(node.filters))
+        return node.replace(filters=None)
+
+    @IROptimizer.optimization
+    def hoist_common_paths(self, node):
+        # Bind the typed paths that are used more than once to aliases,
+        # so that they are traversed (and written) once. Only the paths
+        # that are directly compared in the top-level AND conjuncts of
+        # the filter are bound, the rest of the filter is left as is.
+        # ReizQL        => Call(Attribute(Name('a'), 'b'))
+        # Unoptimized   => FILTER .func[IS ast::Attribute].value[IS ast::Name]
+        #                  .py_id = 'a' AND .func[IS ast::Attribute].attr = 'b'
+        #
+        # Optimized     => FILTER (WITH path_0 := .func[IS ast::Attribute]
+        #                  SELECT path_0.value[IS ast::Name].py_id = 'a'
+        #                  AND path_0.attr = 'b')
+        self.ensure(isinstance(node.model, NamespaceAttribute))
+        self.ensure(node.filters is not None)
+
+        node = deepcopy(node)
+        if isinstance(node.filters, WrappedStatement):
+            namespace, statement = (
+                node.filters.namespace,
+                node.filters.statement,
+            )
+            self.ensure(isinstance(statement, Select))
+            self.ensure(statement.filters is None)
+            expression = statement.model
+        else:
+            namespace, statement = With(), None
+            expression = node.filters
+
+        taken_names = {
+            used_node.name
+            for used_node in _iter_nodes(node)
+            if isinstance(used_node, Name)
+        }
+        conjuncts = _unpack_chain(expression, Comparator.AND)
+        comparisons = [
+            conjunct for conjunct in conjuncts if _is_comparison(conjunct)
+        ]
+
+        aliases = {}
+        while path := _find_common_path([*comparisons, *aliases.values()]):
+            alias = Name(f"path_{len(aliases)}")
+            while alias.name in taken_names:
+                alias = Name(alias.name + "_")
+
+            # Comparisons are replaced in place, so the conjuncts
+            # are kept in sync with them.
+            for comparison in comparisons:
+                _replace_operands(comparison, path, alias)
+            for name, definition in aliases.items():
+                if definition != path:
+                    aliases[name] = _replace_path(definition, path, alias)
+            aliases[alias] = path
+
+        self.ensure(aliases)
+        expression = _build_chain(conjuncts, Comparator.AND)
+        namespace.body.extend(
+            Assign(alias, aliases[alias]) for alias in _sort_aliases(aliases)
+        )
+        if statement is None:
+            filters = WrappedStatement(namespace, Select(expression))
+        else:
+            filters = replace(node.filters, statement=Select(expression))
+        return node.replace(filters=filters)
+
     OPTIMIZATIONS = {
         UnaryOperation: [
             optimize_negative_operators,
             optimize_double_negatives,
         ],
-        CompareOperation: [optimize_type_or],
+        CompareOperation: [
+            optimize_type_or,
+            flatten_logical_chains,
+            fold_tautologies,
+            drop_redundant_type_checks,
+            optimize_equality_chains,
+            optimize_enum_or,
+        ],
+        Select: [fold_tautological_filters],
     }
 
 
@@ -604,6 +1053,7 @@ class EQLBuilder(IRBuilder, backend_name="EdgeQL"):
 
     set = Set
     loop = For
+    array = Array
     name = Name
     call = Call
     cast = Cast
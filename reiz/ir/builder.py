@@ -1,5 +1,3 @@
-import uuid
-
 from reiz.ir.optimizer import IROptimizer
 from reiz.ir.printer import IRPrinter
 from reiz.schema import BaseSchema
@@ -57,7 +55,7 @@ class IRBuilder:
     def construct(self, node, *, optimize=True, **view_kwargs):
         if optimize:
             optimizer = self.optimizer()
-            optimizer.optimize(node)
+            node = optimizer.optimize(node)
 
         view_kwargs.setdefault("top_level", True)
         printer = self.printer()
@@ -67,12 +65,6 @@ class IRBuilder:
     def construct_prepared(self, key):
         return self.construct(self.PREPARED_QUERIES.get(key))
 
-    def new_reference(self, category=None):
-        name = str(uuid.uuid4().hex[:8])
-        if category:
-            name = f"{category}_{name}"
-        return self.name(name)
-
 
 def get_ir_builder(backend_name):
     if backend := _IR_BUILDERS.get(backend_name.casefold()):
@@ -1,8 +1,11 @@
 import functools
+import threading
+from collections import Counter
+from enum import Enum
 
 from reiz.ir.backends import base
 
-BaseAST = (base.Expression, base.Statement)
+BaseAST = (base.Expression, base.Statement, base.Unit)
 
 
 class QuitOptimization(Exception):
@@ -15,22 +18,58 @@ class QuitOptimization(Exception):
 
 
 class IROptimizer:
+    """A rewrite engine that applies the registered rules (OPTIMIZATIONS,
+    keyed by the node type) to every node of the tree, until none of them
+    fire anymore (or MAX_PASSES is reached).
+
+    Each rule should either return a new node, or quit the optimization
+    through ensure(). The number of times each rule has fired is kept in
+    hits (for this optimizer), and they are merged into the totals of all
+    optimizers (see get_total_hits) once the optimization is done."""
+
     OPTIMIZATIONS = {}
+    MAX_PASSES = 16
+
+    _total_hits = Counter()
+    _total_hits_lock = threading.Lock()
+
+    def __init__(self):
+        self.hits = Counter()
+        self._changed = False
+
+    def optimize(self, node):
+        node = self.rewrite(node)
+
+        # Queries are constructed from many threads (web workers,
+        # insertion), so the shared counter is only updated here.
+        with self._total_hits_lock:
+            self._total_hits.update(self.hits)
+        return node
+
+    def rewrite(self, node):
+        for _ in range(self.MAX_PASSES):
+            self._changed = False
+            node = self.visit(node)
+            if not self._changed:
+                break
+        return node
+
+    @classmethod
+    def get_total_hits(cls):
+        with cls._total_hits_lock:
+            return cls._total_hits.copy()
 
     def visit(self, node):
-        node_type = type(node)
-        optimizations = self.OPTIMIZATIONS.get(node_type, [])
-        for optimization in optimizations:
-            node = optimization(self, node)
-            if not isinstance(node, node_type):
+        for optimization in self.OPTIMIZATIONS.get(type(node), []):
+            replacement = optimization(self, node)
+            if replacement is not node:
+                # The rest of the rules are applied in the next pass
+                node = replacement
                 break
         return self.generic_visit(node)
 
-    def optimize(self, node):
-        self.visit(node)
-
     def generic_visit(self, node):
-        if not isinstance(node, BaseAST):
+        if not isinstance(node, BaseAST) or isinstance(node, Enum):
             return node
 
         for field, value in vars(node).items():
@@ -44,6 +83,7 @@ class IROptimizer:
                         replacement.extend(replacement_item)
                     elif replacement_item is not None:
                         replacement.append(replacement_item)
+                setattr(node, field, replacement)
         return node
 
     def ensure(self, condition, node=None):
@@ -59,6 +99,8 @@ class IROptimizer:
             except QuitOptimization as exc:
                 return exc.node or node
             else:
-                return self.visit(replacement)
+                self.hits[func.__name__] += 1
+                self._changed = True
+                return replacement
 
         return wrapper
@@ -1,3 +1,4 @@
+from reiz.reizql.cache import CompiledQueryCache, canonicalize
 from reiz.reizql.compiler import compile_to_ir
 from reiz.reizql.parser import ReizQLSyntaxError
 from reiz.reizql.parser.parse import parse_query
@@ -0,0 +1,135 @@
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass, field, fields, is_dataclass
+from functools import singledispatch
+
+from reiz.reizql.parser import grammar
+from reiz.reizql.parser.parse import parse_query
+
+DEFAULT_CACHE_SIZE = 1024
+
+
+@singledispatch
+def _canonicalize(node, ordered):
+    if isinstance(node, grammar.LogicOperator):
+        return node.name
+    elif is_dataclass(node):
+        return (type(node).__name__,) + tuple(
+            _canonicalize(getattr(node, field.name), ordered)
+            for field in fields(node)
+        )
+    elif isinstance(node, grammar.RQL):
+        # Singletons (Ignore, Expand, Cease)
+        return type(node).__name__
+    else:
+        # Constants are tagged with their types, since True == 1
+        return type(node).__name__, node
+
+
+@_canonicalize.register(list)
+def _canonicalize_list(node, ordered):
+    return tuple(_canonicalize(item, ordered) for item in node)
+
+
+@_canonicalize.register(dict)
+def _canonicalize_dict(node, ordered):
+    items = [
+        (key, _canonicalize(value, ordered)) for key, value in node.items()
+    ]
+    if not ordered:
+        items.sort(key=lambda item: item[0])
+    return tuple(items)
+
+
+@_canonicalize.register(grammar.Match)
+def _canonicalize_match(node, ordered):
+    # The positional arguments are already mapped to their field
+    # names by the parser, so only the order of filters is left.
+    return "Match", node.name, _canonicalize(node.filters, ordered)
+
+
+def _has_references(node):
+    if isinstance(node, grammar.Ref):
+        return True
+    elif isinstance(node, list):
+        return any(map(_has_references, node))
+    elif isinstance(node, dict):
+        return any(map(_has_references, node.values()))
+    elif is_dataclass(node):
+        return any(
+            _has_references(getattr(node, field.name))
+            for field in fields(node)
+        )
+    else:
+        return False
+
+
+def canonicalize(tree):
+    """A hashable form of the parsed query, which is the same for the
+    queries that only differ in whitespace, the order of keywords or
+    the positional/keyword forms of the same fields."""
+
+    # References are defined by their first occurrence, so the order
+    # of filters is kept for the queries that have them.
+    return _canonicalize(tree, ordered=_has_references(tree))
+
+
+@dataclass
+class CompiledQueryCache:
+    """A LRU cache of the constructed queries, keyed by the canonical
+    form of their sources. The raw sources are mapped to their canonical
+    forms as well, so that the repeated queries aren't parsed again."""
+
+    max_size: int = DEFAULT_CACHE_SIZE
+    hits: int = 0
+    misses: int = 0
+
+    _queries: OrderedDict = field(default_factory=OrderedDict)
+    _sources: OrderedDict = field(default_factory=OrderedDict)
+    _lock: threading.Lock = field(default_factory=threading.Lock)
+
+    def get(self, source, compiler):
+        source = source.strip()
+        with self._lock:
+            if (key := self._sources.get(source)) in self._queries:
+                return self._hit(source, key)
+
+        tree = parse_query(source)
+        key = canonicalize(tree)
+        with self._lock:
+            if key in self._queries:
+                self._store(self._sources, source, key)
+                return self._hit(source, key)
+
+        query = compiler(tree)
+        with self._lock:
+            self.misses += 1
+            self._store(self._sources, source, key)
+            self._store(self._queries, key, query)
+        return query
+
+    def clear(self):
+        with self._lock:
+            self._queries.clear()
+            self._sources.clear()
+            self.hits = self.misses = 0
+
+    def info(self):
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "size": len(self._queries),
+            "max_size": self.max_size,
+        }
+
+    def _hit(self, source, key):
+        self.hits += 1
+        self._sources.move_to_end(source)
+        self._queries.move_to_end(key)
+        return self._queries[key]
+
+    def _store(self, entries, key, value):
+        entries[key] = value
+        entries.move_to_end(key)
+        while len(entries) > self.max_size:
+            entries.popitem(last=False)
@@ -5,7 +5,7 @@ from functools import singledispatch
 from reiz.ir import IR
 from reiz.reizql.compiler.functions import Signature
 from reiz.reizql.compiler.state import CompilerState
-from reiz.reizql.parser import grammar
+from reiz.reizql.parser import ReizQLSyntaxError, grammar
 from reiz.serialization.transformers import ast
 
 _COMPILER_WORKAROUND_FOR_TARGET = "_singleton"
@@ -18,9 +18,9 @@ def codegen(node, state):
 
 
 @codegen.register(grammar.Match)
-def compile_matcher(node, state):
+def compile_matcher(node, state, parameters=None):
     if state is None:
-        state = CompilerState(node.name)
+        state = CompilerState(node.name, parameters=parameters)
     else:
         state = CompilerState.from_parent(node.name, state)
 
@@ -29,6 +29,12 @@ def compile_matcher(node, state):
         if value is grammar.Ignore:
             continue
 
+        if IR.schema.profile.drops(key, node.name, node.bound_node.base_name):
+            raise ReizQLSyntaxError(
+                f"{node.name}.{key} is not indexed under the "
+                f"{IR.schema.profile.name!r} indexing profile"
+            )
+
         if right_filter := state.compile(key, value):
             filters = IR.combine_filters(filters, right_filter)
 
@@ -57,19 +63,19 @@ def convert_match_enum(node, state):
 
 @codegen.register(grammar.Constant)
 def compile_constant(node, state):
-    expr = IR.literal(node.value)
+    value = node.value
 
     # Constants are represented as repr(obj) in the
     # serialization part, so we have to re-cast it.
     if state.match == "Constant":
-        expr.value = repr(expr.value)
+        value = repr(value)
 
-    return IR.filter(state.compute_path(), expr, "=")
+    return IR.filter(state.compute_path(), state.literal(value), "=")
 
 
 @codegen.register(grammar.MatchString)
 def compile_match_string(node, state):
-    expr = IR.literal(node.value)
+    expr = state.literal(node.value)
     return IR.filter(state.compute_path(), expr, "LIKE")
 
 
@@ -116,36 +122,51 @@ def compile_reference(node, state):
     state.scope.define(node.name, state.copy())
 
 
-def aggregate_array(state):
+def select_item(state, index):
+    # Items are selected through their @index'es (which are always written
+    # as 0..n-1), instead of aggregating the whole sequence into an array
+    # and subscripting it.
+    index_filter = IR.filter(IR.property("index"), index, "=")
+
     # If we are in a nested list search (e.g: Call(args=[Call(args=[Name()])]))
-    # we can't directly use `ORDER BY @index` since the EdgeDB can't quite infer
+    # we can't directly use `FILTER @index` since the EdgeDB can't quite infer
     # which @index are we talking about.
     if len(state.parents) >= 1:
         path = IR.attribute(
             IR.typed(IR.name(_COMPILER_WORKAROUND_FOR_TARGET), state.match),
             state.pointer,
         )
-        body = IR.loop(
+        return IR.loop(
             IR.name(_COMPILER_WORKAROUND_FOR_TARGET),
             state.parents[-1].compute_path(allow_missing=True),
-            IR.select(path, order=IR.property("index")),
+            IR.select(path, filters=index_filter),
         )
     else:
-        body = IR.select(state.compute_path(), order=IR.property("index"))
-
-    return IR.call("array_agg", [body])
+        return IR.select(state.compute_path(), filters=index_filter)
 
 
 @codegen.register(grammar.List)
 def compile_sequence(node, state):
     total_length = len(node.items)
-    verify_call = IR.call("count", [state.compute_path()])
-
-    length_verifier = IR.filter(verify_call, total_length, "=")
+    length = IR.call("count", [state.compute_path()])
 
     if total := node.items.count(grammar.Expand):
         state.ensure(node, total == 1)
-        length_verifier = IR.filter(verify_call, total_length - 1, ">=")
+        expansion_start = node.items.index(grammar.Expand)
+
+        # The positions after the expansion are relative to the end of
+        # the sequence, so the length is computed once and shared between
+        # them and the length check.
+        if any(
+            item is not grammar.Ignore
+            for item in node.items[expansion_start + 1 :]
+        ):
+            length_ref = state.new_reference("length")
+            state.variables[length_ref] = length
+            length = length_ref
+        length_verifier = IR.filter(length, total_length - 1, ">=")
+    else:
+        length_verifier = IR.filter(length, total_length, "=")
 
     state.filters.append(length_verifier)
     if total_length == 0 or all(
@@ -153,32 +174,30 @@ def compile_sequence(node, state):
     ):
         return None
 
-    array_ref = IR.new_reference("sequence")
-    state.variables[array_ref] = aggregate_array(state)
+    item_refs = []
+    expansion_seen = False
+    for position, matcher in enumerate(node.items):
+        if matcher is grammar.Ignore:
+            continue
+        elif matcher is grammar.Expand:
+            expansion_seen = True
+            continue
+
+        if expansion_seen:
+            index = IR.filter(length, total_length - position, "-")
+        else:
+            index = position
 
-    # For length verifier, instead of re-accessing the path
-    # we'll use the already aggregated array. So switch the
-    # verifier function from 'count' to 'len' (one is for sets
-    # and the other one is for arrays.)
-    verify_call.func = "len"
-    verify_call.args = [array_ref]
+        item_ref = state.new_reference("item")
+        state.variables[item_ref] = select_item(state, index)
+        item_refs.append((item_ref, matcher))
 
-    expansion_seen = False
     with state.temp_flag("in for loop"), state.temp_property(
         "enumeration start depth", state.depth
     ), state.new_scope():
         filters = None
-        for position, matcher in enumerate(node.items):
-            if matcher is grammar.Ignore:
-                continue
-            elif matcher is grammar.Expand:
-                expansion_seen = True
-                continue
-
-            if expansion_seen:
-                position = -(total_length - position)
-
-            with state.temp_pointer(IR.subscript(array_ref, position)):
+        for item_ref, matcher in item_refs:
+            with state.temp_pointer(item_ref):
                 if item_filters := state.codegen(matcher):
                     filters = IR.combine_filters(filters, item_filters)
 
@@ -197,5 +216,9 @@ def convert_call(node, state):
     return signature.codegen(node, state)
 
 
-def compile_to_ir(node):
-    return codegen(node, None)
+def compile_to_ir(node, parameters=None):
+    """Compile the given ReizQL tree into an IR query. If a dictionary
+    of parameters is given, the literals are collected into it (as p0,
+    p1, ...) instead of being inlined to the query."""
+
+    return codegen(node, None, parameters)
@@ -61,7 +61,7 @@ def convert_intensive(node, state, arguments):
     match_str = arguments.match_str
     state.ensure(node, isinstance(match_str, grammar.MatchString))
     return IR.filter(
-        state.compute_path(), IR.literal(match_str.value), "ILIKE"
+        state.compute_path(), state.literal(match_str.value), "ILIKE"
     )
 
 
@@ -87,7 +87,7 @@ def convert_length(node, state, arguments):
         state.ensure(value, isinstance(value, grammar.Constant))
         state.ensure(value, isinstance(value.value, int))
         filters = IR.combine_filters(
-            filters, IR.filter(count, IR.literal(value.value), operator)
+            filters, IR.filter(count, state.literal(value.value), operator)
         )
 
     assert filters is not None
@@ -3,13 +3,15 @@ from __future__ import annotations
 from contextlib import contextmanager
 from copy import deepcopy
 from dataclasses import dataclass, field
-from typing import Any, Dict, List
+from typing import Any, Dict, List, Optional
 
 from reiz.ir import IR
 from reiz.reizql.compiler.analysis import Scope
 from reiz.reizql.compiler.field_db import FIELD_DB
 from reiz.reizql.parser import ReizQLSyntaxError
 
+_PARAMETER_TYPES = {str: "str", int: "int64", float: "float64"}
+
 
 @dataclass
 class CompilerState:
@@ -21,6 +23,7 @@ class CompilerState:
     filters: List[IR.expression] = field(default_factory=list)
     variables: Dict[IR.name, IR.expression] = field(default_factory=dict)
     properties: Dict[str, Any] = field(default_factory=dict)
+    parameters: Optional[Dict[str, Any]] = None
     parents: List[CompilerState] = field(default_factory=list, repr=False)
 
     copy = deepcopy
@@ -35,6 +38,7 @@ class CompilerState:
             filters=parent.filters,
             variables=parent.variables,
             properties=parent.properties,
+            parameters=parent.parameters,
         )
 
     @classmethod
@@ -82,6 +86,23 @@ class CompilerState:
     set_property = set_flag
     temp_property = temp_flag
 
+    def literal(self, value):
+        # Literals are passed as query parameters (if requested), so that
+        # the queries which only differ in them can share the same plan.
+        if self.parameters is None or type(value) not in _PARAMETER_TYPES:
+            return IR.literal(value)
+
+        name = f"p{len(self.parameters)}"
+        self.parameters[name] = value
+        return IR.cast(_PARAMETER_TYPES[type(value)], IR.variable(name))
+
+    def new_reference(self, category):
+        # Aliases are numbered per compilation (instead of being randomly
+        # named), so that the same query always compiles to the same text.
+        counter = self.get_property("reference counter", 0)
+        self.set_property("reference counter", counter + 1)
+        return IR.name(f"{category}_{counter}")
+
     def compile(self, key, value):
         with self.temp_pointer(key):
             return self.codegen(value)
@@ -2,6 +2,8 @@ import ast
 import json
 from functools import cached_property
 
+from reiz.config import config
+from reiz.schema.profile import get_profile
 from reiz.utilities import STATIC_DIR
 
 
@@ -20,6 +22,10 @@ class BaseSchema:
     def module_annotated_types(self):
         return self._ast_tuple(self.RAW_SCHEMA["module_annotated_types"])
 
+    @cached_property
+    def profile(self):
+        return get_profile(config)
+
     @cached_property
     def tag_excluded_fields(self):
         return self.RAW_SCHEMA["tag_exclusions"]
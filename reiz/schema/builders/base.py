@@ -11,6 +11,7 @@ class BaseSchemaGenerator:
     # Required fields for reiz.schema.Schema
     SCHEMA_FIELDS = (
         "unique_fields",
+        "indexed_fields",
         "tag_exclusions",
         "module_annotated_types",
     )
@@ -9,6 +9,7 @@ from pyasdl import FieldQualifier
 
 from reiz.schema.builders.base import BaseSchemaGenerator
 from reiz.schema.esdl import ESDLSchema as Schema
+from reiz.schema.profile import IndexingProfile
 from reiz.utilities import ReizEnum
 
 INDENT = " " * 4
@@ -77,6 +78,7 @@ class Model:
     fields: List[Field] = field(default_factory=list)
     constraint: Optional[ModelConstraint] = None
     extending: List[str] = field(default_factory=list)
+    indexes: List[str] = field(default_factory=list)
 
     @classmethod
     def enum(cls, name, members):
@@ -102,6 +104,10 @@ class Model:
 
         source.append(line)
         source.extend(INDENT + field.construct() for field in self.fields)
+        source.extend(
+            INDENT + f"index on (.{Schema.wrap(index, with_prefix=False)});"
+            for index in self.indexes
+        )
         if len(source) >= 2:
             source.append("}")
         else:
@@ -123,8 +129,9 @@ class ESDLSchemaGenerator(pyasdl.ASDLVisitor, BaseSchemaGenerator):
         FieldQualifier.SEQUENCE: FieldConstraint.MULTI,
     }
 
-    def __init__(self, schema):
+    def __init__(self, schema, profile):
         self.schema = schema
+        self.profile = profile
         self.enum_types = schema.setdefault("enum_types", [])
         self.module_types = schema.setdefault("module_annotated_types", [])
         self.custom_types = {}
@@ -139,6 +146,13 @@ class ESDLSchemaGenerator(pyasdl.ASDLVisitor, BaseSchemaGenerator):
 
     def fix_references(self, definitions):
         for definition in definitions:
+            definition.fields = [
+                field
+                for field in definition.fields
+                if not self.profile.drops(
+                    field.name, definition.model, *definition.extending
+                )
+            ]
             for field in definition.fields:
                 if field.kind == "Module":
                     self.module_types.append(definition.model)
@@ -153,6 +167,11 @@ class ESDLSchemaGenerator(pyasdl.ASDLVisitor, BaseSchemaGenerator):
                     in self.schema["unique_fields"]
                 ):
                     field.is_unique = True
+                if (
+                    f"{definition.model}.{field.name}"
+                    in self.schema["indexed_fields"]
+                ):
+                    definition.indexes.append(field.name)
 
             yield definition
 
@@ -207,7 +226,7 @@ class ESDLSchemaGenerator(pyasdl.ASDLVisitor, BaseSchemaGenerator):
         )
 
 
-def generate_schema(input_file, output_file, schema_file):
+def generate_schema(input_file, output_file, schema_file, profile=None):
     with open(input_file) as stream:
         source = stream.read()
 
@@ -218,7 +237,9 @@ def generate_schema(input_file, output_file, schema_file):
             schema[tag] = ast.literal_eval(value)
 
     tree = pyasdl.parse(source)
-    schema_generator = ESDLSchemaGenerator(schema)
+    schema_generator = ESDLSchemaGenerator(
+        schema, profile or IndexingProfile()
+    )
     declarations = "\n".join(
         definition.construct() for definition in schema_generator.visit(tree)
     )
@@ -1,6 +1,124 @@
+import re
+from dataclasses import dataclass, field
+from functools import cached_property, lru_cache
+from typing import Dict, List, Tuple
+
 from reiz.schema.base import BaseSchema
 from reiz.utilities import STATIC_DIR, singleton
 
+_TYPE_PATTERN = re.compile(
+    r"^\s*(?P<abstract>abstract )?type (?P<name>\w+)"
+    r"(?: extending (?P<bases>[\w, ]+))? \{"
+)
+_POINTER_PATTERN = re.compile(
+    r"^\s*(?P<required>required )?(?P<multi>multi )?"
+    r"(?P<kind>property|link) (?P<name>\w+) -> (?P<target>[^;{]+?)"
+    r"(?P<block> \{)?;?$"
+)
+_INDEX_PATTERN = re.compile(r"^\s*index on \((?P<expression>.+)\);$")
+_EXCLUSIVE_CONSTRAINT = "constraint exclusive;"
+
+# Blocks of pointers that only have an exclusive constraint, and index
+# declarations (see defer_constraints).
+_DEFERRED_PATTERNS = (
+    (re.compile(r" \{\s*" + _EXCLUSIVE_CONSTRAINT + r"\s*\};"), ";"),
+    (re.compile(r"^\s*index on \(.+\);\n", re.MULTILINE), ""),
+)
+
+
+@dataclass(frozen=True)
+class Pointer:
+    name: str
+    target: str
+    is_link: bool
+    is_multi: bool = False
+    is_required: bool = False
+    is_indexed: bool = False
+    is_unique: bool = False
+
+
+@dataclass
+class ObjectType:
+    name: str
+    is_abstract: bool = False
+    bases: Tuple[str, ...] = ()
+    own_pointers: Dict[str, Pointer] = field(default_factory=dict)
+    indexes: List[str] = field(default_factory=list)
+
+
+def parse_object_types(source):
+    """Parse the object types (and their properties/links) from
+    the generated ESDL schema."""
+
+    object_types = {}
+    current_type = current_pointer = None
+    for line in source.splitlines():
+        if match := _TYPE_PATTERN.match(line):
+            bases = match.group("bases") or ""
+            current_type = object_types[match.group("name")] = ObjectType(
+                match.group("name"),
+                is_abstract=bool(match.group("abstract")),
+                bases=tuple(base.strip() for base in bases.split(",") if base),
+            )
+        elif current_type and (match := _POINTER_PATTERN.match(line)):
+            if current_pointer is not None:
+                # Link properties, e.g: property index -> int64;
+                if match.group("name") == "index":
+                    current_pointer["is_indexed"] = True
+                continue
+
+            pointer = dict(
+                name=match.group("name"),
+                target=match.group("target"),
+                is_link=match.group("kind") == "link",
+                is_multi=bool(match.group("multi")),
+                is_required=bool(match.group("required")),
+            )
+            if match.group("block"):
+                current_pointer = pointer
+            else:
+                current_type.own_pointers[pointer["name"]] = Pointer(**pointer)
+        elif line.strip() == _EXCLUSIVE_CONSTRAINT and current_pointer:
+            current_pointer["is_unique"] = True
+        elif current_type and (match := _INDEX_PATTERN.match(line)):
+            current_type.indexes.append(match.group("expression"))
+        elif line.strip() == "};" and current_pointer is not None:
+            current_type.own_pointers[current_pointer["name"]] = Pointer(
+                **current_pointer
+            )
+            current_pointer = None
+        elif line.strip() == "}":
+            current_type = None
+    return object_types
+
+
+def defer_constraints(source):
+    """Split the schema into a version without any exclusive constraints
+    and indexes (which would be maintained row by row while inserting),
+    and the DDL statements that would create them afterwards."""
+
+    statements = []
+    for name, object_type in parse_object_types(source).items():
+        commands = [
+            f"ALTER {'LINK' if pointer.is_link else 'PROPERTY'} "
+            f"{pointer.name} {{ CREATE CONSTRAINT exclusive; }};"
+            for pointer in object_type.own_pointers.values()
+            if pointer.is_unique
+        ]
+        commands.extend(
+            f"CREATE INDEX ON ({expression});"
+            for expression in object_type.indexes
+        )
+        if commands:
+            statements.append(
+                f"ALTER TYPE {ESDLSchema.NAMESPACE}::{name} "
+                f"{{ {' '.join(commands)} }};"
+            )
+
+    for pattern, replacement in _DEFERRED_PATTERNS:
+        source = pattern.sub(replacement, source)
+    return source, statements
+
 
 @singleton
 class ESDLSchema(BaseSchema):
@@ -20,3 +138,55 @@ class ESDLSchema(BaseSchema):
             name = f"{self.NAMESPACE}::{name}"
 
         return name
+
+    @cached_property
+    def object_types(self):
+        with open(STATIC_DIR / "Python-reiz.esdl") as stream:
+            return parse_object_types(stream.read())
+
+    @lru_cache(maxsize=None)
+    def get_bases(self, type_name):
+        bases = {type_name}
+        for base in self.object_types[type_name].bases:
+            bases.update(self.get_bases(base))
+        return bases
+
+    @lru_cache(maxsize=None)
+    def get_pointers(self, type_name):
+        object_type = self.object_types[type_name]
+        pointers = {}
+        for base in object_type.bases:
+            pointers.update(self.get_pointers(base))
+        bases = self.get_bases(type_name)
+        pointers.update(
+            (name, pointer)
+            for name, pointer in object_type.own_pointers.items()
+            if not self.profile.drops(name, *bases)
+        )
+        return pointers
+
+    def get_owner_paths(self, type_name, visited=frozenset()):
+        """The paths that lead from an object of the given type to its
+        module, e.g. for keywords: .<keywords[IS ast::Call]._module"""
+
+        pointers = self.get_pointers(type_name)
+        if type_name == self.wrap("Module"):
+            return [""]
+        elif "_module" in pointers:
+            return ["._module"]
+
+        paths = []
+        bases = self.get_bases(type_name)
+        visited = visited | {type_name}
+        for owner, owner_type in self.object_types.items():
+            if owner_type.is_abstract or owner in visited:
+                continue
+
+            for pointer in self.get_pointers(owner).values():
+                if pointer.is_link and pointer.target in bases:
+                    paths.extend(
+                        f".<{pointer.name}"
+                        f"[IS {self.NAMESPACE}::{owner}]" + path
+                        for path in self.get_owner_paths(owner, visited)
+                    )
+        return paths
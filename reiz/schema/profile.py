@@ -0,0 +1,112 @@
+import re
+from dataclasses import dataclass
+from pathlib import PurePosixPath
+from typing import FrozenSet, Optional
+
+DEFAULT_PROFILE = "full"
+
+# Fields that the insertion, the result fetching and the compiled
+# queries (references compare _tag, and META(parent=...) matches
+# against _parent_types) depend on
+PROTECTED_FIELDS = frozenset(
+    (
+        "lineno",
+        "col_offset",
+        "end_lineno",
+        "end_col_offset",
+        "filename",
+        "project",
+        "checksum",
+        "body",
+        "_module",
+        "_tag",
+        "_parent_types",
+    )
+)
+
+_TEST_FILE = re.compile(r"^(test_.*|.*_test|conftest)\.py$")
+_TEST_DIRECTORIES = frozenset(("test", "tests", "testing"))
+
+# Markers that are placed on top of the generated files, by
+# protoc, Cython, Qt (pyuic), SWIG, etc.
+_GENERATED_MARKER = re.compile(
+    r"@generated|do not edit|generated by|autogenerated|auto-generated",
+    re.IGNORECASE,
+)
+_GENERATED_HEADER_LINES = 10
+
+# Lines longer than this are only seen in minified (or embedded) sources
+_MINIFIED_LINE_LENGTH = 1000
+
+
+@dataclass(frozen=True)
+class IndexingProfile:
+    """A named selection of what is stored in the index. The dropped
+    fields are either bare (type_comment) or qualified with the name of
+    a type (Name.ctx) or a base type (expr.ctx)."""
+
+    name: str = DEFAULT_PROFILE
+    dropped_fields: FrozenSet[str] = frozenset()
+    skip_tests: bool = False
+    skip_generated: bool = False
+    max_depth: Optional[int] = None
+
+    def __post_init__(self):
+        for dropped_field in self.dropped_fields:
+            _, _, name = dropped_field.rpartition(".")
+            if name in PROTECTED_FIELDS:
+                raise ValueError(
+                    f"{dropped_field!r} can't be dropped by the "
+                    f"{self.name!r} profile"
+                )
+
+    @classmethod
+    def from_config(cls, name, options):
+        return cls(
+            name,
+            dropped_fields=frozenset(options.get("dropped_fields", ())),
+            skip_tests=options.get("skip_tests", False),
+            skip_generated=options.get("skip_generated", False),
+            max_depth=options.get("max_depth"),
+        )
+
+    def drops(self, field, *type_names):
+        if field in self.dropped_fields:
+            return True
+        return any(
+            f"{type_name}.{field}" in self.dropped_fields
+            for type_name in type_names
+        )
+
+    def drops_node_field(self, node, field):
+        return self.drops(field, node.kind_name, node.base_name)
+
+    def skips_filename(self, filename):
+        if not self.skip_tests:
+            return False
+
+        path = PurePosixPath(filename)
+        return bool(_TEST_FILE.match(path.name)) or any(
+            part in _TEST_DIRECTORIES for part in path.parts[:-1]
+        )
+
+    def skips_source(self, source):
+        if not self.skip_generated:
+            return False
+
+        lines = source.splitlines()
+        header = "\n".join(lines[:_GENERATED_HEADER_LINES])
+        return bool(_GENERATED_MARKER.search(header)) or any(
+            len(line) > _MINIFIED_LINE_LENGTH for line in lines
+        )
+
+
+def get_profile(config, name=None):
+    indexing = config.indexing
+    name = name or indexing.profile
+    if name == DEFAULT_PROFILE:
+        return IndexingProfile()
+    elif name not in indexing.profiles:
+        raise ValueError(f"Unknown indexing profile: {name!r}")
+    else:
+        return IndexingProfile.from_config(name, indexing.profiles[name])
@@ -0,0 +1,242 @@
+import json
+import struct
+import time
+import warnings
+import zlib
+from argparse import ArgumentParser
+from concurrent import futures
+from dataclasses import asdict
+from functools import lru_cache
+from pathlib import Path
+
+from reiz.config import config
+from reiz.sampling import SamplingData, load_dataset
+from reiz.serialization.context import GlobalContext
+from reiz.serialization.insert import ensure_projects, record, write_file
+from reiz.serialization.manifest import hash_file
+from reiz.serialization.serializer import (
+    ModulePayload,
+    PreparedQuery,
+    prepare_module,
+)
+from reiz.serialization.statistics import Insertion, Statistics
+from reiz.utilities import STATIC_DIR, _available_cores, logger
+
+# A bundle is a sequence of length-prefixed, zlib compressed JSON records
+# where the first one is the header (with the project itself) and the rest
+# are the prepared queries (see prepare_module) of each of its files. They
+# are built without any database access, and then streamed into the
+# database by the loader.
+#
+# The records hold the rendered queries rather than the nodes, so a bundle
+# can only be loaded with the same templates and the same schema that it
+# was built with. Both are recorded in the header, and checked on load.
+BUNDLE_SUFFIX = ".bundle"
+
+# Bump it whenever the format of the records or the queries changes
+BUNDLE_VERSION = 2
+
+_LENGTH = struct.Struct(">I")
+
+
+def write_record(stream, data):
+    record = zlib.compress(json.dumps(data).encode())
+    stream.write(_LENGTH.pack(len(record)))
+    stream.write(record)
+
+
+def read_records(stream):
+    while header := stream.read(_LENGTH.size):
+        (length,) = _LENGTH.unpack(header)
+        yield json.loads(zlib.decompress(stream.read(length)))
+
+
+@lru_cache(maxsize=None)
+def get_schema_digest():
+    return hash_file(STATIC_DIR / "Python-reiz.esdl")
+
+
+def make_header(project):
+    return {
+        "version": BUNDLE_VERSION,
+        "schema": get_schema_digest(),
+        "project": asdict(project),
+    }
+
+
+def read_header(bundle_path, records):
+    header = next(records)
+    if (header.get("version"), header.get("schema")) != (
+        BUNDLE_VERSION,
+        get_schema_digest(),
+    ):
+        raise ValueError(
+            f"{bundle_path} was built with a different version of the"
+            " queries or the schema, it needs to be built again"
+        )
+    return SamplingData(**header["project"])
+
+
+def load_payload(data):
+    return ModulePayload(
+        shell=PreparedQuery(**data["shell"]),
+        batches=[PreparedQuery(**batch) for batch in data["batches"]],
+        update=PreparedQuery(**data["update"]),
+        total_nodes=data["total_nodes"],
+    )
+
+
+def build_bundle(project, bundle_dir, properties):
+    """Prepare all the files of the given project into a single bundle.
+    This runs on a separate process, and doesn't access the database."""
+
+    stats = Statistics()
+    project_ctx = GlobalContext(properties).new_child(project, None)
+    bundle_path = bundle_dir / (project.name + BUNDLE_SUFFIX)
+    with open(bundle_path, "wb") as stream:
+        write_record(stream, make_header(project))
+        for file in project_ctx.path.glob("**/*.py"):
+            file_ctx = project_ctx.new_child(file)
+            try:
+                tree = file_ctx.as_ast()
+            except Exception:
+                logger.exception("%r couldn't be prepared", file_ctx.filename)
+                stats[Insertion.FAILED] += 1
+                continue
+
+            if tree is None:
+                stats[Insertion.SKIPPED] += 1
+                continue
+
+            payload = prepare_module(tree, file_ctx)
+            write_record(
+                stream,
+                {"filename": file_ctx.filename, "payload": asdict(payload)},
+            )
+            stats[Insertion.INSERTED] += 1
+            stats[Insertion.NODES] += payload.total_nodes
+
+    return stats
+
+
+def build_bundles(dataset_path, bundle_dir, processes=None, **properties):
+    bundle_dir.mkdir(parents=True, exist_ok=True)
+
+    stats = Statistics()
+    start = time.perf_counter()
+    with futures.ProcessPoolExecutor(max_workers=processes) as executor:
+        tasks = {}
+        for project in load_dataset(dataset_path):
+            task = executor.submit(
+                build_bundle, project, bundle_dir, properties
+            )
+            tasks[task] = project
+
+        for task in futures.as_completed(tasks):
+            project = tasks[task]
+            try:
+                project_stats = task.result()
+            except Exception:
+                logger.exception("%r couldn't be bundled", project.name)
+                continue
+
+            logger.info("%s: %r", project.name, project_stats)
+            stats.update(project_stats)
+
+    logger.info(
+        "%d files (%d nodes) have been bundled in %.2f seconds",
+        stats[Insertion.INSERTED],
+        stats[Insertion.NODES],
+        time.perf_counter() - start,
+    )
+    return stats
+
+
+def _iter_bundle_files(bundle_paths, global_ctx):
+    for bundle_path in bundle_paths:
+        with open(bundle_path, "rb") as stream:
+            records = read_records(stream)
+            project = read_header(bundle_path, records)
+            ensure_projects([project], global_ctx)
+
+            project_ctx = global_ctx.new_child(project, None)
+            for data in records:
+                file_ctx = project_ctx.new_child(
+                    config.data.path / data["filename"]
+                )
+                yield file_ctx, data["payload"]
+
+
+def load_bundles(bundle_dir, max_workers=None, **properties):
+    """Stream the prepared bundles into the database, through a pool
+    of writer threads."""
+
+    global_ctx = GlobalContext(properties)
+    max_workers = max_workers or (_available_cores() // 2) + 1
+    max_pending = max_workers * 2
+    bundle_paths = sorted(bundle_dir.glob("*" + BUNDLE_SUFFIX))
+    for bundle_path in bundle_paths:
+        # Refuse the stale bundles before inserting anything
+        with open(bundle_path, "rb") as stream:
+            read_header(bundle_path, read_records(stream))
+
+    stats = Statistics()
+    start = time.perf_counter()
+    with global_ctx:
+        with futures.ThreadPoolExecutor(max_workers=max_workers) as writers:
+            pending = {}
+            for file_ctx, data in _iter_bundle_files(bundle_paths, global_ctx):
+                if global_ctx.apply_constraints(stats):
+                    break
+
+                if file_ctx.is_cached():
+                    stats[Insertion.CACHED] += 1
+                    continue
+
+                task = writers.submit(
+                    write_file, file_ctx, load_payload(data), global_ctx.pool
+                )
+                pending[task] = file_ctx
+                while len(pending) >= max_pending:
+                    _collect(pending, stats, futures.FIRST_COMPLETED)
+
+            _collect(pending, stats, futures.ALL_COMPLETED)
+
+    stats.report(time.perf_counter() - start)
+    return stats
+
+
+def _collect(pending, stats, return_when):
+    done, _ = futures.wait(pending, return_when=return_when)
+    for task in done:
+        record(stats, task.result(), pending.pop(task))
+
+
+def main():
+    parser = ArgumentParser()
+    subparsers = parser.add_subparsers(dest="action", required=True)
+
+    build_parser = subparsers.add_parser("build")
+    build_parser.add_argument("dataset_path", type=Path)
+    build_parser.add_argument("bundle_dir", type=Path)
+    build_parser.add_argument("-p", "--processes", type=int)
+    build_parser.add_argument("--fast", action="store_true", dest="fast_mode")
+
+    load_parser = subparsers.add_parser("load")
+    load_parser.add_argument("bundle_dir", type=Path)
+    load_parser.add_argument("-w", "--workers", type=int, dest="max_workers")
+    load_parser.add_argument("--limit", type=int, dest="hard_limit")
+
+    options = vars(parser.parse_args())
+    action = options.pop("action")
+    with warnings.catch_warnings():
+        warnings.filterwarnings("ignore", category=SyntaxWarning)
+        warnings.filterwarnings("ignore", category=DeprecationWarning)
+        if action == "build":
+            build_bundles(**options)
+        else:
+            load_bundles(**options)
+
+
+if __name__ == "__main__":
+    main()
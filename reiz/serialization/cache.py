@@ -1,15 +1,77 @@
+import sys
+import threading
+from bisect import bisect_left
+from contextlib import contextmanager
 from dataclasses import dataclass, field
-from typing import Set
+from typing import Dict, FrozenSet, Optional, Set, Tuple
 
-from reiz.database import get_new_connection
+from reiz.database import ConnectionPool, get_new_connection
 from reiz.ir import IR
 
+_FILENAME_QUERIES = (
+    "module.filenames_by_project",
+    "module_alias.filenames_by_project",
+)
+
+
+@dataclass
+class FileIndex:
+    """Filenames of a single project (relative to the project directory),
+    stored as a sorted tuple of interned strings. The changes that are made
+    after it has been loaded (or before, if it is not loaded yet) are kept
+    in small overlay sets."""
+
+    names: Optional[Tuple[str, ...]] = None
+    added: Set[str] = field(default_factory=set)
+    removed: Set[str] = field(default_factory=set)
+
+    @classmethod
+    def from_names(cls, names):
+        return cls(tuple(sorted(sys.intern(name) for name in names)))
+
+    def is_loaded(self):
+        return self.names is not None
+
+    def load(self, index):
+        self.names = index.names
+
+    def add(self, name):
+        self.removed.discard(name)
+        self.added.add(name)
+
+    def discard(self, name):
+        self.added.discard(name)
+        self.removed.add(name)
+
+    def __contains__(self, name):
+        if name in self.added:
+            return True
+        elif name in self.removed:
+            return False
+
+        position = bisect_left(self.names, name)
+        return position < len(self.names) and self.names[position] == name
+
+    def __iter__(self):
+        for name in self.names:
+            if name not in self.removed and name not in self.added:
+                yield name
+        yield from self.added
+
 
 @dataclass
 class Cache:
-    files: Set[str] = field(default_factory=set)
+    """Names of the inserted projects, and the filenames of the inserted
+    modules. The filenames are loaded lazily, one project at a time, when
+    they are first needed."""
+
     projects: Set[str] = field(default_factory=set)
 
+    _files: Dict[str, FileIndex] = field(default_factory=dict)
+    _synced_projects: FrozenSet[str] = frozenset()
+    _pool: Optional[ConnectionPool] = None
+    _lock: threading.Lock = field(default_factory=threading.Lock)
+
     @classmethod
     def from_db(cls):
         cache = cls()
@@ -17,9 +79,77 @@ class Cache:
             cache.sync(connection)
         return cache
 
-    def sync(self, connection):
-        query_set = connection.query(IR.construct_prepared("module.filenames"))
-        self.files = {module.filename for module in query_set}
-
+    def sync(self, connection, pool=None):
         query_set = connection.query(IR.construct_prepared("project.names"))
         self.projects = {project.name for project in query_set}
+        self._synced_projects = frozenset(self.projects)
+        self._files.clear()
+        self._pool = pool
+
+    def add_file(self, filename):
+        project, name = _split(filename)
+        with self._lock:
+            self._get_index(project).add(name)
+
+    def discard_file(self, filename):
+        project, name = _split(filename)
+        with self._lock:
+            self._get_index(project).discard(name)
+
+    def has_file(self, filename):
+        project, name = _split(filename)
+        return name in self.project_files(project)
+
+    def project_files(self, project):
+        with self._lock:
+            index = self._get_index(project)
+            if index.is_loaded():
+                return index
+
+        if project in self._synced_projects:
+            with self._new_connection() as connection:
+                loaded_index = self._load(connection, project)
+        else:
+            # Projects that are inserted after the sync can only
+            # have the files that are added to the overlay.
+            loaded_index = FileIndex(names=())
+
+        with self._lock:
+            if not index.is_loaded():
+                index.load(loaded_index)
+        return index
+
+    def iter_filenames(self, project):
+        for name in self.project_files(project):
+            yield f"{project}/{name}"
+
+    def _get_index(self, project):
+        if project not in self._files:
+            self._files[project] = FileIndex()
+        return self._files[project]
+
+    def _load(self, connection, project):
+        # Files that are deduplicated are only recorded as aliases
+        filenames = []
+        for query in _FILENAME_QUERIES:
+            query_set = connection.query(
+                IR.construct_prepared(query), project=project
+            )
+            filenames.extend(module.filename for module in query_set)
+        return FileIndex.from_names(
+            _split(filename)[1] for filename in filenames
+        )
+
+    @contextmanager
+    def _new_connection(self):
+        if self._pool is None:
+            with get_new_connection() as connection:
+                yield connection
+        else:
+            with self._pool.new_connection() as connection:
+                yield connection
+
+
+def _split(filename):
+    project, _, name = filename.partition("/")
+    return project, name
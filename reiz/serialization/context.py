@@ -1,6 +1,5 @@
 import math
 import tokenize
-import uuid
 from contextlib import contextmanager
 from dataclasses import dataclass, field
 from functools import cached_property
@@ -10,14 +9,24 @@ from typing import Any, Dict, List
 from reiz.config import config
 from reiz.database import ConnectionPool as Pool
 from reiz.database import DatabaseConnection
+from reiz.ir import Schema
 from reiz.sampling import SamplingData
 from reiz.serialization.cache import Cache
+from reiz.serialization.dedup import ContentIndex
+from reiz.serialization.journal import JOURNAL_FILE, Journal
+from reiz.serialization.manifest import MANIFEST_FILE, Manifest, hash_file
 from reiz.serialization.statistics import Insertion
-from reiz.serialization.transformers import ast, prepare_ast
+from reiz.serialization.templates import InsertionPlan
+from reiz.serialization.transformers import ast, get_depth, prepare_ast
 from reiz.utilities import picker
 
 _AVG_CHARS = 80 * 80
 
+# Files larger than this (in bytes) are inserted in chunks (if enabled),
+# where the top-level statements are planned and written in groups, and
+# each query of the plan has its own transaction (see write_chunked).
+_CHUNKED_SIZE = 16 * _AVG_CHARS
+
 
 class Context:
     def as_ast(self):
@@ -33,6 +42,9 @@ class Context:
     def enter_node(self, node):
         yield
 
+    def flush_plan(self):
+        return InsertionPlan()
+
     def cache(self):
         return None
 
@@ -47,18 +59,30 @@ class GlobalContext(Context):
 
     properties: Dict[str, Any] = field(default_factory=dict)
     db_cache: Cache = field(default_factory=Cache)
+    content_index: ContentIndex = field(default_factory=ContentIndex)
     _pool: Pool = field(default_factory=Pool)
     _is_pool_available: bool = False
 
     def __enter__(self):
         self._is_pool_available = True
         with self._pool.new_connection() as connection:
-            self.db_cache.sync(connection)
+            self.db_cache.sync(connection, self._pool)
+        self.content_index.sync(self.db_cache)
+        if not (
+            self.properties.get("resume")
+            and self.journal.resume(
+                self.db_cache, self.properties.get("retry_dead_letters")
+            )
+        ):
+            self.journal.start()
+        self.manifest.load()
         return self
 
     def __exit__(self, *args):
         self._is_pool_available = False
         self._pool.close()
+        self.journal.close()
+        self.manifest.save()
 
     def new_child(self, project, *args, **kwargs):
         return ProjectContext(project, self, *args, **kwargs)
@@ -76,10 +100,39 @@ class GlobalContext(Context):
     def limit(self):
         return self.properties.get("hard_limit") or math.inf
 
+    @cached_property
+    def memory_budget(self):
+        if memory_budget := self.properties.get("memory_budget"):
+            return memory_budget * 2**20
+        else:
+            return math.inf
+
+    @cached_property
+    def journal(self):
+        if self.properties.get("journal") or self.properties.get("resume"):
+            return Journal(config.data.path / JOURNAL_FILE)
+        else:
+            return Journal()
+
+    @cached_property
+    def manifest(self):
+        if self.properties.get("incremental"):
+            return Manifest(config.data.path / MANIFEST_FILE)
+        else:
+            return Manifest()
+
 
 @dataclass
 class ProjectContext(
-    Context, picker("global_ctx"), inherits=("db_cache", "properties")
+    Context,
+    picker("global_ctx"),
+    inherits=(
+        "db_cache",
+        "content_index",
+        "journal",
+        "manifest",
+        "properties",
+    ),
 ):
     project: SamplingData
     global_ctx: GlobalContext
@@ -102,8 +155,16 @@ class ProjectContext(
     def limit(self):
         return self.properties.get("max_files") or math.inf
 
+    @cached_property
+    def group_size(self):
+        return self.properties.get("group_size") or 1
+
     def cache(self):
         self.db_cache.projects.add(self.project.name)
+        self.journal.record_project(self.project.name)
+
+    def is_finished(self):
+        return self.project.name in self.journal.finished_projects
 
     def is_cached(self):
         return self.project.name in self.db_cache.projects
@@ -113,31 +174,66 @@ class ProjectContext(
 class FileContext(
     Context,
     picker("project_ctx"),
-    inherits=("db_cache", "connection", "properties"),
+    inherits=(
+        "db_cache",
+        "content_index",
+        "connection",
+        "journal",
+        "manifest",
+        "properties",
+    ),
 ):
     file: Path
     project_ctx: ProjectContext
 
     stack: List[ast.AST] = field(default_factory=list)
-    reference_pool: List[uuid.UUID] = field(default_factory=list)
+    plan: InsertionPlan = field(default_factory=InsertionPlan)
+    total_nodes: int = 0
 
     def as_ast(self):
+        if self.apply_constraints(self.size):
+            return None
+
+        if self.skips_filename():
+            return None
+
+        profile = Schema.profile
+
         with tokenize.open(self.file) as stream:
             source = stream.read()
 
-        if self.apply_constraints(len(source)):
+        if profile.skips_source(source):
+            return None
+
+        tree = ast.parse(source)
+        if (
+            profile.max_depth is not None
+            and get_depth(tree) > profile.max_depth
+        ):
             return None
 
-        tree = prepare_ast(ast.parse(source))
+        tree = prepare_ast(tree)
         tree.project = self.project_ctx.as_ast()
         tree.filename = self.filename
+        if self.is_deduplicated() or self.manifest:
+            # Only the deduplication and the incremental mode need
+            # the content hash, so the rest never reads the file twice.
+            tree.checksum = self.checksum
         return tree
 
     def apply_constraints(self, statistics):
         return statistics >= self.limit
 
-    def new_reference(self, object_id):
-        self.reference_pool.append(object_id)
+    def skips_filename(self):
+        return Schema.profile.skips_filename(self.filename)
+
+    def new_insertion(self, template, record, children):
+        self.total_nodes += 1
+        return self.plan.add(template, record, children)
+
+    def flush_plan(self):
+        plan, self.plan = self.plan, InsertionPlan()
+        return plan
 
     @contextmanager
     def enter_node(self, node):
@@ -158,15 +254,34 @@ class FileContext(
     def filename(self):
         return str(self.file.relative_to(config.data.path))
 
+    @cached_property
+    def checksum(self):
+        return hash_file(self.file)
+
+    @cached_property
+    def size(self):
+        return self.file.stat().st_size
+
     @cached_property
     def limit(self):
-        if self.properties.get("fast_mode"):
+        # Large files are not skipped when they can be inserted in chunks
+        if self.properties.get("fast_mode") and not self.properties.get(
+            "chunked"
+        ):
             return _AVG_CHARS
         else:
             return math.inf
 
+    def is_deduplicated(self):
+        return self.properties.get("deduplicate")
+
+    def is_chunked(self):
+        return self.properties.get("chunked") and self.size >= _CHUNKED_SIZE
+
     def cache(self):
-        self.db_cache.files.add(self.filename)
+        self.db_cache.add_file(self.filename)
+        if self.manifest:
+            self.manifest.record(self.filename, self.file, self.checksum)
 
     def is_cached(self):
-        return self.filename in self.db_cache.files
+        return self.db_cache.has_file(self.filename)
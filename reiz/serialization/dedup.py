@@ -0,0 +1,107 @@
+import threading
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Any, Dict
+
+from reiz.ir import Schema
+
+_MODULE = Schema.wrap("Module", with_prefix=True)
+_ALIAS = Schema.wrap("module_alias", with_prefix=True)
+_PROJECT = Schema.wrap("project", with_prefix=True)
+
+FIND_QUERY = (
+    f"SELECT {_MODULE} {{ id }} FILTER .checksum = <str>$checksum LIMIT 1"
+)
+ALIAS_QUERY = (
+    f"UPDATE {_MODULE} FILTER .id = <uuid>$module SET {{ "
+    f"aliases += (INSERT {_ALIAS} {{ filename := <str>$filename, "
+    f"project := (SELECT {_PROJECT} FILTER .name = <str>$project LIMIT 1) "
+    "}) }"
+)
+
+_FILENAMES = ".filename IN array_unpack(<array<str>>$filenames)"
+
+# The aliases that would be lost alongside with the given modules
+ORPHANS_QUERY = (
+    f"SELECT {_ALIAS} {{ filename }} "
+    f"FILTER .<aliases[IS {_MODULE}]{_FILENAMES}"
+)
+
+# Aliases are unlinked from their modules before being deleted
+UNLINK_QUERY = (
+    f"UPDATE {_MODULE} FILTER .aliases{_FILENAMES} SET {{ "
+    f"aliases -= (SELECT .aliases FILTER {_FILENAMES}) }}"
+)
+DELETE_QUERY = f"DELETE {_ALIAS} FILTER {_FILENAMES}"
+
+
+def insert_alias(module_id, filename, project, connection):
+    return connection.query_one(
+        ALIAS_QUERY, module=module_id, filename=filename, project=project
+    )
+
+
+def find_orphaned_aliases(filenames, connection):
+    query_set = connection.query(ORPHANS_QUERY, filenames=filenames)
+    return [alias.filename for alias in query_set]
+
+
+def delete_aliases(filenames, connection):
+    connection.query(UNLINK_QUERY, filenames=filenames)
+    return len(connection.query(DELETE_QUERY, filenames=filenames))
+
+
+@dataclass
+class _Claim:
+    lock: threading.Lock = field(default_factory=threading.Lock)
+    holders: int = 0
+
+
+@dataclass
+class ContentIndex:
+    """Checksums of the inserted modules, for inserting each unique
+    content once (the rest are recorded as aliases of that module).
+
+    The modules that are inserted in this run are kept in the memory,
+    and the database is only searched when it wasn't empty before the
+    run. Files with the same content are serialized through `claim`,
+    so that only one of them is inserted. Claims only live as long as
+    there is a file that holds (or waits for) them."""
+
+    modules: Dict[str, Any] = field(default_factory=dict)
+    is_complete: bool = False
+
+    _claims: Dict[str, _Claim] = field(default_factory=dict)
+    _lock: threading.Lock = field(default_factory=threading.Lock)
+
+    def sync(self, cache):
+        self.modules.clear()
+        self.is_complete = not cache.projects
+
+    @contextmanager
+    def claim(self, checksum):
+        with self._lock:
+            claim = self._claims.setdefault(checksum, _Claim())
+            claim.holders += 1
+        try:
+            with claim.lock:
+                yield
+        finally:
+            with self._lock:
+                claim.holders -= 1
+                if claim.holders == 0:
+                    del self._claims[checksum]
+
+    def add(self, checksum, module_id):
+        with self._lock:
+            self.modules[checksum] = module_id
+
+    def find(self, checksum, connection):
+        with self._lock:
+            if checksum in self.modules or self.is_complete:
+                return self.modules.get(checksum)
+
+        for module in connection.query(FIND_QUERY, checksum=checksum):
+            self.add(checksum, module.id)
+            return module.id
+        return None
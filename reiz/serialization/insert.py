@@ -1,148 +1,639 @@
-import itertools
+import time
 import warnings
 from argparse import ArgumentParser
 from collections import deque
 from concurrent import futures
+from contextlib import suppress
 from functools import partial
 from pathlib import Path
 
-from reiz.database import InternalDatabaseError
-from reiz.ir import IR, Schema
+from reiz.database import InternalDatabaseError, is_transient_error
 from reiz.sampling import load_dataset
 from reiz.serialization.context import GlobalContext
-from reiz.serialization.serializer import apply_ast
+from reiz.serialization.dedup import (
+    delete_aliases,
+    find_orphaned_aliases,
+    insert_alias,
+)
+from reiz.serialization.memory import MemoryTracer, estimate_footprint
+from reiz.serialization.scheduler import WorkQueue
+from reiz.serialization.serializer import (
+    apply_ast,
+    apply_module,
+    apply_payload,
+    delete_modules,
+    insert_ast,
+    prepare_module,
+    prepare_shell,
+    prepare_update,
+)
 from reiz.serialization.statistics import Insertion, Statistics
+from reiz.serialization.templates import MODULE_REFERENCE
+from reiz.serialization.throttle import Throttle
 from reiz.utilities import _available_cores, guarded, logger
 
+# The maximum amount of nodes that would be inserted in a
+# single transaction when multiple files are grouped together.
+GROUP_NODE_LIMIT = 25_000
 
-@guarded(Insertion.FAILED, ignored_exceptions=(InternalDatabaseError,))
-def insert_file(context):
-    if context.is_cached():
-        return Insertion.CACHED
+# The maximum amount of nodes that are planned at once while
+# inserting a large file in chunks (see write_chunked).
+CHUNK_NODE_LIMIT = 10_000
 
-    if not (tree := context.as_ast()):
-        return Insertion.SKIPPED
+# Transactions that fail with a transient error (serialization
+# failures, deadlocks, connection errors) are retried after
+# RETRY_DELAY, 2 * RETRY_DELAY, 4 * RETRY_DELAY, ... seconds.
+MAX_RETRIES = 4
+RETRY_DELAY = 0.5
+
+
+def retry_delays():
+    for attempt in range(MAX_RETRIES):
+        yield RETRY_DELAY * 2**attempt
+    yield None
+
+
+def run_transaction(connection, filename, function, *args, **kwargs):
+    for delay in retry_delays():
+        try:
+            with connection.transaction():
+                return function(*args, **kwargs)
+        except Exception as error:
+            if delay is None or not is_transient_error(error):
+                raise
+
+            logger.warning(
+                "%r failed with %r, retrying in %.1f seconds",
+                filename,
+                error,
+                delay,
+            )
+            time.sleep(delay)
+
+
+def write_payload(payload, connection, filename):
+    return run_transaction(
+        connection, filename, apply_payload, payload, connection
+    )
+
+
+def plan_groups(children, context):
+    # Plan the top-level statements until the plan reaches the
+    # CHUNK_NODE_LIMIT, and yield them (alongside with their fields)
+    # so that they are written before the next ones are planned.
+    group = []
+    for field, items in children.items():
+        for item in items:
+            group.append((field, insert_ast(item, context)))
+            if len(context.plan) >= CHUNK_NODE_LIMIT:
+                yield group
+                group = []
+    if group:
+        yield group
 
-    with context.connection.transaction():
-        module = apply_ast(tree, context)
-        module_select = IR.select(
-            tree.kind_name, filters=IR.object_ref(module), limit=1
+
+def write_plan(context, arguments):
+    # Execute the queries of the current plan, and return the ids of
+    # the nodes that are not referenced by any other node in it.
+    ids = {}
+    for batch in context.flush_plan().iter_queries():
+        run_transaction(
+            context.connection,
+            context.filename,
+            batch.execute,
+            context.connection.query,
+            ids,
+            **arguments,
         )
+        batch.release(ids)
+    return ids
+
+
+def write_chunked(tree, context):
+    """Insert the module shell, each query of the insertion plan and the
+    final update (which links the body to the module) in separate
+    transactions. If any of them fails, the module is deleted.
 
-        update_filter = IR.filter(
-            IR.attribute(None, "id"),
-            IR.call(
-                "array_unpack", [IR.cast("array<uuid>", IR.variable("ids"))]
-            ),
-            "IN",
+    The top-level statements are planned and written in groups of about
+    CHUNK_NODE_LIMIT nodes (a larger statement is a group by itself), so
+    only a single group is planned at a time and every transaction is
+    bounded by the query limits. Only the ids of the top-level statements
+    are kept between the groups, for the final update."""
+
+    connection, filename = context.connection, context.filename
+    shell, children = prepare_shell(tree, context)
+    module = run_transaction(
+        connection, filename, shell.execute, connection.query_one
+    )
+
+    arguments = {MODULE_REFERENCE: module.id}
+    try:
+        top_level_ids = {}
+        nodes = {field: [] for field in children}
+        for group in plan_groups(children, context):
+            ids = write_plan(context, arguments)
+            for field, node in group:
+                # Node numbers restart with each plan, so the top-level
+                # statements are re-numbered for the final update.
+                top_level_ids[len(top_level_ids)] = ids.pop(node)
+                nodes[field].append(len(top_level_ids) - 1)
+
+        run_transaction(
+            connection,
+            filename,
+            prepare_update(nodes).execute,
+            connection.query,
+            top_level_ids,
+            **arguments,
         )
-        for base_type in Schema.module_annotated_types:
-            update = IR.update(
-                base_type.kind_name,
-                filters=update_filter,
-                assignments={"_module": module_select},
-            )
-            context.connection.query(
-                IR.construct(update), ids=context.reference_pool
-            )
+    except BaseException:
+        logger.info("removing the partially inserted %r", filename)
+        with suppress(Exception):
+            delete_modules([filename], connection)
+        raise
+    return module
+
+
+def write_alias(module_id, context, connection):
+    run_transaction(
+        connection,
+        context.filename,
+        insert_alias,
+        module_id,
+        context.filename,
+        context.project_ctx.project.name,
+        connection,
+    )
+    logger.info("%r has been inserted as an alias", context.filename)
+    context.cache()
+    return Insertion.DEDUPLICATED
+
+
+def deduplicate(context, connection, inserter, *args):
+    """Insert the file as an alias if a module with the same content
+    is already inserted, otherwise call the given inserter."""
+
+    if not context.is_deduplicated():
+        return inserter(*args)
+
+    # The content doesn't matter for the files that the profile skips
+    # by their names, so they aren't recorded as aliases either.
+    if context.skips_filename():
+        return Insertion.SKIPPED
+
+    with context.content_index.claim(context.checksum):
+        if module_id := context.content_index.find(
+            context.checksum, connection
+        ):
+            return write_alias(module_id, context, connection)
+        return inserter(*args)
+
 
+def commit_file(context, module):
     logger.info("%r has been inserted successfully", context.filename)
     context.cache()
+    if context.is_deduplicated():
+        context.content_index.add(context.checksum, module.id)
     return Insertion.INSERTED
 
 
-def insert_project(project, *, global_ctx):
-    with global_ctx.pool.new_connection() as connection:
-        project_ctx = global_ctx.new_child(project, connection)
-        if not project_ctx.is_cached():
-            apply_ast(project_ctx.as_ast(), project_ctx)
-            project_ctx.cache()
-
-        stats = Statistics()
-        for file in project_ctx.path.glob("**/*.py"):
-            if project_ctx.apply_constraints(stats):
-                break
+def _insert_file(context):
+    if not (tree := context.as_ast()):
+        return Insertion.SKIPPED
 
-            file_ctx = project_ctx.new_child(file)
-            stats[insert_file(file_ctx)] += 1
+    if context.is_chunked():
+        module = write_chunked(tree, context)
+    else:
+        payload = prepare_module(tree, context)
+        module = write_payload(payload, context.connection, context.filename)
+    return commit_file(context, module)
 
-    return stats
 
+@guarded(Insertion.FAILED, ignored_exceptions=(InternalDatabaseError,))
+def insert_file(context):
+    if context.is_cached():
+        return Insertion.CACHED
+
+    return deduplicate(context, context.connection, _insert_file, context)
+
+
+def prepare_group(contexts, stats):
+    for context in contexts:
+        if context.is_cached():
+            record(stats, Insertion.CACHED, context)
+            continue
+
+        if context.is_chunked() or context.is_deduplicated():
+            # Chunked files can't be a part of a larger transaction, and
+            # the duplicates are only detected one file at a time.
+            record(stats, insert_file(context), context)
+            continue
+
+        try:
+            tree = context.as_ast()
+        except Exception:
+            logger.exception("%r couldn't be parsed", context.filename)
+            record(stats, Insertion.FAILED, context)
+            continue
 
-def _execute_tasks(tasks, projects, create_tasks, global_ctx):
-    global_stats = Statistics()
-    while tasks:
-        done, _ = futures.wait(tasks, return_when=futures.FIRST_COMPLETED)
-        total_completed = len(done)
+        if tree is None:
+            record(stats, Insertion.SKIPPED, context)
+        else:
+            yield context, tree
 
-        for task in done:
-            project, stats = tasks.pop(task), task.result()
-            global_stats.update(stats)
-            if stats[Insertion.INSERTED] == 0:
-                projects.remove(project)
-            logger.info("%s: %r", project.name, stats)
 
-        if global_ctx.apply_constraints(global_stats):
-            for task in tasks:
-                task.cancel()
+def insert_group(contexts):
+    """Insert the given files through a single transaction (as
+    long as the total amount of nodes is below GROUP_NODE_LIMIT),
+    and if it fails fall back to a transaction per file."""
+
+    stats = Statistics()
+    group = list(prepare_group(contexts, stats))
+    while group:
+        inserted = []
+        try:
+            with group[0][0].connection.transaction():
+                for context, tree in group:
+                    module = apply_module(tree, context)
+                    inserted.append((context, module))
+                    if (
+                        sum(context.total_nodes for context, _ in inserted)
+                        >= GROUP_NODE_LIMIT
+                    ):
+                        break
+        except Exception:
+            logger.info(
+                "group of %d files failed, falling back to the "
+                "individual insertions",
+                len(group),
+            )
+            for context, _ in group:
+                # The trees are already consumed by the failed
+                # transaction, so start from a fresh state.
+                context = context.project_ctx.new_child(context.file)
+                record(stats, insert_file(context), context)
             break
 
-        projects.rotate(total_completed)
-        tasks.update(create_tasks(total_completed, tasks.values()))
-    return global_stats
+        for context, module in inserted:
+            record(stats, commit_file(context, module), context)
+        group = group[len(inserted) :]
+
+    return stats
+
 
+def update_stats(stats, status, context):
+    stats[status] += 1
+    if status is Insertion.INSERTED:
+        stats[Insertion.NODES] += context.total_nodes
 
-def _create_tasks(executor, projects, global_ctx, amount, known_tasks=()):
-    return {
-        executor.submit(
-            insert_project, project, global_ctx=global_ctx
-        ): project
-        for project in itertools.islice(projects, amount)
-        if project not in known_tasks
-    }
+
+def record(stats, status, context):
+    update_stats(stats, status, context)
+    if status is not Insertion.CACHED:
+        context.journal.record_file(context.filename, status)
+
+
+def ensure_project(project_ctx):
+    if not project_ctx.is_cached():
+        apply_ast(project_ctx.as_ast(), project_ctx)
+        project_ctx.cache()
+
+
+def _work(worker, queue, global_ctx):
+    with global_ctx.pool.new_connection() as connection:
+        while item := queue.take(worker):
+            project_ctx, files = item
+            project_ctx = global_ctx.new_child(project_ctx.project, connection)
+            contexts = [project_ctx.new_child(file) for file in files]
+
+            stats = Statistics()
+            try:
+                if project_ctx.group_size > 1:
+                    stats.update(insert_group(contexts))
+                else:
+                    for file_ctx in contexts:
+                        record(stats, insert_file(file_ctx), file_ctx)
+            finally:
+                queue.done(project_ctx, files, stats)
 
 
 def insert_projects(projects, *, max_workers=None, global_ctx=None):
+    """Insert the files of all the given projects through a work-stealing
+    scheduler (see WorkQueue), where each worker thread processes a
+    single file (or a single group of files) at a time."""
+
     if global_ctx is None:
         global_ctx = GlobalContext()
 
-    projects = deque(projects)
+    projects = list(projects)
     max_workers = max_workers or (_available_cores() // 2) + 1
-    max_active_tasks = global_ctx.properties.get("max_files", 10) * max_workers
+    start = time.perf_counter()
     with global_ctx:
-        with futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
-            create_tasks = partial(
-                _create_tasks, executor, projects, global_ctx
+        ensure_projects(projects, global_ctx)
+        remove_stale_files(projects, global_ctx)
+
+        throttle = None
+        if target_latency := global_ctx.properties.get("target_latency"):
+            throttle = Throttle(target_latency / 1000, max_workers)
+            throttle.start(global_ctx.pool)
+
+        tracer = None
+        if trace_interval := global_ctx.properties.get("trace_memory"):
+            tracer = MemoryTracer(trace_interval)
+            tracer.start()
+
+        queue = WorkQueue(global_ctx, throttle=throttle, tracer=tracer)
+        for project in projects:
+            queue.add_project(global_ctx.new_child(project, None))
+
+        try:
+            with futures.ThreadPoolExecutor(
+                max_workers=max_workers
+            ) as executor:
+                workers = [
+                    executor.submit(_work, worker, queue, global_ctx)
+                    for worker in range(max_workers)
+                ]
+                for worker in futures.as_completed(workers):
+                    worker.result()
+        finally:
+            if throttle is not None:
+                throttle.stop()
+            if tracer is not None:
+                tracer.stop()
+
+    stats = queue.stats
+    stats.report(time.perf_counter() - start)
+    return stats
+
+
+def prepare_file(project, file, properties):
+    """Read, parse and annotate the given file and construct all the
+    queries for inserting it. This runs on a separate process, so
+    it can't access to the database."""
+
+    project_ctx = GlobalContext(properties).new_child(project, None)
+    file_ctx = project_ctx.new_child(file)
+    if tree := file_ctx.as_ast():
+        return prepare_module(tree, file_ctx)
+    else:
+        return None
+
+
+def _write_file(context, payload, connection):
+    module = write_payload(payload, connection, context.filename)
+    context.total_nodes = payload.total_nodes
+    return commit_file(context, module)
+
+
+@guarded(Insertion.FAILED, ignored_exceptions=(InternalDatabaseError,))
+def write_file(context, payload, pool):
+    with pool.new_connection() as connection:
+        return deduplicate(
+            context, connection, _write_file, context, payload, connection
+        )
+
+
+def ensure_projects(projects, global_ctx):
+    with global_ctx.pool.new_connection() as connection:
+        for project in projects:
+            ensure_project(global_ctx.new_child(project, connection))
+
+
+def find_stale_files(project_ctx, inserted_files):
+    # Yield the files that are changed or removed after their insertion
+    present_files = set()
+    for file in project_ctx.path.glob("**/*.py"):
+        file_ctx = project_ctx.new_child(file)
+        present_files.add(file_ctx.filename)
+        if file_ctx.is_cached() and project_ctx.manifest.is_changed(
+            file_ctx.filename, file
+        ):
+            yield file_ctx.filename
+
+    yield from inserted_files - present_files
+
+
+def remove_stale_files(projects, global_ctx):
+    """Delete the modules of all the changed or removed files in a single
+    query, and drop them from the cache so that the changed ones can be
+    inserted again."""
+
+    if not global_ctx.manifest:
+        return None
+
+    stale_files = []
+    for project in projects:
+        project_ctx = global_ctx.new_child(project, None)
+        if project_ctx.is_finished():
+            continue
+
+        inserted_files = set(global_ctx.db_cache.iter_filenames(project.name))
+        stale_files.extend(find_stale_files(project_ctx, inserted_files))
+
+    if not stale_files:
+        return None
+
+    with global_ctx.pool.new_connection() as connection:
+        with connection.transaction():
+            # The aliases of the deleted modules are removed with them,
+            # so their files should be inserted again.
+            stale_files.extend(
+                filename
+                for filename in find_orphaned_aliases(stale_files, connection)
+                if filename not in stale_files
+            )
+            total_nodes = delete_modules(stale_files, connection)
+            total_nodes += delete_aliases(stale_files, connection)
+
+    for filename in stale_files:
+        global_ctx.db_cache.discard_file(filename)
+        global_ctx.manifest.discard(filename)
+        global_ctx.journal.record_deletion(filename)
+
+    logger.info(
+        "%d stale files (%d objects) have been deleted",
+        len(stale_files),
+        total_nodes,
+    )
+
+
+def iter_files(projects, global_ctx):
+    # Interleave the files of all projects, so that each
+    # one of them progresses at the same pace.
+    sources = deque(
+        (project_ctx, project_ctx.path.glob("**/*.py"))
+        for project_ctx in (
+            global_ctx.new_child(project, None) for project in projects
+        )
+        if not project_ctx.is_finished()
+    )
+    while sources:
+        project_ctx, files = sources.popleft()
+        if file := next(files, None):
+            sources.append((project_ctx, files))
+            yield project_ctx.new_child(file)
+
+
+def _advance_pipeline(pending, writers, global_ctx, stats):
+    done, _ = futures.wait(pending, return_when=futures.FIRST_COMPLETED)
+    for future in done:
+        file_ctx, is_written = pending.pop(future)
+        if is_written:
+            record(stats, future.result(), file_ctx)
+        elif future.exception():
+            logger.error(
+                "%r couldn't be prepared: %r",
+                file_ctx.filename,
+                future.exception(),
+            )
+            record(stats, Insertion.FAILED, file_ctx)
+        elif (payload := future.result()) is None:
+            record(stats, Insertion.SKIPPED, file_ctx)
+        else:
+            task = writers.submit(
+                write_file, file_ctx, payload, global_ctx.pool
             )
-            initial_tasks = create_tasks(max_active_tasks)
-            return _execute_tasks(
-                initial_tasks, projects, create_tasks, global_ctx
+            pending[task] = file_ctx, True
+
+
+def _pending_footprint(pending):
+    return sum(
+        estimate_footprint(file_ctx.size) for file_ctx, _ in pending.values()
+    )
+
+
+def insert_projects_pipelined(
+    projects, *, max_workers=None, processes=None, global_ctx=None
+):
+    """Parse, annotate and serialize files on a process pool (which
+    scales with the number of cores), and then pass the prepared
+    queries to a small pool of writer threads."""
+
+    if global_ctx is None:
+        global_ctx = GlobalContext()
+
+    projects = list(projects)
+    processes = processes or _available_cores()
+    max_workers = max_workers or (_available_cores() // 2) + 1
+    max_pending = (processes + max_workers) * 2
+
+    stats = Statistics()
+    start = time.perf_counter()
+    parsers = futures.ProcessPoolExecutor(max_workers=processes)
+    writers = futures.ThreadPoolExecutor(max_workers=max_workers)
+    with global_ctx, parsers, writers:
+        pending = {}
+        ensure_projects(projects, global_ctx)
+        remove_stale_files(projects, global_ctx)
+        for file_ctx in iter_files(projects, global_ctx):
+            if global_ctx.apply_constraints(stats):
+                break
+
+            if file_ctx.is_cached():
+                stats[Insertion.CACHED] += 1
+                continue
+
+            footprint = estimate_footprint(file_ctx.size)
+            while pending and (
+                len(pending) >= max_pending
+                or _pending_footprint(pending) + footprint
+                > global_ctx.memory_budget
+            ):
+                _advance_pipeline(pending, writers, global_ctx, stats)
+
+            task = parsers.submit(
+                prepare_file,
+                file_ctx.project_ctx.project,
+                file_ctx.file,
+                global_ctx.properties,
             )
+            pending[task] = file_ctx, False
 
+        while pending:
+            _advance_pipeline(pending, writers, global_ctx, stats)
 
-def insert_dataset(dataset_path, max_workers=None, **options):
-    insert_projects(
+    stats.report(time.perf_counter() - start)
+    return stats
+
+
+def insert_dataset(dataset_path, max_workers=None, processes=None, **options):
+    if processes is None:
+        runner = insert_projects
+    else:
+        runner = partial(insert_projects_pipelined, processes=processes)
+
+    runner(
         load_dataset(dataset_path),
         max_workers=max_workers,
         global_ctx=GlobalContext(options),
     )
 
 
-def main():
+def make_parser():
     parser = ArgumentParser()
     parser.add_argument("dataset_path", type=Path)
-    parser.add_argument("-w", "--workers", default=None, type=int)
+    parser.add_argument(
+        "-w", "--workers", default=None, type=int, dest="max_workers"
+    )
+    parser.add_argument("-p", "--processes", default=None, type=int)
     parser.add_argument("--fast", action="store_true", dest="fast_mode")
+    parser.add_argument("--group-size", type=int, dest="group_size")
     parser.add_argument("--limit", type=int, dest="hard_limit")
     parser.add_argument(
         "--project-limit", type=int, dest="max_files", default=10
     )
-    options = parser.parse_args()
+    parser.add_argument("--journal", action="store_true")
+    parser.add_argument("--resume", action="store_true")
+    # Try the files that failed on the resumed run again
+    parser.add_argument("--retry-dead-letters", action="store_true")
+    parser.add_argument("--incremental", action="store_true")
+    # Insert large files through many small transactions instead of
+    # a single one (see write_chunked)
+    parser.add_argument("--chunked", action="store_true")
+    # Insert the files with the same content only once
+    parser.add_argument("--deduplicate", action="store_true")
+    # p95 latency (in milliseconds) of the serving queries to keep under
+    parser.add_argument("--target-latency", type=float)
+    # Estimated memory (in MiB) that the files in flight can take
+    parser.add_argument("--memory-budget", type=int)
+    # Report the top allocations after every N files
+    parser.add_argument("--trace-memory", type=int, metavar="N")
+    return parser
+
+
+# Options that only the threaded engine (insert_projects) supports
+THREADED_OPTIONS = {
+    "group_size": "--group-size",
+    "target_latency": "--target-latency",
+    "chunked": "--chunked",
+    "trace_memory": "--trace-memory",
+}
 
+
+def check_options(parser, options, unsupported, engine):
+    for dest, flag in unsupported.items():
+        if getattr(options, dest) not in (None, False):
+            parser.error(f"{flag} is not supported by the {engine} engine")
+    return options
+
+
+def parse_options(parser, args=None):
+    options = parser.parse_args(args)
+    if options.processes is not None:
+        check_options(parser, options, THREADED_OPTIONS, "pipelined")
+    return options
+
+
+def run(dataset_inserter, options):
     with warnings.catch_warnings():
         warnings.filterwarnings("ignore", category=SyntaxWarning)
         warnings.filterwarnings("ignore", category=DeprecationWarning)
-        insert_dataset(**vars(options))
+        dataset_inserter(**vars(options))
+
+
+def main():
+    run(insert_dataset, parse_options(make_parser()))
 
 
 if __name__ == "__main__":
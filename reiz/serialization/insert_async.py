@@ -0,0 +1,239 @@
+import asyncio
+import time
+from concurrent import futures
+
+from reiz.database import (
+    InternalDatabaseError,
+    get_async_db_pool,
+    is_transient_error,
+)
+from reiz.sampling import load_dataset
+from reiz.serialization.context import GlobalContext
+from reiz.serialization.insert import (
+    THREADED_OPTIONS,
+    check_options,
+    commit_file,
+    ensure_projects,
+    iter_files,
+    make_parser,
+    prepare_file,
+    remove_stale_files,
+    retry_delays,
+    run,
+    update_stats,
+)
+from reiz.serialization.statistics import Insertion, Statistics
+from reiz.serialization.templates import MODULE_REFERENCE
+from reiz.utilities import logger
+
+DEFAULT_CONCURRENCY = 64
+
+UNSUPPORTED_OPTIONS = {
+    **THREADED_OPTIONS,
+    "max_workers": "--workers",
+    "deduplicate": "--deduplicate",
+    "memory_budget": "--memory-budget",
+}
+
+
+async def apply_payload(payload, connection):
+    # Same as serializer.apply_payload, but on an async connection
+    module = await payload.shell.execute(connection.query_one)
+    arguments = {MODULE_REFERENCE: module.id}
+
+    ids = {}
+    for batch in payload.batches:
+        result = await connection.query(
+            batch.source, **batch.resolve(ids, arguments.copy())
+        )
+        batch.record(ids, result)
+        batch.release(ids)
+
+    await payload.update.execute(connection.query, ids, **arguments)
+    return module
+
+
+async def write_payload(payload, connection, filename):
+    for delay in retry_delays():
+        try:
+            async with connection.transaction():
+                return await apply_payload(payload, connection)
+        except Exception as error:
+            if delay is None or not is_transient_error(error):
+                raise
+
+            logger.warning(
+                "%r failed with %r, retrying in %.1f seconds",
+                filename,
+                error,
+                delay,
+            )
+            await asyncio.sleep(delay)
+
+
+async def insert_file(context, pool, executor):
+    loop = asyncio.get_running_loop()
+    try:
+        payload = await loop.run_in_executor(
+            executor,
+            prepare_file,
+            context.project_ctx.project,
+            context.file,
+            context.properties,
+        )
+    except Exception:
+        logger.exception("%r couldn't be prepared", context.filename)
+        return Insertion.FAILED
+
+    if payload is None:
+        return Insertion.SKIPPED
+
+    try:
+        async with pool.acquire() as connection:
+            module = await write_payload(payload, connection, context.filename)
+    except InternalDatabaseError:
+        return Insertion.FAILED
+    except Exception:
+        logger.exception("%r couldn't be inserted", context.filename)
+        return Insertion.FAILED
+
+    # Recording the file hashes it, so keep it out of the loop
+    context.total_nodes = payload.total_nodes
+    return await loop.run_in_executor(None, commit_file, context, module)
+
+
+def take_files(files, limit):
+    # Walking the directories and checking the cache (which might query
+    # the database) are both blocking, so they are done in groups.
+    group, cached = [], 0
+    for file_ctx in files:
+        if file_ctx.is_cached():
+            cached += 1
+            continue
+
+        group.append(file_ctx)
+        if len(group) >= limit:
+            break
+    return group, cached
+
+
+async def iter_uncached_files(projects, global_ctx, stats, limit):
+    loop = asyncio.get_running_loop()
+    files = iter_files(projects, global_ctx)
+    while True:
+        group, cached = await loop.run_in_executor(
+            None, take_files, files, limit
+        )
+        stats[Insertion.CACHED] += cached
+        if not group:
+            break
+
+        for file_ctx in group:
+            yield file_ctx
+
+
+async def _insert_projects(projects, concurrency, executor, global_ctx):
+    loop = asyncio.get_running_loop()
+    stats = Statistics()
+    pool = await get_async_db_pool(min_size=1, max_size=concurrency)
+    semaphore = asyncio.Semaphore(concurrency)
+    pending = set()
+
+    async def insert_task(file_ctx):
+        try:
+            status = await insert_file(file_ctx, pool, executor)
+            # The journal is flushed after each record
+            await loop.run_in_executor(
+                None, file_ctx.journal.record_file, file_ctx.filename, status
+            )
+            update_stats(stats, status, file_ctx)
+        finally:
+            semaphore.release()
+
+    try:
+        async for file_ctx in iter_uncached_files(
+            projects, global_ctx, stats, concurrency
+        ):
+            if global_ctx.apply_constraints(stats):
+                break
+
+            # Only create new tasks when there is a free slot, so that
+            # the amount of in-flight files stays bounded.
+            await semaphore.acquire()
+            task = asyncio.create_task(insert_task(file_ctx))
+            pending.add(task)
+            task.add_done_callback(pending.discard)
+
+        await asyncio.gather(*pending)
+    finally:
+        await pool.aclose()
+
+    return stats
+
+
+def insert_projects(
+    projects, *, concurrency=None, processes=None, global_ctx=None
+):
+    """Insert all the files of the given projects on a single event
+    loop with up to `concurrency` in-flight insertions, where the files
+    are prepared either on a process pool (if `processes` is given) or
+    on the default thread pool of the loop."""
+
+    if global_ctx is None:
+        global_ctx = GlobalContext()
+
+    projects = list(projects)
+    concurrency = concurrency or DEFAULT_CONCURRENCY
+    if processes:
+        executor = futures.ProcessPoolExecutor(max_workers=processes)
+    else:
+        executor = None
+
+    start = time.perf_counter()
+    with global_ctx:
+        ensure_projects(projects, global_ctx)
+        remove_stale_files(projects, global_ctx)
+        try:
+            stats = asyncio.run(
+                _insert_projects(projects, concurrency, executor, global_ctx)
+            )
+        finally:
+            if executor is not None:
+                executor.shutdown()
+
+    stats.report(time.perf_counter() - start)
+    return stats
+
+
+def insert_dataset(dataset_path, processes=None, concurrency=None, **options):
+    if unsupported := [
+        flag
+        for dest, flag in UNSUPPORTED_OPTIONS.items()
+        if options.get(dest) not in (None, False)
+    ]:
+        raise ValueError(
+            f"{', '.join(unsupported)} can't be used with the async engine"
+        )
+
+    insert_projects(
+        load_dataset(dataset_path),
+        concurrency=concurrency,
+        processes=processes,
+        global_ctx=GlobalContext(options),
+    )
+
+
+def main():
+    parser = make_parser()
+    parser.add_argument(
+        "-c", "--concurrency", type=int, default=DEFAULT_CONCURRENCY
+    )
+    options = parser.parse_args()
+    run(
+        insert_dataset,
+        check_options(parser, options, UNSUPPORTED_OPTIONS, "async"),
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,133 @@
+import json
+import threading
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import IO, Optional, Set
+
+from reiz.serialization.statistics import Insertion
+from reiz.utilities import logger
+
+JOURNAL_FILE = ".reiz-journal.jsonl"
+DEAD_LETTERS_FILE = ".reiz-dead-letters.txt"
+
+_FILE = "file"
+_PROJECT = "project"
+_FINISHED = "FINISHED"
+_DELETED = "DELETED"
+
+
+@dataclass
+class Journal:
+    """An append-only log of insertion outcomes (one JSON object per
+    line) under the data path. An interrupted insertion can be resumed
+    from it without scanning the projects that were already finished.
+
+    Files that failed (even after the retries) are kept as dead
+    letters, and they are not tried again when resuming unless it is
+    explicitly requested (retry_dead_letters). The dead letters are
+    also listed in DEAD_LETTERS_FILE (one filename per line) when the
+    journal is closed."""
+
+    path: Optional[Path] = None
+    finished_projects: Set[str] = field(default_factory=set)
+    dead_letters: Set[str] = field(default_factory=set)
+
+    _stream: Optional[IO[str]] = None
+    _lock: threading.Lock = field(default_factory=threading.Lock)
+
+    def start(self):
+        if self.path is None:
+            return None
+
+        # Never truncate the journal of an earlier run, it might
+        # still be needed for resuming it.
+        try:
+            self._stream = open(self.path, "x")
+        except FileExistsError:
+            raise FileExistsError(
+                f"{self.path} already exists, either resume from it"
+                " (--resume) or remove it"
+            ) from None
+
+    def resume(self, cache, retry_dead_letters=False):
+        if self.path is None or not self.path.exists():
+            return False
+
+        with open(self.path) as stream:
+            for line in stream:
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    # Partially written entry of an interrupted run
+                    continue
+                self._replay(entry, cache)
+
+        if retry_dead_letters:
+            for name in self.dead_letters:
+                cache.discard_file(name)
+            self.dead_letters.clear()
+
+        logger.info(
+            "resuming from %s with %d dead letters and %d finished projects",
+            self.path,
+            len(self.dead_letters),
+            len(self.finished_projects),
+        )
+        self._stream = open(self.path, "a")
+        return True
+
+    def close(self):
+        if self._stream is not None:
+            self._stream.close()
+            self._stream = None
+            self._dump_dead_letters()
+
+    def record_file(self, filename, status):
+        with self._lock:
+            if status is Insertion.FAILED:
+                self.dead_letters.add(filename)
+            else:
+                self.dead_letters.discard(filename)
+        self._append(_FILE, filename, status.name)
+
+    def record_project(self, project_name):
+        self._append(_PROJECT, project_name, Insertion.INSERTED.name)
+
+    def finish_project(self, project_name):
+        self._append(_PROJECT, project_name, _FINISHED)
+
+    def record_deletion(self, filename):
+        self._append(_FILE, filename, _DELETED)
+
+    def _replay(self, entry, cache):
+        kind, name, status = entry["kind"], entry["name"], entry["status"]
+        if kind == _PROJECT and status == _FINISHED:
+            self.finished_projects.add(name)
+        elif kind == _PROJECT:
+            cache.projects.add(name)
+        elif status in (Insertion.INSERTED.name, Insertion.DEDUPLICATED.name):
+            self.dead_letters.discard(name)
+            cache.add_file(name)
+        elif status == Insertion.FAILED.name:
+            self.dead_letters.add(name)
+            cache.add_file(name)
+        elif status == _DELETED:
+            self.dead_letters.discard(name)
+            cache.discard_file(name)
+
+    def _append(self, kind, name, status):
+        if self._stream is None:
+            return None
+
+        with self._lock:
+            self._write(kind, name, status)
+            self._stream.flush()
+
+    def _write(self, kind, name, status):
+        entry = {"kind": kind, "name": name, "status": status}
+        self._stream.write(json.dumps(entry) + "\n")
+
+    def _dump_dead_letters(self):
+        with open(self.path.with_name(DEAD_LETTERS_FILE), "w") as stream:
+            for name in sorted(self.dead_letters):
+                stream.write(name + "\n")
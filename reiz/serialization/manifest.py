@@ -0,0 +1,121 @@
+import hashlib
+import json
+import os
+import threading
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import IO, Dict, Optional, Tuple
+
+MANIFEST_FILE = ".reiz-manifest.jsonl"
+
+# (size, modification time in nanoseconds, content hash)
+Entry = Tuple[int, int, str]
+
+
+def hash_file(path):
+    with open(path, "rb") as stream:
+        return hashlib.blake2b(stream.read(), digest_size=16).hexdigest()
+
+
+@dataclass
+class Manifest:
+    """The size, modification time and content hash of every inserted
+    file, for detecting the files that were changed (or removed) since
+    their insertion. Only the files whose size or modification time is
+    different than the recorded ones are hashed again.
+
+    Every change is appended to the manifest as soon as it happens (one
+    JSON object per line, where a null entry means that the file is
+    discarded), so an interrupted insertion doesn't lose it. The log is
+    compacted into the latest entries when the manifest is saved."""
+
+    path: Optional[Path] = None
+    entries: Dict[str, Entry] = field(default_factory=dict)
+
+    _stream: Optional[IO[str]] = None
+    _lock: threading.Lock = field(default_factory=threading.Lock)
+
+    def load(self):
+        if self.path is None:
+            return None
+
+        if self.path.exists():
+            with open(self.path) as stream:
+                for line in stream:
+                    try:
+                        change = json.loads(line)
+                    except json.JSONDecodeError:
+                        # Partially written change of an interrupted run
+                        continue
+                    self._replay(change)
+        self._stream = open(self.path, "a")
+
+    def save(self):
+        if self.path is None:
+            return None
+
+        with self._lock:
+            temporary_path = self.path.with_suffix(".tmp")
+            with open(temporary_path, "w") as stream:
+                for filename, entry in self.entries.items():
+                    self._write(stream, filename, entry)
+            os.replace(temporary_path, self.path)
+
+            if self._stream is not None:
+                self._stream.close()
+                self._stream = None
+
+    def record(self, filename, file, digest=None):
+        if self.path is None:
+            return None
+
+        stat = file.stat()
+        if digest is None:
+            digest = hash_file(file)
+        self._update(filename, (stat.st_size, stat.st_mtime_ns, digest))
+
+    def discard(self, filename):
+        self._update(filename, None)
+
+    def is_changed(self, filename, file):
+        if filename not in self.entries:
+            # Inserted before the manifest was enabled, assume that
+            # it is the same version.
+            self.record(filename, file)
+            return False
+
+        stat = file.stat()
+        size, mtime, digest = self.entries[filename]
+        if (stat.st_size, stat.st_mtime_ns) == (size, mtime):
+            return False
+        elif stat.st_size == size and hash_file(file) == digest:
+            # Touched, but not modified
+            self._update(filename, (size, stat.st_mtime_ns, digest))
+            return False
+        else:
+            return True
+
+    def _replay(self, change):
+        filename, entry = change["name"], change["entry"]
+        if entry is None:
+            self.entries.pop(filename, None)
+        else:
+            self.entries[filename] = tuple(entry)
+
+    def _update(self, filename, entry):
+        with self._lock:
+            if entry is None:
+                self.entries.pop(filename, None)
+            else:
+                self.entries[filename] = entry
+
+            if self._stream is not None:
+                self._write(self._stream, filename, entry)
+                self._stream.flush()
+
+    @staticmethod
+    def _write(stream, filename, entry):
+        stream.write(json.dumps({"name": filename, "entry": entry}) + "\n")
+
+    def __bool__(self):
+        return self.path is not None
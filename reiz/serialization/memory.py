@@ -0,0 +1,70 @@
+import threading
+import tracemalloc
+from dataclasses import dataclass, field
+
+from reiz.utilities import logger
+
+# Rough amount of memory that is needed for inserting a file, which
+# is dominated by the annotated tree and the prepared queries. These
+# are rounded up from the medians that scripts/benchmark_footprint.py
+# measures over the standard library (~53 KiB and ~120 bytes of peak
+# per byte of source), so that only a few files exceed the estimate.
+FOOTPRINT_RATIO = 200
+BASE_FOOTPRINT = 64 * 1024
+
+# Amount of lines (allocation sites) to report in each snapshot
+TOP_ALLOCATIONS = 10
+
+_IGNORED_TRACES = (
+    tracemalloc.Filter(False, tracemalloc.__file__),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+    tracemalloc.Filter(False, "<unknown>"),
+)
+
+
+def estimate_footprint(size):
+    return BASE_FOOTPRINT + size * FOOTPRINT_RATIO
+
+
+@dataclass
+class MemoryTracer:
+    """Take a tracemalloc snapshot after each `interval` files, and
+    report the allocation sites that hold the most memory."""
+
+    interval: int
+
+    _processed: int = 0
+    _lock: threading.Lock = field(default_factory=threading.Lock)
+
+    def start(self):
+        tracemalloc.start()
+
+    def stop(self):
+        tracemalloc.stop()
+
+    def advance(self, files):
+        with self._lock:
+            previous = self._processed // self.interval
+            self._processed += files
+            processed = self._processed
+            if processed // self.interval == previous:
+                return None
+
+        self.report(processed)
+
+    def report(self, processed):
+        current, peak = tracemalloc.get_traced_memory()
+        snapshot = tracemalloc.take_snapshot().filter_traces(_IGNORED_TRACES)
+        logger.info(
+            "memory after %d files: %.1f MiB (peak: %.1f MiB)",
+            processed,
+            current / 2**20,
+            peak / 2**20,
+        )
+        for statistic in snapshot.statistics("lineno")[:TOP_ALLOCATIONS]:
+            logger.info(
+                "    %.1f KiB in %d blocks: %s",
+                statistic.size / 1024,
+                statistic.count,
+                statistic.traceback,
+            )
@@ -0,0 +1,202 @@
+import threading
+from collections import Counter, deque
+from dataclasses import dataclass, field
+from itertools import islice
+from pathlib import Path
+from typing import Deque, Dict, Iterator, List, Optional, Tuple
+
+from reiz.serialization.context import GlobalContext, ProjectContext
+from reiz.serialization.memory import MemoryTracer, estimate_footprint
+from reiz.serialization.statistics import Insertion, Statistics
+from reiz.serialization.throttle import PROBE_INTERVAL, Throttle
+
+# Amount of files that are listed (and ordered by their sizes) at once
+WINDOW_SIZE = 64
+
+
+@dataclass
+class ProjectQueue:
+    """Remaining files of a single project. The files are listed lazily,
+    WINDOW_SIZE files at a time, and each window is ordered from the
+    largest file to the smallest one. The files that are already cached
+    are counted into the given statistics while listing."""
+
+    project_ctx: ProjectContext
+    stats: Statistics
+    files: Optional[Iterator[Path]] = None
+    window: Deque[Tuple[int, Path]] = field(default_factory=deque)
+
+    def __post_init__(self):
+        if self.files is None:
+            self.files = self.project_ctx.path.glob("**/*.py")
+
+    def peek(self):
+        while not self.window and (
+            files := list(islice(self.files, WINDOW_SIZE))
+        ):
+            self._extend(files)
+        if self.window:
+            return self.window[0]
+        else:
+            return None
+
+    def pop(self):
+        return self.window.popleft()
+
+    def _extend(self, files):
+        window = []
+        for file in files:
+            if self.project_ctx.new_child(file).is_cached():
+                self.stats[Insertion.CACHED] += 1
+            else:
+                window.append((file.stat().st_size, file))
+        window.sort(reverse=True)
+        self.window.extend(window)
+
+
+@dataclass
+class WorkQueue:
+    """File-level work items of all projects. Each project has its own
+    queue (see ProjectQueue) which is dropped once it runs out of files,
+    and every worker starts from its own (home) project and steals the
+    largest available file of the others when it runs out of work.
+
+    A project never has more than its `limit` (max_files) files in
+    flight, and no new files are handed out once the global constraints
+    (hard_limit) are satisfied by the inserted and the in-flight files.
+    If there is a throttle, only `throttle.limit` workers are active at
+    the same time and the rest of them wait. Files are also admitted only
+    when their estimated memory footprint fits into the memory budget."""
+
+    global_ctx: GlobalContext
+    stats: Statistics = field(default_factory=Statistics)
+    throttle: Optional[Throttle] = None
+    tracer: Optional[MemoryTracer] = None
+
+    _queues: Dict[str, ProjectQueue] = field(default_factory=dict)
+    _projects: Dict[str, ProjectContext] = field(default_factory=dict)
+    _homes: List[str] = field(default_factory=list)
+    _in_flight: Counter = field(default_factory=Counter)
+    _active: int = 0
+    _memory: int = 0
+    _footprints: Dict[Path, int] = field(default_factory=dict)
+    _condition: threading.Condition = field(
+        default_factory=threading.Condition
+    )
+
+    def add_project(self, project_ctx):
+        if project_ctx.is_finished():
+            return None
+
+        name = project_ctx.project.name
+        self._projects[name] = project_ctx
+        self._queues[name] = ProjectQueue(project_ctx, self.stats)
+        self._homes.append(name)
+
+    def take(self, worker):
+        """Block until there is an available file, and return its project
+        alongside with at most `group_size` files from it. If there is no
+        work left (or the constraints are already satisfied), return None."""
+
+        with self._condition:
+            while self._has_work():
+                if self._is_throttled():
+                    # The limit might be raised without any notifications
+                    self._condition.wait(PROBE_INTERVAL)
+                elif name := self._pick(worker):
+                    return self._reserve(name)
+                elif self._queues:
+                    self._condition.wait()
+            return None
+
+    def done(self, project_ctx, files, stats):
+        name = project_ctx.project.name
+        with self._condition:
+            self.stats.update(stats)
+            self._in_flight[name] -= len(files)
+            self._active -= 1
+            for file in files:
+                self._memory -= self._footprints.pop(file)
+            self._finish_if_done(name)
+            self._condition.notify_all()
+
+        if self.tracer is not None:
+            self.tracer.advance(len(files))
+
+    def _has_work(self):
+        if self._budget() <= 0:
+            return False
+        return bool(self._queues)
+
+    def _is_throttled(self):
+        return self.throttle is not None and (
+            self._active >= self.throttle.limit
+        )
+
+    def _budget(self):
+        reserved = self.stats.copy()
+        reserved[Insertion.INSERTED] += sum(self._in_flight.values())
+        if self.global_ctx.apply_constraints(reserved):
+            return 0
+        else:
+            return self.global_ctx.limit - reserved[Insertion.INSERTED]
+
+    def _quota(self, name):
+        return self._projects[name].limit - self._in_flight[name]
+
+    def _fits(self, size):
+        # A file that doesn't fit into the budget by itself is still
+        # admitted when there is nothing else in flight.
+        footprint = estimate_footprint(size)
+        return (
+            not self._memory
+            or self._memory + footprint <= self.global_ctx.memory_budget
+        )
+
+    def _pick(self, worker):
+        home = self._homes[worker % len(self._homes)]
+        if self._is_available(home):
+            return home
+
+        candidates = [
+            name for name in list(self._queues) if self._is_available(name)
+        ]
+        if not candidates:
+            return None
+        return max(candidates, key=lambda name: self._queues[name].peek())
+
+    def _is_available(self, name):
+        if name not in self._queues or self._quota(name) <= 0:
+            return False
+        if (head := self._queues[name].peek()) is None:
+            self._drop(name)
+            return False
+        return self._fits(head[0])
+
+    def _drop(self, name):
+        del self._queues[name]
+        self._finish_if_done(name)
+        self._condition.notify_all()
+
+    def _finish_if_done(self, name):
+        if name not in self._queues and not self._in_flight[name]:
+            self._projects[name].journal.finish_project(name)
+
+    def _reserve(self, name):
+        project_ctx = self._projects[name]
+        amount = min(project_ctx.group_size, self._quota(name), self._budget())
+        queue = self._queues[name]
+        files: List[Path] = []
+        while (
+            len(files) < amount
+            and (head := queue.peek())
+            and self._fits(head[0])
+        ):
+            size, file = queue.pop()
+            self._footprints[file] = estimate_footprint(size)
+            self._memory += self._footprints[file]
+            files.append(file)
+
+        self._in_flight[name] += len(files)
+        self._active += 1
+        return project_ctx, files
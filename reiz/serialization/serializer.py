@@ -1,17 +1,40 @@
 import ast
-from dataclasses import field
+from dataclasses import dataclass
 from functools import singledispatch
+from typing import List
 
 from reiz.ir import IR, Schema
+from reiz.serialization.templates import (
+    MODULE_REFERENCE,
+    PreparedQuery,
+    Slot,
+    bind_value,
+    get_deletion_query,
+    get_template,
+)
 from reiz.serialization.transformers import iter_properties
 
 
-@singledispatch
-def serialize(value, context):
+@dataclass
+class ModulePayload:
+    """All the queries of a module, ready to be executed"""
+
+    shell: PreparedQuery
+    batches: List[PreparedQuery]
+    update: PreparedQuery
+    total_nodes: int
+
+
+def _unexpected(value, context):
     message = f"Unexpected object for serialization: {value!r} ({type(value)})"
     if context.flows_from:
         message += f" (flowing from {context.flows_from})"
-    raise ValueError(message)
+    return ValueError(message)
+
+
+@singledispatch
+def serialize(value, context):
+    raise _unexpected(value, context)
 
 
 @serialize.register(ast.project)
@@ -31,42 +54,14 @@ def serialize_ast(node, context):
         # <ast::op>'Add'
         return IR.enum_member(node.base_name, node.kind_name)
     else:
-        # (INSERT ast::BinOp {.left := ..., ...})
-        reference = apply_ast(node, context)
-        context.new_reference(reference.id)
-
-        # (SELECT ast::expr FILTER .id = ... LIMIT 1)
-        return IR.select(
-            node.base_name, filters=IR.object_ref(reference), limit=1
-        )
-
-
-_BASIC_SET_TYPES = Schema.enum_types + (int, str, tuple)
+        # Nodes are only inserted through the templates (see insert_ast)
+        raise _unexpected(node, context)
 
 
 @serialize.register(list)
 def serialize_sequence(sequence, context):
-    ir_set = IR.set([serialize(value, context) for value in sequence])
-
-    if all(isinstance(item, _BASIC_SET_TYPES) for item in sequence):
-        # {1, 2, 3} / {<ast::op>'Add', <ast::op>'Sub', ...}
-        return ir_set
-    else:
-        # Inserting a sequence of AST objects would require special
-        # attention to calculate the index property.
-        target = IR.name("item")
-        scope = IR.namespace({"items": ir_set})
-        loop = IR.loop(
-            target,
-            IR.call("enumerate", [IR.name("items")]),
-            IR.select(
-                IR.attribute(target, 1),
-                selections=[
-                    IR.assign(IR.property("index"), IR.attribute(target, 0))
-                ],
-            ),
-        )
-        return IR.add_namespace(scope, loop)
+    # {1, 2, 3} / {<ast::op>'Add', <ast::op>'Sub', ...}
+    return IR.set([serialize(value, context) for value in sequence])
 
 
 @serialize.register(tuple)
@@ -85,7 +80,72 @@ def serialize_sentinel(value, context):
     return serialize(ast.Sentinel(), context)
 
 
-def apply_ast(node, context):
+def classify(value, context):
+    if isinstance(value, ast.AST):
+        if value.is_enum:
+            return Slot.ENUM, value.base_name
+        else:
+            return Slot.NODE, None
+    elif isinstance(value, str):
+        return Slot.STR, None
+    elif isinstance(value, int):
+        return Slot.INT, None
+    elif isinstance(value, tuple):
+        return Slot.PAIRS, None
+    elif isinstance(value, list):
+        # None's in a sequence are represented with sentinels
+        # so they are counted as nodes (e.g: Dict(keys=[None]))
+        for item in value:
+            if item is not None:
+                slot, base = classify(item, context)
+                break
+        else:
+            slot, base = Slot.NODE, None
+
+        if slot is Slot.PAIRS:
+            return slot, base
+        else:
+            return Slot[slot.name + "S"], base
+
+    raise _unexpected(value, context)
+
+
+def insert_ast(node, context):
+    # Children are added to the plan before their parents, and they
+    # are referenced through their node numbers.
+    shape, record, children = [], [], []
+    with context.enter_node(node):
+        for field, value in iter_properties(node):
+            if value is None or value == []:
+                continue
+
+            slot, base = classify(value, context)
+            if slot is Slot.NODE:
+                value = insert_ast(value, context)
+                children.append(value)
+            elif slot is Slot.NODES:
+                value = [
+                    insert_ast(item or ast.Sentinel(), context)
+                    for item in value
+                ]
+                children.extend(value)
+            else:
+                value = bind_value(slot, value)
+            shape.append((field, slot, base))
+            record.append(value)
+
+    if isinstance(node, Schema.module_annotated_types):
+        shape.append(("_module", Slot.MODULE, None))
+
+    template = get_template(node.kind_name, tuple(shape))
+    return context.new_insertion(template, record, children)
+
+
+def construct(query, context):
+    return PreparedQuery(IR.construct(query))
+
+
+def construct_insert(node, context):
     with context.enter_node(node):
         insertions = {
             field: serialize(value, context)
@@ -93,5 +153,114 @@ def apply_ast(node, context):
             if value is not None
         }
 
-    query = IR.insert(node.kind_name, insertions)
-    return context.connection.query_one(IR.construct(query))
+    return construct(IR.insert(node.kind_name, insertions), context)
+
+
+def apply_ast(node, context):
+    query = construct_insert(node, context)
+    return query.execute(context.connection.query_one)
+
+
+_MODULE_FILTER = IR.filter(
+    IR.attribute(None, "id"),
+    IR.cast("uuid", IR.variable(MODULE_REFERENCE)),
+    "=",
+)
+
+
+def _link_sequence(kind_name, field):
+    # FOR item IN {enumerate(array_unpack(<array<uuid>>$body))}
+    # UNION (SELECT ast::stmt {@index := item.0} FILTER .id = item.1)
+    pointer = Schema.get_pointers(Schema.wrap(kind_name))[Schema.wrap(field)]
+    return IR.loop(
+        IR.name("item"),
+        IR.call(
+            "enumerate",
+            [
+                IR.call(
+                    "array_unpack",
+                    [IR.cast("array<uuid>", IR.variable(field))],
+                )
+            ],
+        ),
+        IR.select(
+            pointer.target,
+            filters=IR.filter(
+                IR.attribute(None, "id"),
+                IR.attribute(IR.name("item"), 1),
+                "=",
+            ),
+            selections=[
+                IR.assign(
+                    IR.property("index"), IR.attribute(IR.name("item"), 0)
+                )
+            ],
+        ),
+    )
+
+
+def construct_module_update(fields):
+    # The ids of the children are passed only when the query
+    # is executed (see PreparedQuery.references)
+    assignments = {field: _link_sequence("Module", field) for field in fields}
+    return IR.update("Module", filters=_MODULE_FILTER, assignments=assignments)
+
+
+def prepare_shell(tree, context):
+    # The module is inserted without any of its children first, so
+    # that each node can directly link to it through the _module
+    # while they are being inserted.
+    shell, children = {}, {}
+    for field, value in iter_properties(tree):
+        if isinstance(value, list):
+            children[field] = value
+        else:
+            shell[field] = serialize(value, context)
+    return construct(IR.insert(tree.kind_name, shell), context), children
+
+
+def prepare_children(children, context):
+    # {'body': [<node number>, ...], 'type_ignores': [...]}
+    return {
+        field: [insert_ast(item, context) for item in items]
+        for field, items in children.items()
+    }
+
+
+def prepare_update(nodes):
+    query = construct_module_update(nodes.keys())
+    return PreparedQuery(
+        IR.construct(query), arguments=nodes, references=list(nodes)
+    )
+
+
+def prepare_module(tree, context):
+    """Construct all the queries that are needed for inserting
+    the given module, without touching to the database."""
+
+    shell, children = prepare_shell(tree, context)
+    nodes = prepare_children(children, context)
+    batches = list(context.flush_plan().iter_queries())
+    update = prepare_update(nodes)
+    return ModulePayload(shell, batches, update, context.total_nodes)
+
+
+def apply_payload(payload, connection):
+    module = payload.shell.execute(connection.query_one)
+    arguments = {MODULE_REFERENCE: module.id}
+
+    ids = {}
+    for batch in payload.batches:
+        batch.execute(connection.query, ids, **arguments)
+        batch.release(ids)
+
+    payload.update.execute(connection.query, ids, **arguments)
+    return module
+
+
+def delete_modules(filenames, connection):
+    return connection.query_one(get_deletion_query(), filenames=filenames)
+
+
+def apply_module(tree, context):
+    return apply_payload(prepare_module(tree, context), context.connection)
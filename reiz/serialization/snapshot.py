@@ -0,0 +1,465 @@
+import time
+import uuid
+from argparse import ArgumentParser
+from concurrent import futures
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Dict, List
+
+from reiz.database import ConnectionPool, get_new_connection
+from reiz.ir import IR, Schema
+from reiz.serialization.bundle import read_records, write_record
+from reiz.serialization.insert import write_payload
+from reiz.serialization.serializer import ModulePayload, prepare_update
+from reiz.serialization.templates import (
+    InsertionPlan,
+    PreparedQuery,
+    Slot,
+    get_template,
+)
+from reiz.utilities import _available_cores, guarded, logger
+
+# A snapshot is a stream of length-prefixed, zlib compressed JSON records
+# (see bundle.write_record). The first record is the header with all the
+# projects, and each one after it holds a chunk of modules alongside with
+# every object that belongs to them. Objects are keyed by their original
+# ids, and the links are stored as those ids (with the @index values for
+# sequences) so that the restore can re-create the same trees.
+SNAPSHOT_VERSION = 1
+MODULE_CHUNK_SIZE = 100
+
+_SCALAR_SLOTS = {
+    "int64": (Slot.INT, Slot.INTS),
+    "str": (Slot.STR, Slot.STRS),
+}
+
+
+@dataclass
+class SnapshotStatistics:
+    modules: int = 0
+    objects: int = 0
+    failed: int = 0
+
+    def report(self, action, elapsed):
+        logger.info(
+            "%s %d modules (%d objects, %d failed) in %.2f seconds "
+            "(%.0f objects/s, %.1f modules/s)",
+            action,
+            self.modules,
+            self.objects,
+            self.failed,
+            elapsed,
+            self.objects / elapsed if elapsed else 0,
+            self.modules / elapsed if elapsed else 0,
+        )
+
+
+def _model(type_name):
+    return f"{Schema.NAMESPACE}::{type_name}"
+
+
+def _dumped_pointers(type_name):
+    # The _module links are re-bound to the restored module itself
+    return {
+        name: pointer
+        for name, pointer in Schema.get_pointers(type_name).items()
+        if name != "_module"
+    }
+
+
+def _node_types():
+    for type_name, object_type in Schema.object_types.items():
+        if object_type.is_abstract:
+            continue
+        elif type_name in (Schema.wrap("Module"), "project", "module_alias"):
+            # Dumped alongside with the modules themselves
+            continue
+        yield type_name
+
+
+def _shape(pointers):
+    selections = ["id"]
+    for name, pointer in pointers.items():
+        if not pointer.is_link:
+            selections.append(name)
+        elif pointer.is_indexed:
+            selections.append(f"{name}: {{id, index := @index}}")
+        else:
+            selections.append(f"{name}: {{id}}")
+    return "{" + ", ".join(selections) + "}"
+
+
+def _module_filter():
+    return (
+        f"(SELECT {_model(Schema.wrap('Module'))} "
+        "FILTER .id IN array_unpack(<array<uuid>>$modules))"
+    )
+
+
+def get_export_queries():
+    """One query for each concrete type, that selects all the objects
+    of that type (with all their properties/links) which belong to the
+    given set of modules ($modules)."""
+
+    queries = {}
+    for type_name in _node_types():
+        filters = " OR ".join(
+            f"{path} IN modules" for path in Schema.get_owner_paths(type_name)
+        )
+        queries[type_name] = (
+            f"WITH modules := {_module_filter()}\n"
+            f"SELECT {_model(type_name)} "
+            f"{_shape(_dumped_pointers(type_name))}\n"
+            f"FILTER {filters}"
+        )
+    return queries
+
+
+def _dump_value(pointer, value):
+    if value is None:
+        return None
+    elif pointer.is_link and pointer.is_multi:
+        return sorted(
+            ([str(item.id), item.index] for item in value),
+            key=lambda pair: pair[1],
+        )
+    elif pointer.is_link:
+        return str(value.id)
+    elif pointer.is_multi:
+        return [_dump_scalar(item) for item in value]
+    else:
+        return _dump_scalar(value)
+
+
+def _dump_scalar(value):
+    if isinstance(value, (int, str)):
+        return value
+    elif isinstance(value, tuple):
+        return [_dump_scalar(item) for item in value]
+    else:
+        # Enum values
+        return str(value)
+
+
+def _dump_object(type_name, pointers, obj):
+    fields = {}
+    for name, pointer in pointers.items():
+        value = _dump_value(pointer, getattr(obj, name))
+        if value is not None and value != []:
+            fields[name] = value
+    return {"type": type_name, "fields": fields}
+
+
+def export_chunk(connection, modules, export_queries):
+    module_ids = [module.id for module in modules]
+    module_pointers = _dumped_pointers(Schema.wrap("Module"))
+
+    objects = {}
+    for type_name, query in export_queries.items():
+        pointers = _dumped_pointers(type_name)
+        for obj in connection.query(query, modules=module_ids):
+            objects[str(obj.id)] = _dump_object(type_name, pointers, obj)
+
+    return {
+        "modules": [
+            {
+                "filename": module.filename,
+                "project": module.project.name,
+                "checksum": module.checksum,
+                "aliases": [
+                    [alias.filename, alias.project.name]
+                    for alias in module.aliases
+                ],
+                "body": _dump_value(module_pointers["body"], module.body),
+                "type_ignores": _dump_value(
+                    module_pointers["type_ignores"], module.type_ignores
+                ),
+            }
+            for module in modules
+        ],
+        "objects": objects,
+    }
+
+
+def _iter_module_chunks(connection, chunk_size):
+    # Keyset pagination, so that each chunk is a cheap index scan
+    module_model = _model(Schema.wrap("Module"))
+    query = (
+        f"SELECT {module_model} {{id, filename, project: {{name}}, "
+        "checksum, aliases: {filename, project: {name}}, "
+        "body: {id, index := @index}, "
+        "type_ignores: {id, index := @index}}\n"
+        "FILTER .id > <uuid>$last\n"
+        "ORDER BY .id\n"
+        "LIMIT <int64>$limit"
+    )
+
+    last = uuid.UUID(int=0)
+    while modules := connection.query(query, last=last, limit=chunk_size):
+        yield modules
+        last = modules[-1].id
+
+
+def export_snapshot(snapshot_path, chunk_size=MODULE_CHUNK_SIZE):
+    export_queries = get_export_queries()
+
+    stats = SnapshotStatistics()
+    start = time.perf_counter()
+    with get_new_connection() as connection, open(
+        snapshot_path, "wb"
+    ) as stream:
+        projects = connection.query(
+            f"SELECT {_model('project')} {_shape(_dumped_pointers('project'))}"
+        )
+        write_record(
+            stream,
+            {
+                "version": SNAPSHOT_VERSION,
+                "projects": [
+                    _dump_object("project", _dumped_pointers("project"), obj)[
+                        "fields"
+                    ]
+                    for obj in projects
+                ],
+            },
+        )
+
+        for modules in _iter_module_chunks(connection, chunk_size):
+            chunk = export_chunk(connection, modules, export_queries)
+            write_record(stream, chunk)
+            stats.modules += len(chunk["modules"])
+            stats.objects += len(chunk["objects"]) + len(chunk["modules"])
+            logger.info("%d modules have been exported", stats.modules)
+
+    stats.report("exported", time.perf_counter() - start)
+    return stats
+
+
+def _classify(pointer):
+    if pointer.is_link:
+        return (Slot.NODES if pointer.is_multi else Slot.NODE), None
+    elif pointer.target in _SCALAR_SLOTS:
+        single, multi = _SCALAR_SLOTS[pointer.target]
+        return (multi if pointer.is_multi else single), None
+    elif pointer.target.startswith("tuple<"):
+        return Slot.PAIRS, None
+    else:
+        return (Slot.ENUMS if pointer.is_multi else Slot.ENUM), pointer.target
+
+
+def _children(obj):
+    pointers = Schema.get_pointers(obj["type"])
+    for name, value in obj["fields"].items():
+        pointer = pointers[name]
+        if not pointer.is_link:
+            continue
+        elif pointer.is_multi:
+            # Sequences are always indexed from 0 to N - 1, so the
+            # order of the ids is enough for re-creating @index.
+            yield from (item_id for item_id, _ in value)
+        else:
+            yield value
+
+
+@dataclass
+class _Restoration:
+    """The insertion plan for restoring the (sub)trees of
+    a single module from their dumped objects."""
+
+    objects: Dict[str, Any]
+    plan: InsertionPlan = field(default_factory=InsertionPlan)
+    nodes: Dict[str, int] = field(default_factory=dict)
+
+    def add_tree(self, root_id):
+        # Children are added before their parents (post-order)
+        stack = [(root_id, False)]
+        while stack:
+            object_id, is_visited = stack.pop()
+            obj = self.objects[object_id]
+            if is_visited:
+                self.nodes[object_id] = self.add_object(obj)
+            else:
+                stack.append((object_id, True))
+                stack.extend(
+                    (child_id, False)
+                    for child_id in reversed(list(_children(obj)))
+                )
+        return self.nodes[root_id]
+
+    def add_object(self, obj):
+        pointers = Schema.get_pointers(obj["type"])
+        shape, record, children = [], [], []
+        for name, value in obj["fields"].items():
+            slot, base = _classify(pointers[name])
+            if slot is Slot.NODE:
+                value = self.nodes[value]
+                children.append(value)
+            elif slot is Slot.NODES:
+                value = [self.nodes[item_id] for item_id, _ in value]
+                children.extend(value)
+            shape.append((name, slot, base))
+            record.append(value)
+
+        if "_module" in pointers:
+            shape.append(("_module", Slot.MODULE, None))
+
+        template = get_template(obj["type"], tuple(shape))
+        return self.plan.add(template, record, children)
+
+
+def _project_reference(name):
+    return f"(SELECT {_model('project')} FILTER .name = <str>${name} LIMIT 1)"
+
+
+def _prepare_shell(module):
+    assignments = [
+        "filename := <str>$filename",
+        f"project := {_project_reference('project')}",
+    ]
+    arguments = {"filename": module["filename"], "project": module["project"]}
+    if module.get("checksum") is not None:
+        assignments.append("checksum := <str>$checksum")
+        arguments["checksum"] = module["checksum"]
+
+    aliases = []
+    for index, (filename, project) in enumerate(module.get("aliases", [])):
+        aliases.append(
+            f"(INSERT {_model('module_alias')} {{"
+            f"filename := <str>$alias_{index}, "
+            f"project := {_project_reference(f'alias_project_{index}')}}})"
+        )
+        arguments[f"alias_{index}"] = filename
+        arguments[f"alias_project_{index}"] = project
+    if aliases:
+        assignments.append(f"aliases := {{{', '.join(aliases)}}}")
+
+    return PreparedQuery(
+        f"INSERT {_model(Schema.wrap('Module'))} {{"
+        + ", ".join(assignments)
+        + "}",
+        arguments,
+    )
+
+
+def prepare_restoration(module, objects):
+    """Construct a module payload (see prepare_module) from the
+    dumped objects of a single module."""
+
+    restoration = _Restoration(objects)
+    nodes = {
+        field: [
+            restoration.add_tree(object_id)
+            for object_id, _ in module.get(field, [])
+        ]
+        for field in ("body", "type_ignores")
+    }
+    return ModulePayload(
+        _prepare_shell(module),
+        list(restoration.plan.iter_queries()),
+        prepare_update(nodes),
+        len(restoration.plan) + 1,
+    )
+
+
+@guarded(None)
+def restore_module(module, objects, pool):
+    payload = prepare_restoration(module, objects)
+    with pool.new_connection() as connection:
+        write_payload(payload, connection, module["filename"])
+    return payload.total_nodes
+
+
+def restore_projects(projects, connection):
+    existing_projects = {
+        project.name
+        for project in connection.query(IR.construct_prepared("project.names"))
+    }
+    for project in projects:
+        if project["name"] in existing_projects:
+            continue
+
+        assignments = ", ".join(
+            f"{name} := <str>${name}" for name in project.keys()
+        )
+        connection.query_one(
+            f"INSERT {_model('project')} {{{assignments}}}", **project
+        )
+
+
+def _iter_snapshot_modules(stream, pool):
+    records = read_records(stream)
+    header = next(records)
+    if header.get("version") != SNAPSHOT_VERSION:
+        raise ValueError(
+            f"Unsupported snapshot version: {header.get('version')!r}"
+        )
+
+    with pool.new_connection() as connection:
+        restore_projects(header["projects"], connection)
+
+    for chunk in records:
+        for module in chunk["modules"]:
+            yield module, chunk["objects"]
+
+
+def import_snapshot(snapshot_path, max_workers=None):
+    """Restore the given snapshot into an empty database, through a
+    pool of writer threads (each module is a single transaction)."""
+
+    max_workers = max_workers or (_available_cores() // 2) + 1
+    max_pending = max_workers * 2
+
+    stats = SnapshotStatistics()
+    start = time.perf_counter()
+    with ConnectionPool() as pool, open(snapshot_path, "rb") as stream:
+        with futures.ThreadPoolExecutor(max_workers=max_workers) as writers:
+            pending = {}
+            for module, objects in _iter_snapshot_modules(stream, pool):
+                task = writers.submit(restore_module, module, objects, pool)
+                pending[task] = module
+                while len(pending) >= max_pending:
+                    _collect(pending, stats, futures.FIRST_COMPLETED)
+
+            _collect(pending, stats, futures.ALL_COMPLETED)
+
+    stats.report("restored", time.perf_counter() - start)
+    return stats
+
+
+def _collect(pending, stats, return_when):
+    done, _ = futures.wait(pending, return_when=return_when)
+    for task in done:
+        module = pending.pop(task)
+        if (total_nodes := task.result()) is None:
+            logger.error("%r couldn't be restored", module["filename"])
+            stats.failed += 1
+        else:
+            stats.modules += 1
+            stats.objects += total_nodes
+
+
+def main():
+    parser = ArgumentParser(
+        description="Export the whole index into a snapshot, or restore it"
+    )
+    subparsers = parser.add_subparsers(dest="action", required=True)
+
+    export_parser = subparsers.add_parser("export")
+    export_parser.add_argument("snapshot_path", type=Path)
+    export_parser.add_argument(
+        "--chunk-size", type=int, default=MODULE_CHUNK_SIZE
+    )
+
+    import_parser = subparsers.add_parser("import")
+    import_parser.add_argument("snapshot_path", type=Path)
+    import_parser.add_argument("-w", "--workers", type=int, dest="max_workers")
+
+    options = vars(parser.parse_args())
+    if options.pop("action") == "export":
+        export_snapshot(**options)
+    else:
+        import_snapshot(**options)
+
+
+if __name__ == "__main__":
+    main()
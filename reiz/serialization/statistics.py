@@ -1,7 +1,7 @@
 from collections import Counter
 from enum import auto
 
-from reiz.utilities import ReizEnum
+from reiz.utilities import ReizEnum, logger
 
 
 class Insertion(ReizEnum):
@@ -9,7 +9,23 @@ class Insertion(ReizEnum):
     FAILED = auto()
     SKIPPED = auto()
     INSERTED = auto()
+    # Inserted as an alias of a module with the same content
+    DEDUPLICATED = auto()
+
+    # Not an insertion status, but the total
+    # number of AST nodes that are inserted.
+    NODES = auto()
 
 
 class Statistics(Counter):
-    ...
+    def report(self, elapsed):
+        elapsed = max(elapsed, 1e-9)
+        logger.info(
+            "%d files (%.2f files/s) and %d nodes (%.2f nodes/s) "
+            "have been inserted in %.2f seconds",
+            self[Insertion.INSERTED],
+            self[Insertion.INSERTED] / elapsed,
+            self[Insertion.NODES],
+            self[Insertion.NODES] / elapsed,
+            elapsed,
+        )
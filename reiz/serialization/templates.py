@@ -0,0 +1,332 @@
+from collections import defaultdict
+from dataclasses import dataclass, field
+from enum import auto
+from functools import lru_cache
+from typing import Any, Dict, List, Tuple
+
+from reiz.ir import Schema
+from reiz.utilities import ReizEnum
+
+MODULE_REFERENCE = "parent_module"
+
+# Hard limits for a single insertion query. Nodes with the same template
+# are inserted together (up to ROW_LIMIT of them), as long as the total
+# amount of values in their arguments stays under the ELEMENT_LIMIT. A
+# single node is never split, so a query might exceed the ELEMENT_LIMIT
+# only when one node holds that many values by itself.
+ROW_LIMIT = 1000
+ELEMENT_LIMIT = 20_000
+
+
+class Slot(ReizEnum):
+    # Values that are passed as query arguments
+    INT = auto()
+    STR = auto()
+    INTS = auto()
+    STRS = auto()
+    ENUM = auto()
+    ENUMS = auto()
+    PAIRS = auto()
+
+    # Nodes that are already inserted, referenced by their ids
+    NODE = auto()
+    NODES = auto()
+
+    # The module that is being inserted
+    MODULE = auto()
+
+
+_SCALAR_TYPES = {
+    Slot.INT: "int64",
+    Slot.STR: "str",
+    Slot.ENUM: "str",
+    Slot.NODE: "uuid",
+}
+_SEQUENCE_TYPES = {
+    Slot.INTS: "int64",
+    Slot.STRS: "str",
+    Slot.ENUMS: "str",
+    Slot.NODES: "uuid",
+    Slot.PAIRS: "int64",
+}
+_REFERENCE_SLOTS = frozenset((Slot.NODE, Slot.NODES))
+
+
+@dataclass
+class PreparedQuery:
+    """A query and its arguments. The arguments that are listed in the
+    references hold node numbers (see InsertionPlan), which are resolved
+    into the ids of the already inserted nodes right before the query is
+    executed. The ids of the nodes that the query inserts are recorded
+    in the same way."""
+
+    source: str
+    arguments: Dict[str, Any] = field(default_factory=dict)
+    references: List[str] = field(default_factory=list)
+    nodes: List[int] = field(default_factory=list)
+
+    def execute(self, runner, ids=None, **arguments):
+        result = runner(self.source, **self.resolve(ids, arguments))
+        self.record(ids, result)
+        return result
+
+    def resolve(self, ids, arguments):
+        arguments.update(self.arguments)
+        for name in self.references:
+            arguments[name] = [ids[node] for node in self.arguments[name]]
+        return arguments
+
+    def record(self, ids, result):
+        if self.nodes:
+            for inserted_node in result:
+                ids[self.nodes[inserted_node.row]] = inserted_node.id
+
+    def release(self, ids):
+        # Each node is referenced only by its parent, so the ids can
+        # be dropped once the query is committed.
+        for name in self.references:
+            for node in self.arguments[name]:
+                ids.pop(node, None)
+
+
+def _column(name, kind):
+    return f"(<array<{kind}>>${name})"
+
+
+def _row_slice(name, kind):
+    # (<array<str>>$a0)[(<array<int64>>$a0_offsets)[row]:...[row + 1]]
+    offsets = _column(name + "_offsets", "int64")
+    return f"{_column(name, kind)}[{offsets}[row]:{offsets}[row + 1]]"
+
+
+@dataclass(frozen=True)
+class Template:
+    """A pre-constructed query that inserts a group of nodes with the
+    same type and the same field shape. Each field is passed as a
+    single array argument ($a0, $a1, ...) that has a value for each
+    row, and the sequences are flattened into a single array with
+    the offsets of each row ($a0_offsets)."""
+
+    source: str
+    slots: Tuple[Slot, ...]
+
+    def prepare(self, nodes, records):
+        arguments = {"rows": list(range(len(nodes)))}
+        references = []
+        for index, slot in enumerate(self.slots):
+            name = f"a{index}"
+            column = [record[index] for record in records]
+            if slot in _REFERENCE_SLOTS:
+                references.append(name)
+
+            if slot in _SCALAR_TYPES:
+                arguments[name] = column
+            elif slot is Slot.PAIRS:
+                pairs, offsets = _flatten(column)
+                arguments[name] = [number for number, _ in pairs]
+                arguments[name + "_names"] = [label for _, label in pairs]
+                arguments[name + "_offsets"] = offsets
+            else:
+                arguments[name], arguments[name + "_offsets"] = _flatten(
+                    column
+                )
+        return PreparedQuery(self.source, arguments, references, nodes)
+
+
+def _flatten(column):
+    values, offsets = [], [0]
+    for items in column:
+        values.extend(items)
+        offsets.append(len(values))
+    return values, offsets
+
+
+def _count_elements(record):
+    return sum(
+        len(value) if isinstance(value, list) else 1 for value in record
+    )
+
+
+def _get_target(kind_name, name):
+    pointer = Schema.get_pointers(Schema.wrap(kind_name))[Schema.wrap(name)]
+    return Schema.wrap(pointer.target, with_prefix=True)
+
+
+@lru_cache(maxsize=None)
+def get_template(kind_name, shape):
+    # FOR row IN {array_unpack(<array<int64>>$rows)}
+    # UNION (SELECT (INSERT ast::Name {
+    #     py_id := (<array<str>>$a0)[row], ...
+    # }) {row := row})
+    assignments = []
+    slots = []
+    for name, slot, base in shape:
+        argument = f"a{len(slots)}"
+        if slot is Slot.MODULE:
+            value = MODULE_REFERENCE
+        elif slot in (Slot.INT, Slot.STR):
+            value = f"{_column(argument, _SCALAR_TYPES[slot])}[row]"
+        elif slot is Slot.ENUM:
+            base = Schema.wrap(base, with_prefix=True)
+            value = f"<{base}>({_column(argument, 'str')}[row])"
+        elif slot in (Slot.INTS, Slot.STRS):
+            value = (
+                f"array_unpack({_row_slice(argument, _SEQUENCE_TYPES[slot])})"
+            )
+        elif slot is Slot.ENUMS:
+            base = Schema.wrap(base, with_prefix=True)
+            value = f"<{base}>array_unpack({_row_slice(argument, 'str')})"
+        elif slot is Slot.PAIRS:
+            # {(1, 'body'), (59, 'value'), ...}
+            start = f"{_column(argument + '_offsets', 'int64')}[row]"
+            names = _column(argument + "_names", "str")
+            value = (
+                "(FOR pair IN {enumerate(array_unpack("
+                f"{_row_slice(argument, 'int64')}"
+                f"))}} UNION (pair.1, {names}[{start} + pair.0]))"
+            )
+        elif slot is Slot.NODE:
+            target = _get_target(kind_name, name)
+            value = (
+                f"(SELECT {target} FILTER .id = "
+                f"{_column(argument, 'uuid')}[row] LIMIT 1)"
+            )
+        elif slot is Slot.NODES:
+            target = _get_target(kind_name, name)
+            value = (
+                "(FOR item IN {enumerate(array_unpack("
+                f"{_row_slice(argument, 'uuid')}"
+                f"))}} UNION (SELECT {target} {{@index := item.0}} "
+                "FILTER .id = item.1))"
+            )
+        else:
+            raise ValueError(f"Unexpected slot: {slot!r}")
+
+        if slot is not Slot.MODULE:
+            slots.append(slot)
+        assignments.append(f"{Schema.wrap(name)} := {value}")
+
+    model = Schema.wrap(kind_name, with_prefix=True)
+    body = ", ".join(assignments)
+    return Template(
+        f"WITH {MODULE_REFERENCE} := (SELECT "
+        f"{Schema.wrap('Module', with_prefix=True)} "
+        f"FILTER .id = <uuid>${MODULE_REFERENCE} LIMIT 1)\n"
+        "FOR row IN {array_unpack(<array<int64>>$rows)}\n"
+        f"UNION (SELECT (INSERT {model} {{{body}}}) {{row := row}})",
+        tuple(slots),
+    )
+
+
+def bind_value(slot, value):
+    if slot is Slot.ENUM:
+        return value.kind_name
+    elif slot is Slot.ENUMS:
+        return [item.kind_name for item in value]
+    elif slot is Slot.PAIRS:
+        return [list(pair) for pair in value]
+    else:
+        return value
+
+
+@dataclass
+class InsertionPlan:
+    """All the nodes of a module, in the form of their templates and
+    records (a value for each slot of the template, where the children
+    are referenced by their node numbers).
+
+    Nodes are inserted level by level (from the leaves to the top-level
+    statements) where all the nodes on the same level which share the
+    same template are inserted through the same query (in groups of at
+    most ROW_LIMIT nodes). The query texts only depend on the templates,
+    so they are shared between all the files."""
+
+    templates: List[Template] = field(default_factory=list)
+    records: List[List[Any]] = field(default_factory=list)
+    heights: List[int] = field(default_factory=list)
+
+    def add(self, template, record, children):
+        self.templates.append(template)
+        self.records.append(record)
+        self.heights.append(
+            max((self.heights[child] + 1 for child in children), default=0)
+        )
+        return len(self.records) - 1
+
+    def iter_queries(self):
+        groups = defaultdict(list)
+        for node, template in enumerate(self.templates):
+            groups[self.heights[node], template].append(node)
+
+        for (_, template), nodes in sorted(
+            groups.items(), key=lambda group: group[0][0]
+        ):
+            for chunk in self._split(nodes):
+                yield template.prepare(
+                    chunk, [self.records[node] for node in chunk]
+                )
+
+    def _split(self, nodes):
+        chunk, elements = [], 0
+        for node in nodes:
+            node_elements = _count_elements(self.records[node])
+            if chunk and (
+                len(chunk) >= ROW_LIMIT
+                or elements + node_elements > ELEMENT_LIMIT
+            ):
+                yield chunk
+                chunk, elements = [], 0
+            chunk.append(node)
+            elements += node_elements
+
+        if chunk:
+            yield chunk
+
+    def __len__(self):
+        return len(self.records)
+
+
+@lru_cache(maxsize=None)
+def get_deletion_query():
+    """A single query that deletes the given modules ($filenames)
+    alongside with all the nodes that belong to them."""
+
+    bindings = [
+        f"modules := (SELECT {Schema.wrap('Module', with_prefix=True)} "
+        "FILTER .filename IN array_unpack(<array<str>>$filenames))"
+    ]
+
+    models = [
+        Schema.wrap(kind.__name__, with_prefix=True)
+        for kind in Schema.module_annotated_types
+    ]
+    for name, object_type in Schema.object_types.items():
+        # Projects are shared between modules, so they are never deleted
+        if object_type.is_abstract or name in (
+            Schema.wrap("Module"),
+            "project",
+        ):
+            continue
+        if "_module" in Schema.get_pointers(name):
+            continue
+
+        paths = Schema.get_owner_paths(name)
+        filters = " OR ".join(f"{path} IN modules" for path in paths)
+        bindings.append(
+            f"deleted_{len(bindings) - 1} := (DELETE "
+            f"{Schema.wrap(name, with_prefix=True)} FILTER {filters})"
+        )
+
+    for model in models:
+        bindings.append(
+            f"deleted_{len(bindings) - 1} := "
+            f"(DELETE {model} FILTER ._module IN modules)"
+        )
+    bindings.append(f"deleted_{len(bindings) - 1} := (DELETE modules)")
+
+    counts = ", ".join(
+        f"count(deleted_{index})" for index in range(len(bindings) - 1)
+    )
+    return (
+        "WITH\n    " + ",\n    ".join(bindings) + f"\nSELECT sum({{{counts}}})"
+    )
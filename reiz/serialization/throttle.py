@@ -0,0 +1,85 @@
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Deque, Optional
+
+from reiz.ir import IR
+from reiz.utilities import logger
+
+# A cheap read (similar to what the web tier does) is sent every
+# PROBE_INTERVAL seconds, and the concurrency is re-evaluated once
+# PROBE_WINDOW new samples are collected.
+PROBE_INTERVAL = 0.5
+PROBE_WINDOW = 10
+
+# The concurrency is only increased when the p95 latency is
+# below HEADROOM * target.
+HEADROOM = 0.7
+
+
+def percentile(samples, fraction):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+@dataclass
+class Throttle:
+    """An adaptive limit on the number of active writers, driven by the
+    round-trip time of the probe queries that are sent by the ingester.
+    The limit is halved when the p95 latency exceeds the target, and it
+    is increased by one when there is enough headroom (AIMD)."""
+
+    target: float
+    max_workers: int
+    limit: int = 0
+    samples: Deque[float] = field(
+        default_factory=lambda: deque(maxlen=PROBE_WINDOW * 2)
+    )
+
+    _new_samples: int = 0
+    _stopped: threading.Event = field(default_factory=threading.Event)
+    _thread: Optional[threading.Thread] = None
+
+    def __post_init__(self):
+        self.limit = self.limit or self.max_workers
+
+    def observe(self, latency):
+        self.samples.append(latency)
+        self._new_samples += 1
+        if self._new_samples < PROBE_WINDOW:
+            return None
+
+        self._new_samples = 0
+        p95 = percentile(self.samples, 0.95)
+        if p95 > self.target and self.limit > 1:
+            self.limit = max(1, self.limit // 2)
+        elif p95 < self.target * HEADROOM and self.limit < self.max_workers:
+            self.limit += 1
+        else:
+            return None
+
+        logger.info(
+            "p95 latency is %.1fms, active writers are limited to %d",
+            p95 * 1000,
+            self.limit,
+        )
+
+    def start(self, pool):
+        self._thread = threading.Thread(
+            target=self._probe, args=(pool,), daemon=True
+        )
+        self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def _probe(self, pool):
+        query = IR.construct_prepared("project.names")
+        with pool.new_connection() as connection:
+            while not self._stopped.wait(PROBE_INTERVAL):
+                start = time.perf_counter()
+                connection.query(query)
+                self.observe(time.perf_counter() - start)
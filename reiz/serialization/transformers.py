@@ -1,7 +1,14 @@
 import ast
+from hashlib import blake2b
+from itertools import chain
 
 from reiz.ir import Schema
 
+# 64-bit tags, so that they fit into the int64 _tag property
+TAG_SIZE = 8
+
+_DECORATED_TYPES = (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)
+
 
 def iter_attributes(node):
     for attribute in node._attributes:
@@ -10,18 +17,22 @@ def iter_attributes(node):
 
 
 def iter_properties(node):
-    yield from ast.iter_fields(node)
-    yield from iter_attributes(node)
+    # Fields that are dropped by the indexing profile are never stored
+    for field, value in chain(ast.iter_fields(node), iter_attributes(node)):
+        if not Schema.profile.drops_node_field(node, field):
+            yield field, value
 
 
-def iter_children(node):
-    for field, value in ast.iter_fields(node):
-        if isinstance(value, ast.AST):
-            yield field, value
-        elif isinstance(value, list):
-            for item in value:
-                if isinstance(item, ast.AST):
-                    yield field, item
+def get_depth(tree):
+    depth = 0
+    stack = [(tree, 1)]
+    while stack:
+        node, node_depth = stack.pop()
+        depth = max(depth, node_depth)
+        stack.extend(
+            (child, node_depth + 1) for child in ast.iter_child_nodes(node)
+        )
+    return depth
 
 
 def alter_ast(node, alter_type, value):
@@ -45,28 +56,29 @@ def annotate_ast_types(node_type, base=None, last_id=0):
     return last_id + 1
 
 
-def calculate_node_tag(node):
-    if hasattr(node, "tag"):
-        return node.raw_tag
-    elif node is None:
-        return -1
-    elif not isinstance(node, ast.AST):
-        return node
-
-    tag = [node.type_id]
-    for field, value in ast.iter_fields(node):
-        if field in Schema.tag_excluded_fields:
-            continue
+def _encode_field(value, digests):
+    if value is None:
+        return b"\x00"
+    elif isinstance(value, ast.AST) and value.is_enum:
+        # Enum members (operators, contexts) are shared between nodes
+        return b"e%s" % value.kind_name.encode()
+    elif isinstance(value, ast.AST):
+        return b"n" + digests.pop(id(value))
+    elif isinstance(value, list):
+        items = b"".join(_encode_field(item, digests) for item in value)
+        return b"l%d:%s" % (len(value), items)
+    else:
+        kind = type(value).__name__.encode()
+        encoded = str(value).encode("utf-8", "surrogatepass")
+        return b"%s%d:%s" % (kind, len(encoded), encoded)
 
-        if isinstance(value, ast.AST) or value is None:
-            tag.append(calculate_node_tag(value))
-        elif isinstance(value, list):
-            tag.append(tuple(calculate_node_tag(item) for item in value))
-        else:
-            tag.append(value)
 
-    node.raw_tag = tuple(tag)
-    return node.raw_tag
+def _node_digest(node, digests):
+    digest = blake2b(node.kind_name.encode(), digest_size=TAG_SIZE)
+    for field, value in ast.iter_fields(node):
+        if field not in Schema.tag_excluded_fields:
+            digest.update(_encode_field(value, digests))
+    return digest.digest()
 
 
 class Sentinel(ast.expr):
@@ -90,6 +102,7 @@ ast.project = project
 
 alter_ast(ast.Module, "_fields", "filename")
 alter_ast(ast.Module, "_fields", "project")
+alter_ast(ast.Module, "_fields", "checksum")
 
 alter_ast(ast.slice, "_attributes", "sentinel")
 
@@ -99,98 +112,71 @@ for sum_type in Schema.module_annotated_types:
     alter_ast(sum_type, "_attributes", "_parent_types")
 
 
-class QLAst(ast.NodeTransformer):
-    """
-    Takes the raw AST generated from 3.8 Python
-    parser, and post-processes it according to
-    fit it into the EdgeQL format
-    """
-
-    def add_parents(self, tree):
-        tree._parent = None
-        tree._parent_field = None
-        for parent in ast.walk(tree):
-            for field, child in iter_children(parent):
-                child._parent = parent
-                child._parent_field = field
-
-    def get_parents(self, node):
-        while parent := node._parent:
-            yield node._parent_field, parent
-            node = parent
-
-    def annotate(self, tree):
-        self.add_parents(tree)
-
-    def visit(self, node):
-        result = super().visit(node)
-
-        # Allow visiting of sum types with the transformed
-        # nodes. For an example if a Slice() transformer,
-        # visit_slice will be called with the new value.
-        if (base := infer_base(node)) is not type(node):
-            if visitor := getattr(self, f"visit_{base.__name__}", None):
-                result = visitor(result)
-
-        # If we define a custom visitor, ensure all child
-        # nodes are visited afterwards.
-        if hasattr(self, f"visit_{type(node).__name__}"):
-            self.generic_visit(node)
-        return result
-
-    def visit_annotated_base(self, node):
-        calculate_node_tag(node)
-        node._tag = hash(node.raw_tag)
-        node._parent_types = list(
-            {
-                (parent.type_id, field)
-                for field, parent in self.get_parents(node)
-                if field is not None
-            }
-        )
-        return node
-
-    visit_expr = visit_annotated_base
-    visit_stmt = visit_annotated_base
-    visit_arg = visit_annotated_base
-
-    def visit_slice(self, node):
+def _transform(node):
+    # Transformations that are applied before the node is tagged
+    if isinstance(node, ast.Constant):
+        node.value = repr(node.value)
+    elif isinstance(node, ast.slice):
         node.sentinel = Sentinel()
-        return node
+    elif isinstance(node, _DECORATED_TYPES) and node.decorator_list:
+        first_decorator = node.decorator_list[0]
+        node.lineno = first_decorator.lineno
+        node.col_offset = first_decorator.col_offset - 1  # '@'
 
-    def visit_decorated(self, node):
-        if len(node.decorator_list) >= 1:
-            first_decorator = node.decorator_list[0]
-            node.lineno = first_decorator.lineno
-            node.col_offset = first_decorator.col_offset - 1  # '@'
-        return node
 
-    visit_FunctionDef = visit_decorated
-    visit_AsyncFunctionDef = visit_decorated
-    visit_ClassDef = visit_decorated
+def _iter_fields(node, parent_types):
+    # Yield the child nodes alongside with the (type_id, field) pairs
+    # of all their ancestors. Since these sets are shared between all
+    # the children of the same field (and re-used as is when the pair
+    # is already in there), they stay small even for the deep trees.
+    for field, value in ast.iter_fields(node):
+        if isinstance(value, ast.AST):
+            children = (value,)
+        elif isinstance(value, list):
+            children = value
+        else:
+            continue
 
-    def visit_Constant(self, node):
-        node.value = repr(node.value)
-        return node
+        pair = (node.type_id, field)
+        if pair not in parent_types:
+            field_parent_types = parent_types | {pair}
+        else:
+            field_parent_types = parent_types
 
+        for child in children:
+            # Enum members (operators, contexts) are shared between nodes
+            if isinstance(child, ast.AST) and not child.is_enum:
+                yield child, field_parent_types
 
-def infer_base(node):
-    """
-    If node belongs to a sum type, return the base type,
-    if not, return its original type
-    """
 
-    node_type = type(node)
-    if node_type.__base__ is ast.AST:
-        return node_type
-    else:
-        return node_type.__base__
+def prepare_ast(tree):
+    """Post-process the raw AST to fit it into the EdgeQL format through
+    a single iterative traversal. The transformations and the parent
+    types (the (type_id, field) pairs of all ancestors) are applied when
+    a node is first reached, and the tags are calculated in post-order
+    when all of its children are done."""
+
+    digests = {}
+    stack = [(tree, frozenset(), False)]
+    while stack:
+        node, parent_types, is_visited = stack.pop()
+        is_annotated = isinstance(node, Schema.module_annotated_types)
+        if is_visited:
+            digests[id(node)] = digest = _node_digest(node, digests)
+            if is_annotated:
+                node._tag = int.from_bytes(digest, "little", signed=True)
+            continue
 
+        _transform(node)
+        if is_annotated:
+            node._parent_types = list(parent_types)
 
-def prepare_ast(tree):
-    visitor = QLAst()
-    visitor.annotate(tree)
-    return visitor.visit(tree)
+        stack.append((node, parent_types, True))
+        stack.extend(
+            (child, child_parent_types, False)
+            for child, child_parent_types in _iter_fields(node, parent_types)
+        )
+    return tree
 
 
 annotate_ast_types(ast.AST)
@@ -51,12 +51,12 @@ def guarded(arg, *, ignored_exceptions=()):
             try:
                 return func(*args, **kwargs)
             except ignored_exceptions:
-                return None
+                return default_value
             except Exception:
                 logger.exception(
                     "Guarded function %r failed the execution", func.__name__
                 )
-                return None
+                return default_value
 
         return wrapper
 
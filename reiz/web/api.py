@@ -1,3 +1,4 @@
+import asyncio
 import json
 import traceback
 from dataclasses import asdict
@@ -10,16 +11,17 @@ from sanic.response import json as json_response
 from sanic_cors import CORS
 from sanic_limiter import Limiter, get_remote_address
 
-from reiz.config import config
+from reiz.config import config, get_state_version, read_database_name
 from reiz.database import get_async_db_pool
 from reiz.fetch import (
+    QUERY_CACHE,
     STATISTICS_NODES,
     STATS_QUERY,
     run_query_on_async_connection,
 )
 from reiz.ir import IR
 from reiz.reizql import ReizQLSyntaxError, compile_to_ir, parse_query
-from reiz.utilities import normalize
+from reiz.utilities import logger, normalize
 
 app = Sanic(__name__)
 app.config["KEEP_ALIVE_TIMEOUT"] = 120
@@ -33,6 +35,8 @@ STATIC_DIR = WORKSPACE / "static"
 
 @app.listener("before_server_start")
 async def init(sanic, loop):
+    app.database_lock = asyncio.Lock()
+    app.state_version = get_state_version()
     app.database_pool = await get_async_db_pool()
     if config.redis.cache:
         app.redis_pool = await aioredis.create_redis_pool(
@@ -47,11 +51,37 @@ async def close_db(app, loop):
         await app.redis_pool.wait_closed()
 
 
+async def get_database_pool():
+    # Bulk loads (scripts/bulk_load.py) atomically switch the database
+    # in the state file once the new generation is ready, so the following
+    # requests are served from it while the old pool is drained.
+    state_version = get_state_version()
+    if state_version == app.state_version:
+        return app.database_pool
+
+    async with app.database_lock:
+        if state_version != app.state_version:
+            database = read_database_name()
+            if database != config.database.database:
+                logger.info("switching the database to %s", database)
+                config.database.database = database
+                old_pool = app.database_pool
+                app.database_pool = await get_async_db_pool()
+                asyncio.ensure_future(old_pool.aclose())
+            app.state_version = state_version
+    return app.database_pool
+
+
+def cache_key(key):
+    # Results of different database generations are cached separately
+    return json.dumps([config.database.database, key])
+
+
 async def check_cache(key):
     if not config.redis.cache:
         return None
 
-    entry = await app.redis_pool.get(json.dumps(key))
+    entry = await app.redis_pool.get(cache_key(key))
     if entry is not None:
         return json.loads(entry)
 
@@ -60,7 +90,7 @@ async def set_cache(key, value):
     if not config.redis.cache:
         return None
 
-    await app.redis_pool.set(json.dumps(key), json.dumps(value))
+    await app.redis_pool.set(cache_key(key), json.dumps(value))
 
 
 @app.route("/")
@@ -80,10 +110,11 @@ async def query(request):
     if not (reiz_ql := request.json["query"]):
         return success([])
 
+    database_pool = await get_database_pool()
     if entry := await check_cache(request.json):
         return success(entry)
 
-    async with app.database_pool.acquire() as connection:
+    async with database_pool.acquire() as connection:
         try:
             results = await run_query_on_async_connection(
                 connection, reiz_ql, offset=offset
@@ -121,10 +152,13 @@ async def analyze_query(request):
 
 @app.route("/stats", methods=["GET"])
 async def stats(request):
-    async with app.database_pool.acquire() as connection:
+    database_pool = await get_database_pool()
+    async with database_pool.acquire() as connection:
         stats = tuple(await connection.query(STATS_QUERY))
 
-    return success(dict(zip(STATISTICS_NODES, stats)))
+    return success(
+        dict(zip(STATISTICS_NODES, stats)), query_cache=QUERY_CACHE.info()
+    )
 
 
 def success(result_set, **kwargs):
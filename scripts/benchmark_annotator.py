@@ -0,0 +1,81 @@
+#!/usr/bin/env python
+import sysconfig
+import time
+import tokenize
+import tracemalloc
+import warnings
+from argparse import ArgumentParser
+from pathlib import Path
+
+from reiz.serialization.transformers import ast, prepare_ast
+
+DEFAULT_CORPUS = Path(sysconfig.get_paths()["stdlib"])
+
+
+def load_corpus(directory, max_files):
+    sources = []
+    for file in sorted(directory.glob("**/*.py")):
+        if len(sources) >= max_files:
+            break
+        try:
+            with tokenize.open(file) as stream:
+                source = stream.read()
+            ast.parse(source)
+        except (SyntaxError, UnicodeDecodeError, ValueError, OSError):
+            continue
+        sources.append(source)
+    return sources
+
+
+def benchmark(sources, trace_memory):
+    parse_time = annotate_time = total_nodes = peak_memory = 0
+    for source in sources:
+        start = time.perf_counter()
+        tree = ast.parse(source)
+        parse_time += time.perf_counter() - start
+
+        if trace_memory:
+            tracemalloc.start()
+
+        start = time.perf_counter()
+        prepare_ast(tree)
+        annotate_time += time.perf_counter() - start
+
+        if trace_memory:
+            _, peak = tracemalloc.get_traced_memory()
+            peak_memory = max(peak_memory, peak)
+            tracemalloc.stop()
+
+        total_nodes += sum(1 for _ in ast.walk(tree))
+
+    return parse_time, annotate_time, total_nodes, peak_memory
+
+
+def main():
+    parser = ArgumentParser(
+        description="Measure the annotation (prepare_ast) throughput"
+    )
+    parser.add_argument("corpus", type=Path, nargs="?", default=DEFAULT_CORPUS)
+    parser.add_argument("--max-files", type=int, default=5_000)
+    parser.add_argument("--trace-memory", action="store_true")
+    options = parser.parse_args()
+
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore")
+        sources = load_corpus(options.corpus, options.max_files)
+        parse_time, annotate_time, total_nodes, peak_memory = benchmark(
+            sources, options.trace_memory
+        )
+
+    print(f"{len(sources)} files with {total_nodes} nodes")
+    print(f"parsing took {parse_time:.2f} seconds")
+    print(
+        f"annotating took {annotate_time:.2f} seconds "
+        f"({total_nodes / annotate_time:.0f} nodes/s)"
+    )
+    if options.trace_memory:
+        print(f"peak memory of a single file: {peak_memory / 1024:.0f} KiB")
+
+
+if __name__ == "__main__":
+    main()
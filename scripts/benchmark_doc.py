@@ -16,6 +16,7 @@ queries = [
     "BinOp(left=Constant(), right=Constant())",
     "Try(handlers=LEN(min=3, max=5))",
     "ClassDef(body=[Assign(), *..., FunctionDef()])",
+    'FunctionDef(body=[Return(Call(Attribute(Name("a"), "b"), args=[...]))])',
 ]
 
 
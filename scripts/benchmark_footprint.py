@@ -0,0 +1,94 @@
+#!/usr/bin/env python
+import statistics
+import sysconfig
+import tracemalloc
+import warnings
+from argparse import ArgumentParser
+from pathlib import Path
+
+from reiz.config import config
+from reiz.sampling import SamplingData
+from reiz.serialization.context import GlobalContext
+from reiz.serialization.memory import BASE_FOOTPRINT, FOOTPRINT_RATIO
+from reiz.serialization.serializer import prepare_module
+
+DEFAULT_CORPUS = Path(sysconfig.get_paths()["stdlib"])
+
+# Files smaller than this (in bytes) are used for measuring the base
+# footprint, which doesn't depend on the size of the source.
+SMALL_FILE = 1024
+
+
+def measure(corpus, max_files):
+    # Peak memory (traced by tracemalloc) of reading, parsing, annotating
+    # and preparing the queries of each file, alongside with its size.
+    config.data.path = corpus.parent
+    project = SamplingData(corpus.name, 0, "<unknown>")
+    project_ctx = GlobalContext().new_child(project, None)
+
+    measurements = []
+    for file in sorted(corpus.glob("**/*.py")):
+        if len(measurements) >= max_files:
+            break
+
+        file_ctx = project_ctx.new_child(file)
+        tracemalloc.start()
+        try:
+            if tree := file_ctx.as_ast():
+                prepare_module(tree, file_ctx)
+        except Exception:
+            continue
+        else:
+            if tree is not None:
+                _, peak = tracemalloc.get_traced_memory()
+                measurements.append((file_ctx.size, peak))
+        finally:
+            tracemalloc.stop()
+    return measurements
+
+
+def calibrate(measurements):
+    base = statistics.median(
+        peak for size, peak in measurements if size < SMALL_FILE
+    )
+    ratio = statistics.median(
+        (peak - base) / size
+        for size, peak in measurements
+        if size >= SMALL_FILE
+    )
+    return base, ratio
+
+
+def main():
+    parser = ArgumentParser(
+        description="Measure the memory footprint of preparing a file, "
+        "for calibrating reiz.serialization.memory"
+    )
+    parser.add_argument("corpus", type=Path, nargs="?", default=DEFAULT_CORPUS)
+    parser.add_argument("--max-files", type=int, default=2_000)
+    options = parser.parse_args()
+
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore")
+        measurements = measure(options.corpus.resolve(), options.max_files)
+
+    base, ratio = calibrate(measurements)
+    print(f"{len(measurements)} files")
+    print(
+        f"BASE_FOOTPRINT = {base / 1024:.0f} KiB (now {BASE_FOOTPRINT // 1024})"
+    )
+    print(f"FOOTPRINT_RATIO = {ratio:.0f} (now {FOOTPRINT_RATIO})")
+
+    # How often the current estimate is below the actual peak
+    underestimated = sum(
+        peak > BASE_FOOTPRINT + size * FOOTPRINT_RATIO
+        for size, peak in measurements
+    )
+    print(
+        f"current estimate is below the peak for {underestimated} files "
+        f"({underestimated / len(measurements):.1%})"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,142 @@
+#!/usr/bin/env python
+
+import re
+import time
+from contextlib import suppress
+from pathlib import Path
+
+from edgedb.errors import EdgeDBError
+
+from reiz.config import config, forget_database, read_state, switch_database
+from reiz.database import drop_and_load_db, get_new_connection
+from reiz.serialization.insert import (
+    insert_dataset,
+    make_parser,
+    parse_options,
+    run,
+)
+from reiz.utilities import STATIC_DIR, logger
+
+DEFAULT_SCHEMA = STATIC_DIR / "Python-reiz.esdl"
+GENERATION_PATTERN = re.compile(r"_g\d+$")
+
+# Retired generations are kept around for this long (in seconds), so that
+# the in-flight requests of the web tier can still be served from them.
+DEFAULT_GRACE_PERIOD = 60 * 60
+
+
+def new_generation(database):
+    # reiz => reiz_g1602720000, reiz_g1602720000 => reiz_g1602806400
+    base = GENERATION_PATTERN.sub("", database)
+    return f"{base}_g{int(time.time())}"
+
+
+def apply_deferred_statements(statements, database):
+    with get_new_connection(database=database) as connection:
+        for statement in statements:
+            logger.info("Executing %r...", statement)
+            connection.execute(statement)
+
+
+def drop_generation(database):
+    with get_new_connection(database="edgedb") as connection:
+        try:
+            connection.execute(f"DROP DATABASE {database}")
+        except EdgeDBError:
+            logger.exception("%s couldn't be dropped", database)
+            return False
+        else:
+            logger.info("%s has been dropped", database)
+            return True
+
+
+def drop_retired_generations(grace_period=DEFAULT_GRACE_PERIOD):
+    """Drop the generations that were retired (switched away from) at
+    least `grace_period` seconds ago."""
+
+    now = time.time()
+    retired = read_state().get("retired", {})
+    for database, retired_at in retired.items():
+        if now - retired_at < grace_period:
+            logger.info(
+                "%s is still in its grace period (%d seconds left)",
+                database,
+                grace_period - (now - retired_at),
+            )
+        elif drop_generation(database):
+            forget_database(database)
+
+
+def bulk_load(
+    dataset_path,
+    schema=DEFAULT_SCHEMA,
+    reboot_server=False,
+    drop_retired=False,
+    grace_period=DEFAULT_GRACE_PERIOD,
+    **insert_options,
+):
+    """Insert the dataset into a fresh database (generation) without
+    any constraints or indexes, build them once all the files are in,
+    and then atomically switch the state file to the new generation. The
+    web tier keeps serving from the old one until the switch, and the old
+    one is only dropped by a later run (drop_retired) once its grace
+    period is over."""
+
+    previous_generation = config.database.database
+    generation = new_generation(previous_generation)
+
+    deferred_statements = drop_and_load_db(
+        schema,
+        reboot_server=reboot_server,
+        database=generation,
+        deferred_constraints=True,
+    )
+
+    # Only the current process is pointed to the new generation
+    config.database.database = generation
+    try:
+        start = time.perf_counter()
+        insert_dataset(dataset_path, **insert_options)
+        logger.info(
+            "%s has been loaded in %.2f seconds",
+            generation,
+            time.perf_counter() - start,
+        )
+
+        start = time.perf_counter()
+        apply_deferred_statements(deferred_statements, generation)
+        logger.info(
+            "deferred constraints have been built in %.2f seconds",
+            time.perf_counter() - start,
+        )
+    except BaseException:
+        config.database.database = previous_generation
+        logger.error(
+            "bulk load failed, still serving from %s", previous_generation
+        )
+        with suppress(Exception):
+            drop_generation(generation)
+        raise
+
+    switch_database(generation, previous_generation)
+    logger.info("switched from %s to %s", previous_generation, generation)
+
+    if drop_retired:
+        drop_retired_generations(grace_period)
+    return generation
+
+
+def main():
+    parser = make_parser()
+    parser.add_argument("--schema", type=Path, default=DEFAULT_SCHEMA)
+    parser.add_argument("--reboot-server", action="store_true")
+    # Drop the generations whose grace period is over
+    parser.add_argument("--drop-retired", action="store_true")
+    parser.add_argument(
+        "--grace-period", type=int, default=DEFAULT_GRACE_PERIOD
+    )
+    run(bulk_load, parse_options(parser))
+
+
+if __name__ == "__main__":
+    main()
@@ -2,7 +2,9 @@
 
 from argparse import ArgumentParser
 
+from reiz.config import config
 from reiz.schema.builders import generate_schema
+from reiz.schema.profile import get_profile
 
 
 def main(argv=None):
@@ -10,8 +12,14 @@ def main(argv=None):
     parser.add_argument("input_file")
     parser.add_argument("output_file")
     parser.add_argument("schema_file")
+    parser.add_argument(
+        "--profile",
+        help="indexing profile (from the config) to generate the schema for",
+    )
 
-    generate_schema(**vars(parser.parse_args(argv)))
+    options = parser.parse_args(argv)
+    options.profile = get_profile(config, options.profile)
+    generate_schema(**vars(options))
 
 
 if __name__ == "__main__":
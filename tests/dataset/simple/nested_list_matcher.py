@@ -0,0 +1,12 @@
+outer(inner(a, z))  # reiz: tp
+outer(inner(a, b, c, z))  # reiz: tp
+outer(inner(a, *b, z))  # reiz: tp
+
+outer(inner(a))
+outer(inner(z))
+outer(inner(z, a))
+outer(inner(a, z, b))
+outer(inner(b, a, z))
+outer(inner(a, z), inner(a, z))
+outer(inner(a, z), b)
+outer(a, z)
@@ -0,0 +1,53 @@
+def foo():  # reiz: tp
+    """docstring"""
+    if x:
+        pass
+    return x
+
+
+def bar():  # reiz: tp
+    """docstring"""
+    a = 1
+    b = 2
+    if a:
+        pass
+    return b
+
+
+def baz():  # reiz: tp
+    print()
+    for x in y:
+        pass
+    if x:
+        pass
+    else:
+        pass
+    return
+
+
+def qux():
+    """docstring"""
+    return x
+
+
+def quux():
+    """docstring"""
+    if x:
+        pass
+    a = 1
+    return x
+
+
+def corge():
+    a = 1
+    if x:
+        pass
+    return x
+
+
+def grault():
+    """docstring"""
+    if x:
+        pass
+    return x
+    pass
@@ -15,7 +15,7 @@ from typing import Set
 import edgedb
 
 from reiz.config import config
-from reiz.database import get_new_connection
+from reiz.database import drop_and_load_db, get_new_connection
 from reiz.fetch import compile_query, process_queryset
 from reiz.ir import IR
 from reiz.sampling import SamplingData
@@ -23,10 +23,6 @@ from reiz.serialization.insert import insert_projects
 from reiz.utilities import logger
 
 REPO_PATH = Path(__file__).parent.parent.resolve()
-sys.path.insert(0, REPO_PATH)
-
-from scripts.reset_db import drop_and_load_db
-
 TESTING_PATH = REPO_PATH / "tests"
 DATASET_PATH = TESTING_PATH / "dataset"
 QUERIES_PATH = TESTING_PATH / "queries"
@@ -0,0 +1,55 @@
+from pathlib import Path
+
+import pytest
+
+from reiz.config import config
+from reiz.sampling import SamplingData
+from reiz.serialization.context import GlobalContext
+
+TESTING_PATH = Path(__file__).parent.parent.resolve()
+DATASET_PATH = TESTING_PATH / "dataset"
+
+
+@pytest.fixture
+def global_context(monkeypatch):
+    monkeypatch.setattr(config.data, "path", TESTING_PATH)
+    return GlobalContext({})
+
+
+@pytest.fixture
+def file_context(global_context):
+    project = global_context.new_child(
+        SamplingData("dataset", 0, "<unknown>"), None
+    )
+
+    def new_file_context(name):
+        return project.new_child(DATASET_PATH / name)
+
+    return new_file_context
+
+
+@pytest.fixture
+def make_project(tmp_path, monkeypatch):
+    """Write the given files (name -> source) into a project under
+    a temporary data path, and return the context of that project."""
+
+    monkeypatch.setattr(config.data, "path", tmp_path)
+
+    def make_project(
+        files,
+        name="project",
+        global_ctx=None,
+        connection=None,
+        **properties,
+    ):
+        (tmp_path / name).mkdir(exist_ok=True)
+        for filename, source in files.items():
+            (tmp_path / name / filename).write_text(source)
+
+        if global_ctx is None:
+            global_ctx = GlobalContext(properties)
+        return global_ctx.new_child(
+            SamplingData(name, 0, "<unknown>"), connection
+        )
+
+    return make_project
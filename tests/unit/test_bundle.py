@@ -0,0 +1,59 @@
+import pytest
+
+from reiz.sampling import SamplingData
+from reiz.serialization import bundle
+from reiz.serialization.bundle import (
+    build_bundle,
+    load_payload,
+    read_header,
+    read_records,
+    write_record,
+)
+from reiz.serialization.serializer import prepare_module
+from reiz.serialization.statistics import Insertion
+
+PROJECT = SamplingData("dataset", 0, "<unknown>")
+
+
+def test_bundle_round_trip(global_context, file_context, tmp_path):
+    stats = build_bundle(PROJECT, tmp_path, global_context.properties)
+    bundle_path = tmp_path / "dataset.bundle"
+
+    with open(bundle_path, "rb") as stream:
+        records = read_records(stream)
+        assert read_header(bundle_path, records) == PROJECT
+
+        loaded = {}
+        for data in records:
+            loaded[data["filename"]] = load_payload(data["payload"])
+
+    assert len(loaded) == stats[Insertion.INSERTED]
+    context = file_context("simple/call.py")
+    assert loaded[context.filename] == prepare_module(
+        context.as_ast(), context
+    )
+
+
+def test_bundle_records(tmp_path):
+    records = [{"a": [1, 2, 3]}, {}, {"b": "c" * 10_000}]
+    with open(tmp_path / "records", "wb") as stream:
+        for record in records:
+            write_record(stream, record)
+
+    with open(tmp_path / "records", "rb") as stream:
+        assert list(read_records(stream)) == records
+
+
+@pytest.mark.parametrize(
+    "header",
+    [
+        {"version": bundle.BUNDLE_VERSION - 1},
+        {"schema": "0" * 32},
+        {"version": None, "schema": None},
+    ],
+)
+def test_bundle_stale_header(header, tmp_path):
+    valid_header = bundle.make_header(PROJECT)
+    records = iter([{**valid_header, **header}])
+    with pytest.raises(ValueError):
+        read_header(tmp_path / "dataset.bundle", records)
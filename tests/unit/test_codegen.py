@@ -0,0 +1,48 @@
+import re
+
+from reiz.fetch import compile_query
+from reiz.ir import IR
+
+
+def compile_to_text(reiz_ql):
+    return IR.construct(compile_query(reiz_ql, limit=None, offset=0))
+
+
+def iter_indices(query):
+    # Leading items are filtered by their position, and the trailing
+    # ones relatively to the (shared) length of the sequence.
+    for match in re.finditer(r"FILTER @index = (?:(\w+) - )?(\d+)", query):
+        length, position = match.groups()
+        if length is None:
+            yield int(position)
+        else:
+            yield -int(position)
+
+
+def test_leading_items():
+    query = compile_to_text("FunctionDef(body=[Expr(), ..., If()])")
+    assert list(iter_indices(query)) == [0, 2]
+    assert "count(.body) = 3" in query
+    assert "ORDER BY" not in query
+
+
+def test_trailing_items():
+    query = compile_to_text("FunctionDef(body=[Expr(), *..., If(), Return()])")
+    assert list(iter_indices(query)) == [0, -2, -1]
+
+    # The count is only computed once, for both the length
+    # check and the trailing items.
+    assert query.count("count(.body)") == 1
+    (length,) = re.findall(r"(\w+) := count\(\.body\)", query)
+    assert f"FILTER @index = {length} - 2" in query
+    assert f"{length} >= 3" in query
+
+
+def test_nested_trailing_items():
+    query = compile_to_text(
+        "Expr(Call(args=[Call(args=[Name('a'), *..., Name('z')])]))"
+    )
+    assert list(iter_indices(query)) == [0, 0, -1]
+    # The items of the inner list are resolved through the
+    # outer one, for each of its items.
+    assert query.count("FOR _singleton IN") == 3
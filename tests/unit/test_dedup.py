@@ -0,0 +1,177 @@
+import threading
+import time
+from contextlib import contextmanager
+from types import SimpleNamespace
+
+import pytest
+
+from reiz.ir import Schema
+from reiz.schema.profile import IndexingProfile
+from reiz.serialization import context as context_module
+from reiz.serialization import manifest as manifest_module
+from reiz.serialization.dedup import ALIAS_QUERY, FIND_QUERY, ContentIndex
+from reiz.serialization.insert import deduplicate
+from reiz.serialization.statistics import Insertion
+
+
+class FakeConnection:
+    def __init__(self, modules=()):
+        self.modules = dict(modules)
+        self.queries = []
+
+    def query(self, query, **arguments):
+        self.queries.append((query, arguments))
+        if query == FIND_QUERY and arguments["checksum"] in self.modules:
+            return [SimpleNamespace(id=self.modules[arguments["checksum"]])]
+        return []
+
+    def query_one(self, query, **arguments):
+        self.queries.append((query, arguments))
+        return SimpleNamespace(id="alias")
+
+    @contextmanager
+    def transaction(self):
+        yield
+
+
+def test_content_index_complete():
+    index = ContentIndex(is_complete=True)
+    connection = FakeConnection({"a": "module-a"})
+    assert index.find("a", connection) is None
+    assert not connection.queries
+
+    index.add("a", "module-b")
+    assert index.find("a", connection) == "module-b"
+
+
+def test_content_index_database():
+    index = ContentIndex(is_complete=False)
+    connection = FakeConnection({"a": "module-a"})
+    assert index.find("a", connection) == "module-a"
+    assert index.find("a", connection) == "module-a"
+    assert index.find("b", connection) is None
+    assert len(connection.queries) == 2
+
+
+def test_content_index_claims():
+    index = ContentIndex()
+    events = []
+
+    def insert(name):
+        with index.claim("a"):
+            events.append((name, "start"))
+            time.sleep(0.01)
+            events.append((name, "end"))
+
+    threads = [threading.Thread(target=insert, args=(name,)) for name in "xyz"]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    # Files with the same content are serialized, and the claim
+    # is dropped once the last one of them releases it.
+    assert [event for _, event in events] == ["start", "end"] * 3
+    assert not index._claims
+
+    with pytest.raises(RuntimeError):
+        with index.claim("b"):
+            raise RuntimeError
+    assert not index._claims
+
+
+def test_deduplicate(make_project):
+    project_ctx = make_project(
+        {"a.py": "x = 1", "b.py": "x = 1", "c.py": "x = 2"}, deduplicate=True
+    )
+    connection = FakeConnection()
+
+    inserted = []
+
+    def inserter(context):
+        inserted.append(context.filename)
+        context.content_index.add(context.checksum, context.filename)
+        return Insertion.INSERTED
+
+    contexts = [
+        project_ctx.new_child(project_ctx.path / name)
+        for name in ["a.py", "b.py", "c.py"]
+    ]
+    statuses = [
+        deduplicate(context, connection, inserter, context)
+        for context in contexts
+    ]
+    assert statuses == [
+        Insertion.INSERTED,
+        Insertion.DEDUPLICATED,
+        Insertion.INSERTED,
+    ]
+    assert inserted == ["project/a.py", "project/c.py"]
+    assert [
+        arguments
+        for query, arguments in connection.queries
+        if query == ALIAS_QUERY
+    ] == [
+        {
+            "module": "project/a.py",
+            "filename": "project/b.py",
+            "project": "project",
+        }
+    ]
+    assert project_ctx.db_cache.has_file("project/b.py")
+
+
+def test_deduplicate_disabled(make_project):
+    project_ctx = make_project({"a.py": "x = 1"})
+    context = project_ctx.new_child(project_ctx.path / "a.py")
+    status = deduplicate(context, FakeConnection(), lambda: Insertion.INSERTED)
+    assert status is Insertion.INSERTED
+    assert "checksum" not in context.__dict__
+
+
+def count_hashes(monkeypatch):
+    hashes = []
+
+    def hash_file(path):
+        hashes.append(path)
+        return "digest"
+
+    monkeypatch.setattr(context_module, "hash_file", hash_file)
+    monkeypatch.setattr(manifest_module, "hash_file", hash_file)
+    return hashes
+
+
+@pytest.mark.parametrize(
+    "properties, expected_hashes",
+    [
+        ({}, 0),
+        ({"deduplicate": True}, 1),
+        ({"incremental": True}, 1),
+        ({"deduplicate": True, "incremental": True}, 1),
+    ],
+)
+def test_checksum(properties, expected_hashes, make_project, monkeypatch):
+    hashes = count_hashes(monkeypatch)
+    project_ctx = make_project({"a.py": "x = 1"}, **properties)
+    context = project_ctx.new_child(project_ctx.path / "a.py")
+
+    tree = context.as_ast()
+    context.cache()
+    assert len(hashes) == expected_hashes
+    assert hasattr(tree, "checksum") is bool(expected_hashes)
+
+
+def test_deduplicate_skipped_filename(make_project, monkeypatch):
+    monkeypatch.setattr(Schema, "profile", IndexingProfile(skip_tests=True))
+    project_ctx = make_project(
+        {"a.py": "x = 1", "test_a.py": "x = 1"}, deduplicate=True
+    )
+    connection = FakeConnection(
+        {project_ctx.new_child(project_ctx.path / "a.py").checksum: "module-a"}
+    )
+
+    context = project_ctx.new_child(project_ctx.path / "test_a.py")
+    status = deduplicate(context, connection, lambda: Insertion.INSERTED)
+    assert status is Insertion.SKIPPED
+    assert not connection.queries
+    assert not project_ctx.db_cache.has_file("project/test_a.py")
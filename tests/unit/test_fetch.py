@@ -0,0 +1,80 @@
+from types import SimpleNamespace
+
+import pytest
+
+from reiz import fetch
+from reiz.fetch import compile_query, construct_query
+from reiz.ir import IR
+
+
+@pytest.mark.parametrize(
+    "limit, offset, expected",
+    [
+        (None, 0, {}),
+        (0, 0, {"limit": 0}),
+        (10, 0, {"limit": 10}),
+        (10, 20, {"limit": 10, "offset": 20}),
+    ],
+)
+def test_construct_query_pagination(limit, offset, expected):
+    query, arguments = construct_query('Name("a")', limit, offset)
+    assert ("LIMIT <int64>$limit" in query) is ("limit" in expected)
+    assert ("OFFSET <int64>$offset" in query) is ("offset" in expected)
+    for name, value in expected.items():
+        assert arguments[name] == value
+
+
+def test_construct_query_deterministic():
+    # Sequence items are bound to aliases, which are named in the
+    # order they are created instead of randomly.
+    first, first_arguments = construct_query(
+        'Call(args=[Name("a"), *..., Name("b")])', None, 0
+    )
+    second, second_arguments = construct_query(
+        'Call(args=[Name("c"), *..., Name("d")])', None, 0
+    )
+    assert first == second
+    assert first_arguments != second_arguments
+
+
+def test_compile_query_deterministic():
+    source = "Call(func=~f, args=[*..., ~f])"
+    first, second = (
+        IR.construct(compile_query(source, limit=None, offset=0))
+        for _ in range(2)
+    )
+    assert first == second
+
+
+def make_module(filename, aliases=()):
+    project = SimpleNamespace(
+        git_source="https://github.com/user/project", git_revision="master"
+    )
+    return SimpleNamespace(
+        filename=filename, project=project, aliases=list(aliases)
+    )
+
+
+def test_process_queryset_aliases(monkeypatch):
+    fetched = []
+    monkeypatch.setattr(
+        fetch, "fetch", lambda filename, **_: fetched.append(filename)
+    )
+
+    module = make_module(
+        "project/a.py",
+        aliases=[make_module("project/b.py"), make_module("project/c.py")],
+    )
+    result = SimpleNamespace(
+        lineno=1, col_offset=0, end_lineno=2, end_col_offset=4, _module=module
+    )
+
+    # Each match is a single result, and only its own source is read
+    (location,) = fetch.process_queryset([result])
+    assert fetched == ["project/a.py"]
+    assert location["filename"] == "project/a.py"
+    assert [alias["filename"] for alias in location["aliases"]] == [
+        "project/b.py",
+        "project/c.py",
+    ]
+    assert location["aliases"][0]["github_link"].endswith("/b.py#L1-L2")
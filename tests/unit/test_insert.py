@@ -0,0 +1,106 @@
+import asyncio
+import threading
+import uuid
+from contextlib import nullcontext
+from types import SimpleNamespace
+
+from reiz.serialization import insert
+from reiz.serialization.context import FileContext, GlobalContext
+from reiz.serialization.insert import write_chunked
+from reiz.serialization.insert_async import iter_uncached_files
+from reiz.serialization.statistics import Insertion, Statistics
+
+
+class FakeConnection:
+    def __init__(self):
+        self.queries = []
+
+    def query(self, source, **arguments):
+        result = [
+            SimpleNamespace(row=row, id=uuid.uuid4())
+            for row in arguments.get("rows", ())
+        ]
+        self.queries.append((source, arguments, result))
+        return result
+
+    def query_one(self, source, **arguments):
+        result = SimpleNamespace(id=uuid.uuid4())
+        self.queries.append((source, arguments, result))
+        return result
+
+    def transaction(self):
+        return nullcontext()
+
+
+def test_write_chunked(make_project, monkeypatch):
+    connection = FakeConnection()
+    source = "\n".join(f"a{index} = [b, c, d]" for index in range(100))
+    project_ctx = make_project({"large.py": source}, connection=connection)
+    context = project_ctx.new_child(project_ctx.path / "large.py")
+
+    planned = []
+    flush_plan = context.flush_plan
+
+    def record_flush():
+        planned.append(len(context.plan))
+        return flush_plan()
+
+    monkeypatch.setattr(insert, "CHUNK_NODE_LIMIT", 50)
+    monkeypatch.setattr(context, "flush_plan", record_flush)
+    write_chunked(context.as_ast(), context)
+
+    # Each statement has 6 nodes, so they are planned in groups of 9
+    # (54 nodes), and only a single group is planned at a time.
+    assert planned == [54] * 11 + [6]
+
+    *inserts, (update, arguments, _) = connection.queries[1:]
+    assert "UPDATE" in update
+
+    # The body is linked to all the top-level statements, in order
+    statements = [
+        row.id
+        for source, _, result in inserts
+        if "INSERT ast::Assign" in source
+        for row in result
+    ]
+    assert arguments["body"] == statements
+    assert len(set(statements)) == 100
+
+
+def test_iter_uncached_files(make_project, monkeypatch):
+    global_ctx = GlobalContext()
+    project_ctx = make_project(
+        {name: "x = 1" for name in ["a.py", "b.py", "c.py", "d.py"]},
+        global_ctx=global_ctx,
+    )
+    global_ctx.db_cache.add_file("project/b.py")
+
+    threads = []
+    is_cached = FileContext.is_cached
+
+    def record_thread(context):
+        threads.append(threading.get_ident())
+        return is_cached(context)
+
+    monkeypatch.setattr(FileContext, "is_cached", record_thread)
+
+    async def collect(stats):
+        return [
+            file_ctx.filename
+            async for file_ctx in iter_uncached_files(
+                [project_ctx.project], global_ctx, stats, 2
+            )
+        ]
+
+    stats = Statistics()
+    filenames = asyncio.run(collect(stats))
+    assert sorted(filenames) == [
+        "project/a.py",
+        "project/c.py",
+        "project/d.py",
+    ]
+    assert stats[Insertion.CACHED] == 1
+
+    # The cache is never checked on the event loop's thread
+    assert len(threads) == 4
+    assert threading.get_ident() not in threads
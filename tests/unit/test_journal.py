@@ -0,0 +1,65 @@
+import pytest
+
+from reiz.serialization.cache import Cache
+from reiz.serialization.journal import DEAD_LETTERS_FILE, Journal
+from reiz.serialization.statistics import Insertion
+
+
+def write_journal(path):
+    journal = Journal(path)
+    journal.start()
+    journal.record_project("project")
+    journal.record_file("project/a.py", Insertion.INSERTED)
+    journal.record_file("project/b.py", Insertion.FAILED)
+    journal.record_file("project/c.py", Insertion.FAILED)
+    journal.record_file("project/c.py", Insertion.INSERTED)
+    journal.finish_project("project")
+    journal.close()
+    return journal
+
+
+def test_journal_dead_letters(tmp_path):
+    write_journal(tmp_path / "journal.jsonl")
+    dead_letters = tmp_path / DEAD_LETTERS_FILE
+    assert dead_letters.read_text().splitlines() == ["project/b.py"]
+
+
+def test_journal_never_truncates(tmp_path):
+    path = tmp_path / "journal.jsonl"
+    write_journal(path)
+    contents = path.read_text()
+
+    with pytest.raises(FileExistsError):
+        Journal(path).start()
+    assert path.read_text() == contents
+
+
+def test_journal_resume(tmp_path):
+    path = tmp_path / "journal.jsonl"
+    write_journal(path)
+
+    cache = Cache()
+    journal = Journal(path)
+    assert journal.resume(cache)
+    journal.close()
+
+    assert journal.finished_projects == {"project"}
+    assert journal.dead_letters == {"project/b.py"}
+    assert cache.has_file("project/a.py")
+    assert cache.has_file("project/b.py")
+
+
+def test_journal_retry_dead_letters(tmp_path):
+    path = tmp_path / "journal.jsonl"
+    write_journal(path)
+
+    cache = Cache()
+    journal = Journal(path)
+    assert journal.resume(cache, retry_dead_letters=True)
+    assert not journal.dead_letters
+    assert cache.has_file("project/a.py")
+    assert not cache.has_file("project/b.py")
+
+    journal.record_file("project/b.py", Insertion.INSERTED)
+    journal.close()
+    assert (tmp_path / DEAD_LETTERS_FILE).read_text() == ""
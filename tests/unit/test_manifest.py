@@ -0,0 +1,78 @@
+import os
+
+from reiz.serialization.manifest import Manifest
+
+
+def touch(file, offset):
+    stat = file.stat()
+    os.utime(file, ns=(stat.st_atime_ns, stat.st_mtime_ns + offset))
+
+
+def loaded_manifest(path):
+    manifest = Manifest(path)
+    manifest.load()
+    return manifest
+
+
+def test_manifest_changes(tmp_path):
+    file = tmp_path / "a.py"
+    file.write_text("a = 1")
+
+    manifest = loaded_manifest(tmp_path / "manifest.jsonl")
+    manifest.record("a.py", file)
+    assert not manifest.is_changed("a.py", file)
+
+    # Touched, but the content is the same
+    touch(file, 10**9)
+    assert not manifest.is_changed("a.py", file)
+    assert manifest.entries["a.py"][1] == file.stat().st_mtime_ns
+
+    # Same size, different content
+    file.write_text("a = 2")
+    touch(file, 2 * 10**9)
+    assert manifest.is_changed("a.py", file)
+
+    file.write_text("a = 12")
+    assert manifest.is_changed("a.py", file)
+
+
+def test_manifest_unknown_files(tmp_path):
+    file = tmp_path / "a.py"
+    file.write_text("a = 1")
+
+    manifest = loaded_manifest(tmp_path / "manifest.jsonl")
+    assert not manifest.is_changed("a.py", file)
+    assert "a.py" in manifest.entries
+
+
+def test_manifest_persists_every_change(tmp_path):
+    path = tmp_path / "manifest.jsonl"
+    for name in "abc":
+        (tmp_path / f"{name}.py").write_text(name)
+
+    manifest = loaded_manifest(path)
+    for name in "abc":
+        manifest.record(f"{name}.py", tmp_path / f"{name}.py")
+    manifest.discard("b.py")
+
+    # Not saved yet, as if the insertion was interrupted
+    with open(path, "a") as stream:
+        stream.write('{"name": "d.py", "ent')
+
+    recovered = loaded_manifest(path)
+    assert recovered.entries == manifest.entries
+    assert set(recovered.entries) == {"a.py", "c.py"}
+
+
+def test_manifest_compaction(tmp_path):
+    path = tmp_path / "manifest.jsonl"
+    file = tmp_path / "a.py"
+    file.write_text("a")
+
+    manifest = loaded_manifest(path)
+    for _ in range(3):
+        manifest.record("a.py", file)
+    manifest.save()
+
+    assert len(path.read_text().splitlines()) == 1
+    assert loaded_manifest(path).entries == manifest.entries
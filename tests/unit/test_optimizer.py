@@ -0,0 +1,167 @@
+import re
+from concurrent import futures
+from copy import deepcopy
+
+import pytest
+
+from reiz.ir import IR
+from reiz.reizql import compile_to_ir, parse_query
+
+
+def construct(node):
+    return " ".join(IR.construct(node, optimize=False).split())
+
+
+def optimize(source):
+    node = compile_to_ir(parse_query(source))
+    before = construct(deepcopy(node))
+    optimizer = IR.optimizer()
+    after = construct(optimizer.optimize(node))
+    return before, after, optimizer.hits
+
+
+@pytest.mark.parametrize(
+    "rule, source, before, after",
+    [
+        (
+            "optimize_negative_operators",
+            'Constant(not "x")',
+            "SELECT ast::Constant FILTER NOT .value = \"'x'\"",
+            "SELECT ast::Constant FILTER .value != \"'x'\"",
+        ),
+        (
+            "optimize_double_negatives",
+            "arg(annotation=not None)",
+            "SELECT ast::arg FILTER NOT NOT EXISTS .annotation",
+            "SELECT ast::arg FILTER EXISTS .annotation",
+        ),
+        (
+            "optimize_type_or",
+            "Return(Name() | Tuple())",
+            "SELECT ast::Return"
+            " FILTER (.value IS ast::Name OR .value IS ast::Tuple)",
+            "SELECT ast::Return FILTER .value IS ast::Name | ast::Tuple",
+        ),
+        (
+            "flatten_logical_chains",
+            "Call(Name() & Name())",
+            "SELECT ast::Call"
+            " FILTER .func IS ast::Name AND .func IS ast::Name",
+            "SELECT ast::Call FILTER .func IS ast::Name",
+        ),
+        (
+            "fold_tautologies",
+            "FunctionDef(body=[*...], decorator_list=[])",
+            "SELECT ast::FunctionDef"
+            " FILTER count(.body) >= 0 AND count(.decorator_list) = 0",
+            "SELECT ast::FunctionDef FILTER count(.decorator_list) = 0",
+        ),
+        (
+            "drop_redundant_type_checks",
+            'Call(Name() & Name("a"))',
+            "SELECT ast::Call FILTER .func IS ast::Name"
+            " AND .func[IS ast::Name].py_id = 'a'",
+            "SELECT ast::Call FILTER .func[IS ast::Name].py_id = 'a'",
+        ),
+        (
+            "optimize_equality_chains",
+            'Name("a" | "b" | "c")',
+            "SELECT ast::Name FILTER"
+            " ( .py_id = 'a' OR .py_id = 'b' OR .py_id = 'c' )",
+            "SELECT ast::Name FILTER .py_id IN { 'a', 'b', 'c' }",
+        ),
+        (
+            "optimize_enum_or",
+            "BinOp(op=Add() | Sub())",
+            "SELECT ast::BinOp FILTER (.op = <ast::operator>'Add'"
+            " OR .op = <ast::operator>'Sub')",
+            "SELECT ast::BinOp FILTER .op IN"
+            " { <ast::operator>'Add', <ast::operator>'Sub' }",
+        ),
+        (
+            "fold_tautological_filters",
+            "FunctionDef(body=[*...])",
+            "SELECT ast::FunctionDef FILTER count(.body) >= 0",
+            "SELECT ast::FunctionDef",
+        ),
+    ],
+)
+def test_optimizer_rules(rule, source, before, after):
+    unoptimized, optimized, hits = optimize(source)
+    assert unoptimized == before
+    assert optimized == after
+    assert hits == {rule: 1}
+
+
+def test_optimizer_fixed_point():
+    # The type checks are dropped only after the chain is flattened
+    _, optimized, hits = optimize('Call(Name() & (Name() & Name("a")))')
+    assert optimized == (
+        "SELECT ast::Call FILTER .func[IS ast::Name].py_id = 'a'"
+    )
+    assert hits["flatten_logical_chains"] >= 1
+    assert hits["drop_redundant_type_checks"] == 1
+
+
+def test_optimizer_total_hits():
+    before = IR.optimizer.get_total_hits()
+    with futures.ThreadPoolExecutor(max_workers=8) as executor:
+        for hits in executor.map(
+            lambda _: optimize('Name("a" | "b")')[2], range(64)
+        ):
+            assert hits == {"optimize_equality_chains": 1}
+
+    after = IR.optimizer.get_total_hits()
+    after.subtract(before)
+    assert +after == {"optimize_equality_chains": 64}
+
+
+def test_hoist_common_paths():
+    _, optimized, hits = optimize('Call(Attribute(Name("a"), "b"))')
+    assert optimized == (
+        "SELECT ast::Call FILTER ( WITH path_0 := .func[IS ast::Attribute]"
+        " SELECT path_0.value[IS ast::Name].py_id = 'a'"
+        " AND path_0.attr = 'b' )"
+    )
+    assert hits == {"hoist_common_paths": 1}
+
+
+def test_hoist_common_paths_existing_namespace():
+    _, optimized, hits = optimize(
+        'FunctionDef(body=[Return(Call(Attribute(Name("a"), "b")))])'
+    )
+    assert hits["hoist_common_paths"] == 1
+    # The alias is added to the namespace of the sequence items
+    assert optimized.count("WITH") == 1
+    assert re.search(
+        r"path_0 := item_\w+\[IS ast::Return\]\.value\[IS ast::Call\]"
+        r"\.func\[IS ast::Attribute\] SELECT",
+        optimized,
+    )
+
+
+@pytest.mark.parametrize(
+    "source",
+    [
+        # Paths in the different branches of an OR
+        'Call(Attribute(Name("a"), "b") | Attribute(Name("c"), "d"))',
+        # Paths in the body of all()
+        'Call(args=ALL(Attribute(Name("a"), "b")))',
+    ],
+)
+def test_hoist_common_paths_scopes(source):
+    unoptimized, optimized, hits = optimize(source)
+    assert "hoist_common_paths" not in hits
+    assert unoptimized == optimized
+
+
+def test_hoist_common_paths_conjuncts_only():
+    _, optimized, hits = optimize(
+        'Call(func=Attribute(Name("a"), "b"),'
+        ' args=ALL(Attribute(Name("a"), "b")))'
+    )
+    assert hits == {"hoist_common_paths": 1}
+    assert (
+        "AND all(.args[IS ast::Attribute].value[IS ast::Name].py_id = 'a'"
+        " AND .args[IS ast::Attribute].attr = 'b')" in optimized
+    )
@@ -0,0 +1,33 @@
+import pytest
+
+from reiz.serialization.insert import make_parser, parse_options
+
+
+def test_threaded_options():
+    options = parse_options(
+        make_parser(), ["data.json", "--group-size", "8", "--chunked"]
+    )
+    assert options.group_size == 8
+    assert options.chunked
+
+
+@pytest.mark.parametrize(
+    "flags",
+    [
+        ["--group-size", "8"],
+        ["--target-latency", "50"],
+        ["--chunked"],
+        ["--trace-memory", "100"],
+    ],
+)
+def test_pipelined_options(flags, capsys):
+    with pytest.raises(SystemExit):
+        parse_options(make_parser(), ["data.json", "-p", "4", *flags])
+    assert "not supported by the pipelined engine" in capsys.readouterr().err
+
+
+def test_pipelined_deduplication():
+    options = parse_options(
+        make_parser(), ["data.json", "-p", "4", "--deduplicate"]
+    )
+    assert options.deduplicate
@@ -0,0 +1,21 @@
+import pytest
+
+from reiz.schema.profile import IndexingProfile
+
+
+@pytest.mark.parametrize(
+    "dropped_field",
+    ["_tag", "expr._tag", "_parent_types", "Name._parent_types", "lineno"],
+)
+def test_protected_fields(dropped_field):
+    with pytest.raises(ValueError):
+        IndexingProfile("slim", dropped_fields=frozenset([dropped_field]))
+
+
+def test_dropped_fields():
+    profile = IndexingProfile(
+        "slim", dropped_fields=frozenset(["type_comment", "expr.ctx"])
+    )
+    assert profile.drops("type_comment", "FunctionDef", "stmt")
+    assert profile.drops("ctx", "Name", "expr")
+    assert not profile.drops("ctx", "arg", "AST")
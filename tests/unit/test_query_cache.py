@@ -0,0 +1,88 @@
+import pytest
+
+from reiz.reizql import CompiledQueryCache, canonicalize, parse_query
+
+
+def key(source):
+    return canonicalize(parse_query(source))
+
+
+@pytest.mark.parametrize(
+    "first, second",
+    [
+        ('Name("a")', 'Name(\n    "a"\n)'),
+        ('Name("a")', 'Name(id="a")'),
+        (
+            'Call(func=Name("a"), args=[...])',
+            'Call(args=[...], func=Name("a"))',
+        ),
+        (
+            'Attribute(Name("a"), "b")',
+            'Attribute(attr="b", value=Name("a"))',
+        ),
+    ],
+)
+def test_canonicalize_same(first, second):
+    assert key(first) == key(second)
+
+
+@pytest.mark.parametrize(
+    "first, second",
+    [
+        ('Name("a")', 'Name("b")'),
+        ("Constant(1)", "Constant(True)"),
+        ("Constant(1)", 'Constant("1")'),
+        ('Call(Name("a") | Name("b"))', 'Call(Name("a") & Name("b"))'),
+        ("Call(args=[Name()])", "Call(args=[Name(), ...])"),
+        # References are bound by their first occurrence
+        (
+            "Attribute(value=~a, attr=~b)",
+            "Attribute(attr=~b, value=~a)",
+        ),
+    ],
+)
+def test_canonicalize_different(first, second):
+    assert key(first) != key(second)
+
+
+def make_cache(max_size):
+    compiled = []
+
+    def compiler(tree):
+        compiled.append(tree)
+        return len(compiled)
+
+    return CompiledQueryCache(max_size), compiled, compiler
+
+
+def test_query_cache_hits():
+    cache, compiled, compiler = make_cache(8)
+    assert cache.get('Name("a")', compiler) == 1
+    assert cache.get('Name(id="a")', compiler) == 1
+    assert cache.get(' Name("a") ', compiler) == 1
+    assert cache.get('Name("b")', compiler) == 2
+    assert len(compiled) == 2
+    assert cache.info() == {"hits": 2, "misses": 2, "size": 2, "max_size": 8}
+
+
+def test_query_cache_eviction():
+    cache, compiled, compiler = make_cache(2)
+    cache.get('Name("a")', compiler)
+    cache.get('Name("b")', compiler)
+
+    # Recently used, so "b" is evicted instead of it
+    cache.get('Name("a")', compiler)
+    cache.get('Name("c")', compiler)
+    assert len(compiled) == 3
+
+    assert cache.get('Name("a")', compiler) == 1
+    assert cache.get('Name("b")', compiler) == 4
+    assert cache.info()["size"] == 2
+
+
+def test_query_cache_clear():
+    cache, compiled, compiler = make_cache(2)
+    cache.get('Name("a")', compiler)
+    cache.clear()
+    assert cache.info() == {"hits": 0, "misses": 0, "size": 0, "max_size": 2}
+    assert cache.get('Name("a")', compiler) == 2
@@ -0,0 +1,104 @@
+import pytest
+
+from reiz.serialization import scheduler
+from reiz.serialization.context import GlobalContext
+from reiz.serialization.scheduler import WorkQueue
+from reiz.serialization.statistics import Insertion, Statistics
+
+PROJECTS = {
+    "first": {"a.py": 10, "b.py": 30, "c.py": 20},
+    "second": {"d.py": 50, "e.py": 5},
+}
+
+
+@pytest.fixture
+def make_queue(make_project, monkeypatch):
+    def make_queue(**properties):
+        global_ctx = GlobalContext(properties)
+        finished = []
+        monkeypatch.setattr(
+            global_ctx.journal, "finish_project", finished.append
+        )
+
+        queue = WorkQueue(global_ctx)
+        for project, files in PROJECTS.items():
+            queue.add_project(
+                make_project(
+                    {name: "x" * size for name, size in files.items()},
+                    name=project,
+                    global_ctx=global_ctx,
+                )
+            )
+        return queue, finished
+
+    return make_queue
+
+
+def take(queue, worker=0):
+    project_ctx, files = queue.take(worker)
+    queue.done(project_ctx, files, Statistics({Insertion.INSERTED: 1}))
+    return project_ctx.project.name, [file.name for file in files]
+
+
+def test_work_queue_order(make_queue):
+    queue, finished = make_queue()
+    assert [take(queue) for _ in range(3)] == [
+        ("first", ["b.py"]),
+        ("first", ["c.py"]),
+        ("first", ["a.py"]),
+    ]
+
+    # The home project is drained, so the rest are stolen
+    assert take(queue) == ("second", ["d.py"])
+    assert take(queue) == ("second", ["e.py"])
+    assert queue.take(0) is None
+    assert finished == ["first", "second"]
+
+
+def test_work_queue_home_projects(make_queue):
+    queue, _ = make_queue()
+    assert take(queue, worker=1) == ("second", ["d.py"])
+    assert take(queue, worker=2) == ("first", ["b.py"])
+
+
+def test_work_queue_project_limit(make_queue):
+    queue, _ = make_queue(max_files=1)
+    first_ctx, first_files = queue.take(0)
+    # The home project is at its limit, so the largest file of the
+    # other projects is taken instead.
+    second_ctx, second_files = queue.take(0)
+    assert [file.name for file in first_files] == ["b.py"]
+    assert [file.name for file in second_files] == ["d.py"]
+
+    queue.done(first_ctx, first_files, Statistics())
+    assert take(queue) == ("first", ["c.py"])
+
+
+def test_work_queue_group_size(make_queue):
+    queue, _ = make_queue(group_size=2, max_files=3)
+    assert take(queue) == ("first", ["b.py", "c.py"])
+    assert take(queue) == ("first", ["a.py"])
+
+
+def test_work_queue_hard_limit(make_queue):
+    queue, _ = make_queue(hard_limit=2)
+    assert take(queue) == ("first", ["b.py"])
+    assert take(queue) == ("first", ["c.py"])
+    assert queue.take(0) is None
+
+
+def test_work_queue_windows(make_queue, monkeypatch):
+    monkeypatch.setattr(scheduler, "WINDOW_SIZE", 1)
+    queue, _ = make_queue()
+    names = {take(queue)[1][0] for _ in range(3)}
+    assert names == set(PROJECTS["first"])
+    assert len(queue._queues) == 2
+    take(queue)
+    assert list(queue._queues) == ["second"]
+
+
+def test_work_queue_cached_files(make_queue):
+    queue, _ = make_queue()
+    queue.global_ctx.db_cache.add_file("first/b.py")
+    assert take(queue) == ("first", ["c.py"])
+    assert queue.stats[Insertion.CACHED] == 1
@@ -0,0 +1,152 @@
+import uuid
+from types import SimpleNamespace
+
+from reiz.serialization import templates
+from reiz.serialization.serializer import prepare_module
+from reiz.serialization.templates import InsertionPlan, Slot, get_template
+
+
+def prepare_file(file_context, name):
+    context = file_context(name)
+    return prepare_module(context.as_ast(), context)
+
+
+def fake_runner(executed):
+    def runner(source, **arguments):
+        executed.append((source, arguments))
+        return [
+            SimpleNamespace(row=row, id=uuid.uuid4())
+            for row in arguments["rows"]
+        ]
+
+    return runner
+
+
+def test_prepare_module_uses_templates(file_context):
+    payload = prepare_file(file_context, "simple/call.py")
+    for source in {batch.source for batch in payload.batches}:
+        assert "FOR row IN {array_unpack(<array<int64>>$rows)}" in source
+        assert "$a0" in source
+
+    # All the nodes are inserted exactly once
+    nodes = [node for batch in payload.batches for node in batch.nodes]
+    assert sorted(nodes) == list(range(payload.total_nodes))
+
+
+def test_prepare_module_shares_query_texts(file_context):
+    first = prepare_file(file_context, "simple/call.py")
+    second = prepare_file(file_context, "complex/complex_lists.py")
+
+    sources = [batch.source for batch in first.batches + second.batches]
+    assert len(set(sources)) < len(sources)
+    for batch in first.batches + second.batches:
+        assert "'" not in batch.source
+
+
+def test_prepare_module_orders_children_first(file_context):
+    payload = prepare_file(file_context, "complex/complex_lists.py")
+
+    inserted = set()
+    for batch in payload.batches:
+        for name in batch.references:
+            assert set(batch.arguments[name]) <= inserted
+        inserted.update(batch.nodes)
+
+    for name in payload.update.references:
+        assert set(payload.update.arguments[name]) <= inserted
+
+
+def test_prepare_module_execution(file_context):
+    payload = prepare_file(file_context, "simple/call.py")
+
+    ids, executed = {}, []
+    runner = fake_runner(executed)
+    for batch in payload.batches:
+        batch.execute(runner, ids, parent_module=None)
+        for name in batch.references:
+            assert all(
+                isinstance(value, uuid.UUID) for value in executed[-1][1][name]
+            )
+        batch.release(ids)
+
+    body = payload.update.resolve(ids, {})["body"]
+    assert len(body) == len(payload.update.arguments["body"])
+    assert all(isinstance(value, uuid.UUID) for value in body)
+
+
+def test_template_prepare():
+    template = get_template(
+        "Name",
+        (
+            ("id", Slot.STR, None),
+            ("lineno", Slot.INT, None),
+            ("_parent_types", Slot.PAIRS, None),
+        ),
+    )
+    query = template.prepare(
+        [4, 7], [["a", 1, [[1, "body"]]], ["b", 2, [[59, "value"], [1, "x"]]]]
+    )
+    assert query.nodes == [4, 7]
+    assert query.references == []
+    assert query.arguments == {
+        "rows": [0, 1],
+        "a0": ["a", "b"],
+        "a1": [1, 2],
+        "a2": [1, 59, 1],
+        "a2_names": ["body", "value", "x"],
+        "a2_offsets": [0, 1, 3],
+    }
+
+
+def test_insertion_plan_heights():
+    plan = InsertionPlan()
+    leaf_1 = plan.add("leaf", [], [])
+    leaf_2 = plan.add("leaf", [], [])
+    middle = plan.add("middle", [], [leaf_1])
+    top = plan.add("top", [], [middle, leaf_2])
+
+    assert plan.heights == [0, 0, 1, 2]
+    assert top == len(plan) - 1
+
+
+def test_insertion_plan_row_limit(monkeypatch):
+    monkeypatch.setattr(templates, "ROW_LIMIT", 3)
+    template = get_template("Pass", (("lineno", Slot.INT, None),))
+
+    plan = InsertionPlan()
+    for lineno in range(7):
+        plan.add(template, [lineno], [])
+
+    queries = list(plan.iter_queries())
+    assert [query.nodes for query in queries] == [[0, 1, 2], [3, 4, 5], [6]]
+    assert {query.source for query in queries} == {template.source}
+
+
+def test_insertion_plan_element_limit(monkeypatch):
+    monkeypatch.setattr(templates, "ELEMENT_LIMIT", 10)
+    template = get_template("Global", (("names", Slot.STRS, None),))
+
+    plan = InsertionPlan()
+    plan.add(template, [["a"] * 4], [])
+    plan.add(template, [["b"] * 4], [])
+    plan.add(template, [["c"] * 4], [])
+    plan.add(template, [["d"] * 12], [])
+
+    queries = list(plan.iter_queries())
+    # A single node that is above the limit still gets its own query
+    assert [query.nodes for query in queries] == [[0, 1], [2], [3]]
+
+
+def test_large_statement_is_split(file_context, tmp_path, monkeypatch):
+    context = file_context("simple/call.py")
+    # Keep the original filename, but read the source from elsewhere
+    assert context.filename
+    source = "items = [" + ", ".join(map(str, range(2500))) + "]"
+    monkeypatch.setattr(context, "file", tmp_path / "large.py")
+    context.file.write_text(source)
+
+    payload = prepare_module(context.as_ast(), context)
+    assert len(payload.batches) > 3
+    for batch in payload.batches:
+        assert len(batch.nodes) <= templates.ROW_LIMIT
+    assert len(payload.update.arguments["body"]) == 1